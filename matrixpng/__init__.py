@@ -7,8 +7,23 @@ See pypng documentation for acceptable modes and bit depths"""
 import png
 import numpy as np
 import io
-from ._colormaps import ColorMaps
+import copy
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from ._colormaps import ColorMaps, color_tables, inverse_lookup, pack_colors, palette, COLORMAPS
 from ._pngTextChunks import ChunkITXT
+from ._pngWriter import ChunkWriter
+from ._pngEncoder import write_header, write_idat, write_chunk, sample_bytes, COLOR_TYPES, FILTERS
+from ._parallel import write_idat_parallel
+from ._pngMetadata import read_metadata, read_chunks, find_chunk, pack_metadata, MatrixMetadata, _read_metadata
+from ._pngDecoder import bytes_to_samples, read_image
+from ._bandIndex import write_idat_indexed, read_rows, update_rows, parse_index, INDEX_TAG
+from ._profiles import PROFILES, trial_encode, pick_filter
+from ._matrixBlocks import open_matrix, value_range, chunk_length, take
+from ._pyramid import export_pyramid
+from ._exactValues import ExactWriter, read_exact, EXACT_TAG
+from ._stageStats import StageStats, stage
 
 __author__ = "Finite Mobius, LLC"
 __credits__ = ["Jason R. Miller"]
@@ -20,17 +35,23 @@ __status__ = "Development"
 
 
 class MatrixPNG:
-    """The matrix-PNG transformation class"""
+    """The matrix-PNG transformation class
 
-    def __init__(self, mode="RGB", bitdepth=8,
+    An instance keeps what each call sets (the z range matrix2png computes, the scale png2matrix reads),
+    so it should not be shared between threads; encode() and decode() can be.
+    """
+
+    def __init__(self, mode="RGB", bitdepth=8, colormap="ebb",
                  z_min=None, z_max=None, z_units=None,
                  x_min=None, x_max=None, x_units=None,
                  y_min=None, y_max=None, y_units=None,
-                 y_ascend_up=True):
+                 y_ascend_up=True, engine="numpy", profile="balanced", filter=None, workers=1,
+                 index_rows=None, exact=None):
         """Initialize the matrix-PNG transformer
 
-        :param mode: PNG mode (default = 'RGB')
+        :param mode: PNG mode: 'L', 'LA', 'RGB', 'RGBA', or 'P' for a palette of the color map (default = 'RGB')
         :param bitdepth: bit depth (8 or 16, default = 8)
+        :param colormap: color map for RGB modes: 'ebb', 'viridis', or 'coolwarm' (default = 'ebb')
         :param z_min: minimum z value (default = minimum element value)
         :param z_max: maximum z value (default = maximum element value)
         :param z_units: z units (default = None)
@@ -41,19 +62,51 @@ class MatrixPNG:
         :param y_max: maximum y value (default = len(matrix[0]))
         :param y_units: y units (default = None)
         :param y_ascend_up: if y should increase upward (default=True)
+        :param engine: PNG encoder and decoder, 'numpy' or 'pypng' (default = 'numpy')
+        :param profile: Compression profile, 'fast', 'balanced', or 'archive' (default = 'balanced')
+        :param filter: PNG row filter for the numpy engine: 'none', 'sub', 'up', 'average', 'paeth',
+                       'adaptive' to pick the best one for each row,
+                       or 'trial' to try each one on a sample of the image (default = the profile's filter)
+        :param workers: Number of threads used to encode one image (default = 1)
+        :param index_rows: Write a band index with an entry every this many rows,
+                           so read_region() can decode part of the image (numpy engine only; default = no index)
+        :param exact: Also store the exact values, for png2matrix(exact=True): 'residual' (the difference from
+                      the quantized values) or 'raw' (the values themselves) (numpy engine only; default = None)
         """
         # Settings for the PNG output
         self._png = {
             "mode": None,
             "bitdepth": None,
-            "colormap": []
+            "colormap": [],
+            "engine": None,
+            "profile": None,
+            "level": -1,
+            "strategy": zlib.Z_DEFAULT_STRATEGY,
+            "filter": None,
+            "workers": 1,
+            "index_rows": None,
+            "exact": None
         }
+        # See colormap.setter
+        self._colormap = None
+        self.colormap = colormap
         # See mode.setter
         self.mode = mode
         # See bitdepth.setter
         self.bitdepth = bitdepth
-        # Initialize the internal matrix for building the PNG
-        self._matrix = np.empty([0, 0, 0])
+        # See engine.setter
+        self.engine = engine
+        # See profile.setter
+        self.profile = profile
+        # See filter.setter
+        if filter is not None:
+            self.filter = filter
+        # See workers.setter
+        self.workers = workers
+        # See index_rows.setter
+        self.index_rows = index_rows
+        # See exact.setter
+        self.exact = exact
         # Data/scale information
         # Values outside z_min and z_max will be clipped
         self._scale = {
@@ -69,10 +122,6 @@ class MatrixPNG:
         }
         # Whether the y axis should be inverted (y ascends upward)
         self._y_invert = y_ascend_up
-        # For now, the only non-grayscale color map is extended black body
-        self._colormap = "ebb"
-        # Set up the color map
-        self._setup_colors()
 
     @property
     def mode(self):
@@ -80,8 +129,11 @@ class MatrixPNG:
 
     @mode.setter
     def mode(self, m):
-        if m not in ['L', 'LA', 'RGB', 'RGBA']:
+        # 'P' writes palette indices (PLTE) instead of colors; it is 8-bit only
+        if m not in ['L', 'LA', 'RGB', 'RGBA', 'P']:
             raise ValueError('Mode ' + str(m) + ' is unknown.')
+        elif m == 'P' and self.bitdepth not in [None, 8]:
+            raise ValueError('Mode P needs a bit depth of 8.')
         else:
             self._png["mode"] = m
             self._setup_colors()
@@ -96,8 +148,166 @@ class MatrixPNG:
         # only 8 or 16 are really useful in our case
         if bd not in [8, 16]:
             raise ValueError('Bit depth ' + str(bd) + ' is unsupported.')
+        elif self.mode == 'P' and bd != 8:
+            raise ValueError('Mode P needs a bit depth of 8.')
         else:
             self._png["bitdepth"] = bd
+            self._setup_colors()
+
+    @property
+    def colormap(self):
+        return self._colormap
+
+    @colormap.setter
+    def colormap(self, c):
+        # Grayscale modes ignore this
+        if c not in COLORMAPS:
+            raise ValueError('Colormap ' + str(c) + ' is unknown.')
+        else:
+            self._colormap = c
+            self._setup_colors()
+
+    @property
+    def engine(self):
+        return self._png["engine"]
+
+    @engine.setter
+    def engine(self, e):
+        # 'numpy' packs scanlines with numpy and compresses them with zlib (and reverses that when reading)
+        # 'pypng' hands the rows to pypng (slower, but the reference implementation)
+        if e not in ['numpy', 'pypng']:
+            raise ValueError('Engine ' + str(e) + ' is unknown.')
+        else:
+            self._png["engine"] = e
+
+    @property
+    def profile(self):
+        return self._png["profile"]
+
+    @profile.setter
+    def profile(self, p):
+        # A profile sets the zlib level and strategy and the row filter together
+        if p not in PROFILES.keys():
+            raise ValueError('Profile ' + str(p) + ' is unknown.')
+        else:
+            self._png["profile"] = p
+            self._png["level"] = PROFILES[p]["level"]
+            self._png["strategy"] = PROFILES[p]["strategy"]
+            self._png["filter"] = PROFILES[p]["filter"]
+
+    def autotune(self, matrix, x_axis_first=True, min_throughput=None, max_ratio=None, sample_bands=4, band_rows=64):
+        """Pick the compression profile that best fits a target, by trial-encoding a sample of the matrix
+
+        With min_throughput, the smallest output that is fast enough wins.
+        With max_ratio, the fastest profile that compresses well enough wins.
+        With neither, the smallest output wins.
+        If no profile meets the target, the closest one is used.
+        The chosen profile is set on this object.
+        :param matrix: 2-D numpy.ndarray
+        :param x_axis_first: Whether the x axis is the first axis in the 2-D array
+        :param min_throughput: Minimum encode speed, in raw (uncompressed) bytes per second
+        :param max_ratio: Maximum compressed size as a fraction of the raw size
+        :param sample_bands: Number of bands to sample, spread evenly through the matrix
+        :param band_rows: Rows per sampled band
+        :return: The chosen profile name (string)
+        """
+        matrix = open_matrix(matrix)
+        self._setminmax(matrix)
+        _bands = self._sample_bands(matrix, x_axis_first, sample_bands, band_rows)
+        _bpp = len(self.mode) * self.bitdepth // 8
+        _results = {}
+        for p in PROFILES.keys():
+            _t = trial_encode(_bands, _bpp, p)
+            _results[p] = {
+                "throughput": _t["bytes_in"] / max(_t["seconds"], 1e-9),
+                "ratio": _t["bytes_out"] / float(_t["bytes_in"])
+            }
+        if min_throughput is not None:
+            _ok = [p for p in _results.keys() if _results[p]["throughput"] >= min_throughput]
+            if _ok:
+                _best = min(_ok, key=lambda p: _results[p]["ratio"])
+            else:
+                _best = max(_results.keys(), key=lambda p: _results[p]["throughput"])
+        elif max_ratio is not None:
+            _ok = [p for p in _results.keys() if _results[p]["ratio"] <= max_ratio]
+            if _ok:
+                _best = max(_ok, key=lambda p: _results[p]["throughput"])
+            else:
+                _best = min(_results.keys(), key=lambda p: _results[p]["ratio"])
+        else:
+            _best = min(_results.keys(), key=lambda p: _results[p]["ratio"])
+        self.profile = _best
+        return _best
+
+    def _sample_bands(self, matrix, x_axis_first=True, sample_bands=4, band_rows=64):
+        """Color a few evenly spaced bands of a matrix, to try settings on
+
+        :param matrix: 2-D sliceable matrix (see matrix2png), with the z range set
+        :param x_axis_first: Whether the x axis is the first axis in the 2-D array
+        :param sample_bands: Number of bands
+        :param band_rows: Rows per band
+        :return: list of numpy.ndarray bands of interleaved samples (rows x (cols * channels))
+        """
+        _axis = 1 if x_axis_first else 0
+        _height = matrix.shape[_axis]
+        _starts = np.unique(np.linspace(0, max(0, _height - band_rows), sample_bands).astype(int))
+        _bands = []
+        for r in _starts:
+            _src = take(matrix, _axis, r, r + band_rows)
+            if x_axis_first:
+                _src = np.transpose(_src)
+            _bands.append(self._colorize(_src).reshape(len(_src), -1))
+        return _bands
+
+    @property
+    def filter(self):
+        return self._png["filter"]
+
+    @filter.setter
+    def filter(self, f):
+        # Filters make smooth fields compress far better
+        # (pypng always writes filter type 0, so this only affects the numpy engine)
+        if f not in list(FILTERS.keys()) + ['adaptive', 'trial']:
+            raise ValueError('Filter ' + str(f) + ' is unknown.')
+        else:
+            self._png["filter"] = f
+
+    @property
+    def workers(self):
+        return self._png["workers"]
+
+    @workers.setter
+    def workers(self, w):
+        # Bands are colored and compressed on this many threads
+        # (numpy and zlib release the GIL for the heavy lifting)
+        if not isinstance(w, int) or w < 1:
+            raise ValueError('Workers must be a positive integer, not ' + str(w) + '.')
+        else:
+            self._png["workers"] = w
+
+    @property
+    def index_rows(self):
+        return self._png["index_rows"]
+
+    @index_rows.setter
+    def index_rows(self, n):
+        # Smaller segments make regions cheaper to read, at some cost in compression
+        if n is not None and (not isinstance(n, int) or n < 1):
+            raise ValueError('Index rows must be a positive integer or None, not ' + str(n) + '.')
+        else:
+            self._png["index_rows"] = n
+
+    @property
+    def exact(self):
+        return self._png["exact"]
+
+    @exact.setter
+    def exact(self, e):
+        # The image alone only holds the quantized values
+        if e is not None and e not in ("residual", "raw"):
+            raise ValueError('Exact ' + str(e) + ' is unknown.')
+        else:
+            self._png["exact"] = e
 
     def set_scaling(self, z_min=None, z_max=None, z_units=None,
                     x_min=None, x_max=None, x_units=None,
@@ -140,186 +350,608 @@ class MatrixPNG:
         if y_ascend_up is not None:
             self._y_invert = y_ascend_up
 
-    def matrix2png(self, matrix, file, x_axis_first=True):
+    def matrix2png(self, matrix, file, x_axis_first=True, memory_budget=None, range_sample=None, stats=None):
         """Load a numpy 2-D ndarray and build the PNG output
 
         By default, we assume that the first dimension corresponds to x (columns) and the second to y (rows).
         If you have already transposed your matrix (perhaps because you're used to matplotlib),
         then set x_axis_first to False.
-        :param matrix: 2-D numpy.ndarray
+        The image is colored and encoded in bands of rows, so the matrix may be a numpy.memmap,
+        a .npy file, or a chunked array (dask, zarr, h5py) that is larger than RAM;
+        memory_budget bounds the working memory used for each band.
+        The matrix is read twice, front to back: once for the z range (unless z_min and z_max are set),
+        and once to encode it.
+        Reads are fastest when image rows (y) run along the matrix's storage order,
+        that is, x_axis_first=False for C-ordered data.
+        :param matrix: 2-D numpy.ndarray, numpy.memmap, sliceable array, or .npy file name
         :param file: File name (string) to write
         :param x_axis_first: Whether the x axis is the first axis in the 2-D array
+        :param memory_budget: Approximate working memory per band, in bytes (default = 64 MiB)
+        :param range_sample: Fraction of the matrix to read for the z range (default = all of it);
+                             values outside a sampled range are clipped
+        :param stats: StageStats to record the time of each stage in (optional)
         """
+        matrix = open_matrix(matrix)
         # Set up scale values
-        self._setminmax(matrix)
-        # Local values to simplify this code section
-        _zmin = self._scale["z_min"]
-        _zmax = self._scale["z_max"]
+        self._setminmax(matrix, memory_budget, range_sample, stats)
+        # Try the filters on a sample of the matrix
+        _method = self._filter_for(self._sample_bands(matrix, x_axis_first)) if self.filter == "trial" else None
+        # If the array is to be represented as m[x][y] rather than m[y][x] (rows = y, cols = x)
+        if x_axis_first:
+            _width, _height = matrix.shape
+        else:
+            _height, _width = matrix.shape
+        # The exact values are collected as the bands go by
+        _exact = None
+        if self.exact is not None:
+            if self.engine != "numpy":
+                raise ValueError('Exact values need the numpy engine.')
+            _exact = ExactWriter(self.exact, matrix.dtype, _height, _width, self._band_rows(_width, memory_budget),
+                                 level=self._png["level"])
+        if self.workers > 1:
+            # Several bands are in memory at once: the ones being colored,
+            # the window being compressed, and the window after it
+            if memory_budget is None:
+                memory_budget = 64 * 2 ** 20
+            memory_budget //= 3 * self.workers
+            with ThreadPoolExecutor(self.workers) as _executor:
+                self._save_png(self._iter_bands(matrix, x_axis_first, memory_budget, _executor, _exact, stats),
+                               _width, _height, file, executor=_executor, exact=_exact, stats=stats, method=_method)
+        else:
+            self._save_png(self._iter_bands(matrix, x_axis_first, memory_budget, exact=_exact, stats=stats),
+                           _width, _height, file, exact=_exact, stats=stats, method=_method)
+
+    def export_pyramid(self, matrix, directory, tile_size=256, reduce="mean", x_axis_first=True, workers=None,
+                       memory_budget=None, tmpdir=None):
+        """Export a matrix as a pyramid of PNG tiles, for viewers that zoom and pan
+
+        Level 0 is full size, and each level after it is half the size, down to a single tile.
+        Tiles are written to <directory>/<level>/<column>_<row>.png (from the top left),
+        with pyramid.json describing the levels.
+        Every tile holds the global z range and its own x and y extents, so it decodes to true values on its own.
+        Tiles are written with this transformer's settings, on a pool of threads.
+        :param matrix: 2-D numpy.ndarray, numpy.memmap, sliceable array, or .npy file name
+        :param directory: Directory to write to
+        :param tile_size: Tile width and height, in pixels (default = 256)
+        :param reduce: How pixels are combined between levels: 'mean', 'max', or 'nearest' (default = 'mean')
+        :param x_axis_first: Whether the x axis is the first axis in the 2-D array
+        :param workers: Number of threads (default = os.cpu_count())
+        :param memory_budget: Approximate memory for each block read, in bytes (default = 64 MiB)
+        :param tmpdir: Directory for reduced levels that don't fit in memory_budget (default = the system temp dir)
+        :return: dict describing the pyramid
+        """
+        return export_pyramid(self, matrix, directory, tile_size=tile_size, reduce=reduce, x_axis_first=x_axis_first,
+                              workers=workers, memory_budget=memory_budget, tmpdir=tmpdir)
+
+    def _iter_bands(self, matrix, x_axis_first=True, memory_budget=None, executor=None, exact=None, stats=None):
+        """Color a matrix band by band, from the top of the image to the bottom
+
+        :param matrix: 2-D sliceable matrix (see matrix2png)
+        :param x_axis_first: Whether the x axis is the first axis in the 2-D array
+        :param memory_budget: Approximate working memory per band, in bytes (default = 64 MiB)
+        :param executor: concurrent.futures.Executor to color several bands at once (default = color in this thread)
+        :param exact: ExactWriter to give each band's values to (default = None)
+        :param stats: StageStats to record the time of each stage in (optional)
+        :return: generator of numpy.ndarray bands of interleaved samples (rows x (cols * channels))
+        """
+        # The y axis runs down the image
+        _axis = 1 if x_axis_first else 0
+        _height = matrix.shape[_axis]
+        _band = self._band_rows(matrix.shape[1 - _axis], memory_budget)
+        # Read chunked arrays a whole number of chunks at a time
+        _chunk = chunk_length(matrix, _axis)
+        _band = max(_chunk, _band // _chunk * _chunk)
+        _starts = range(0, _height, _band)
+        # Make y ascend upward rather than downward
+        # by walking the source rows bottom to top
+        if self._y_invert:
+            _starts = reversed(_starts)
+        _pending = deque()
+        for s in _starts:
+            with stage(stats, "read") as _s:
+                _src = take(matrix, _axis, s, min(s + _band, _height))
+                _s.add(bytes_out=_src.nbytes, pixels=_src.size)
+            # (These are views; nothing is copied)
+            if x_axis_first:
+                _src = np.transpose(_src)
+            if self._y_invert:
+                _src = _src[::-1]
+            if executor is None:
+                yield self._finish_band(_src, self._colorize_stage(_src, stats), exact, stats)
+            else:
+                # Keep a few bands in flight, and hand them out in order
+                _pending.append((_src, executor.submit(self._colorize_stage, _src, stats)))
+                if len(_pending) >= self.workers:
+                    _src, _future = _pending.popleft()
+                    yield self._finish_band(_src, _future.result(), exact, stats)
+        while _pending:
+            _src, _future = _pending.popleft()
+            yield self._finish_band(_src, _future.result(), exact, stats)
+
+    def _colorize_stage(self, matrix, stats=None):
+        """Color a band (see _colorize), as the "color" stage"""
+        with stage(stats, "color", bytes_in=matrix.nbytes, pixels=matrix.size) as _s:
+            _arr = self._colorize(matrix)
+            _s.add(bytes_out=_arr.nbytes)
+        return _arr
+
+    def _finish_band(self, src, arr, exact=None, stats=None):
+        """Hand a colored band's values to the exact value writer, and flatten its pixels
+
+        :param src: numpy.ndarray (rows x cols) of matrix values
+        :param arr: numpy.ndarray (rows x cols x channels) of samples
+        :param exact: ExactWriter, or None
+        :param stats: StageStats to record the time of each stage in (optional)
+        :return: numpy.ndarray (rows x (cols * channels))
+        """
+        if exact is not None:
+            with stage(stats, "exact", bytes_in=src.nbytes, pixels=src.size):
+                exact.add(src, self._color_to_z_value(arr) if self.exact == "residual" else None)
+        return arr.reshape(len(arr), -1)
+
+    def _band_rows(self, width, memory_budget=None):
+        """The number of rows to color at once to stay within a memory budget
+
+        :param width: Number of columns in the image
+        :param memory_budget: Approximate working memory per band, in bytes (default = 64 MiB)
+        :return: int
+        """
+        if memory_budget is None:
+            memory_budget = 64 * 2 ** 20
+        # Float and index temporaries, the NaN mask, the output pixels,
+        # and the candidate rows for adaptive filtering
+        _row_bytes = width * (2 * 8 + 1 + 10 * len(self.mode) * np.dtype(self._dtype).itemsize)
+        return max(1, int(memory_budget // _row_bytes))
+
+    def _colorize(self, matrix):
+        """Map every matrix element to its colormap color
+
+        Scaling, clipping, and the colormap lookup are done on the whole array at once.
+        :param matrix: 2-D numpy.ndarray
+        :return: numpy.ndarray (rows x cols x channels) of the smallest dtype that fits the bit depth
+        """
+        # Scale to (fractional) quantization indices
+        # Work in float so integer matrices scale the same way
+        _k = np.subtract(matrix, self._scale["z_min"], dtype=float)
+        # A constant matrix (z_min == z_max) has nothing to scale;
+        # every finite value is clipped to an index that reads back as z_min
+        if self.quantization_delta != 0:
+            _k /= self.quantization_delta
+        # NaN values are masked out and colored separately
+        _nan = np.isnan(_k)
+        _k[_nan] = 0
+        # Clip before truncating, so out-of-range values (including +/-inf) saturate
+        np.clip(_k, 0, self.quantization_levels - 1, out=_k)
+        _k = _k.astype(np.intp)
         # Initialize the PNG array
-        _arr = np.empty([len(matrix), len(matrix[0]), len(self.mode)], dtype=int)
+        _arr = np.empty(_k.shape + (len(self.mode),), dtype=self._dtype)
         # Fill array with default alpha value (fully opaque)
         # This simplifies things later
         _arr.fill(2 ** self.bitdepth - 1)
         # The number of non-alpha channels
         _channels = len(self.mode.rstrip('A'))
-        # Assign colors element by element
-        for i in range(len(_arr)):
-            for j in range(len(_arr[i])):
-                if matrix[i][j] is np.nan:
-                    # NaN values get gray when in RGB mode
-                    _arr[i][j][:_channels] = self._nan_value()
-                else:
-                    # Find the index
-                    k = int(np.clip([(float(matrix[i][j] - _zmin) / self.quantization_delta)],
-                                    0, self.quantization_levels - 1)[0])
-                    # Save those color values to the array
-                    _arr[i][j][:_channels] = self._png["colormap"][k]
-        # If the array is to be represented as m[x][y] rather than m[y][x] (rows = y, cols = x)
-        if x_axis_first:
-            _arr = np.transpose(_arr, axes=(1, 0, 2))
-        # Make y ascend upward rather than downward
-        if self._y_invert:
-            _arr = np.flipud(_arr)
-        _png = self._make_png(_arr)
-        self._save_png(_png, file)
+        # Gather the colors from the colormap table
+        _arr[..., :_channels] = self._png["colormap"][_k]
+        # NaN values get gray when in RGB mode
+        _arr[_nan, :_channels] = self._nan_value()
+        return _arr
+
+    @property
+    def _dtype(self):
+        """The smallest unsigned integer type that holds one sample at this bit depth"""
+        if self.bitdepth > 8:
+            return np.uint16
+        return np.uint8
 
     def _nan_value(self):
         """Determine what gets wirtten in the case of np.nan"""
+        # Palette mode = the (transparent) entry after the color map
+        if self.mode == 'P':
+            return self.quantization_levels
         # RGB mode = gray
-        if len(self.mode.rstrip('A')) > 1:
-            return 2 ** self.bitdepth / 2 - 1
+        elif len(self.mode.rstrip('A')) > 1:
+            return 2 ** self.bitdepth // 2 - 1
         # Grayscale mode = black (minimum)
         else:
             return 0
         # In the future, we can play with alpha or something
 
-    def _make_png(self, arr):
-        """Write png data to a buffer
-
-        :return: io.BytesIO"""
-        _mode = self.mode
-        # pypng bit depth mode text
-        if self.bitdepth == 16:
-            _mode += ";16"
-        # This returns a png.Image type
-        _png_image = png.from_array(arr, mode=_mode, info={"bitdepth": self.bitdepth})
-        # Save this to a buffer
-        f = io.BytesIO()
-        _png_image.save(f)
-        f2 = io.BytesIO(f.getvalue())
-        f.close()
-        # Return a readable BytesIO buffer
-        return f2
-
-    def _save_png(self, fp, file):
+    def _save_png(self, bands, width, height, file, executor=None, exact=None, stats=None, method=None):
         """Write the PNG file
 
-        :param fp: File pointer containing a "written" png byte stream
+        Everything is written to the file in a single pass:
+        header, metadata chunks, image data, and end chunk.
+        :param bands: iterable of bands of interleaved samples (rows x (cols * channels))
+        :param width: Image width
+        :param height: Image height
         :param file: Name or fp of file to write to
+        :param executor: concurrent.futures.Executor to compress with (numpy engine only; default = this thread)
+        :param exact: ExactWriter with chunks to write after the image data (numpy engine only; default = None)
+        :param stats: StageStats to record the time of each stage in (optional)
+        :param method: Filter to write with (numpy engine only; default = the filter setting)
+        """
+        _samples = width * height * len(self.mode) * np.dtype(self._dtype).itemsize
+        with stage(stats, "encode", bytes_in=_samples, pixels=width * height) as _s:
+            if isinstance(file, str):
+                with open(file, 'wb') as fp:
+                    self._write_png(bands, width, height, fp, executor, exact, method)
+                    _s.add(bytes_out=fp.tell())
+            else:
+                # The bytes written can only be counted in files that know where they are
+                _start = file.tell() if stats is not None and file.seekable() else None
+                self._write_png(bands, width, height, file, executor, exact, method)
+                if _start is not None:
+                    _s.add(bytes_out=file.tell() - _start)
+
+    def _write_png(self, bands, width, height, fp, executor=None, exact=None, method=None):
+        """Encode the PNG with the selected engine
+
+        :param bands: iterable of bands of interleaved samples (rows x (cols * channels))
+        :param width: Image width
+        :param height: Image height
+        :param fp: File pointer, opened in binary mode
+        :param executor: concurrent.futures.Executor to compress with (numpy engine only; default = this thread)
+        :param exact: ExactWriter with chunks to write after the image data (numpy engine only; default = None)
+        :param method: Filter to write with (numpy engine only; default = the filter setting)
+        """
+        if self.engine == "numpy":
+            _chunks = self._metadata_chunks()
+            if self.mode == 'P':
+                _chunks = self._palette_chunks() + _chunks
+            write_header(fp, width, height, self.bitdepth, COLOR_TYPES[self.mode], _chunks)
+            _bpp = len(self.mode) * self.bitdepth // 8
+            _method = method or self.filter
+            if self.index_rows is not None:
+                # (Bands are still colored on the executor, but compressed in this thread)
+                write_idat_indexed(fp, bands, _bpp, height, self.index_rows,
+                                   level=self._png["level"], strategy=self._png["strategy"], method=_method)
+            elif executor is None:
+                write_idat(fp, bands, _bpp,
+                           level=self._png["level"], strategy=self._png["strategy"], method=_method)
+            else:
+                write_idat_parallel(fp, bands, _bpp, executor, self.workers,
+                                    level=self._png["level"], strategy=self._png["strategy"], method=_method)
+            # The exact values are only complete once every band has gone by
+            if exact is not None:
+                for c in exact.chunks():
+                    write_chunk(fp, *c)
+            write_chunk(fp, b'IEND')
+        elif self.index_rows is not None:
+            raise ValueError('The band index needs the numpy engine.')
+        else:
+            # (pypng has no strategy setting, and writes the palette itself)
+            if self.mode == 'P':
+                _color = {"palette": [tuple(c) for c in self._palette()]}
+            else:
+                _color = {"greyscale": self.mode.startswith('L'), "alpha": self.mode.endswith('A')}
+            _writer = ChunkWriter(width, height, chunks=self._metadata_chunks(),
+                                  bitdepth=self.bitdepth, compression=self._png["level"], **_color)
+            # pypng takes one row at a time
+            _writer.write(fp, (row for b in bands for row in b))
+
+    def _filter_for(self, bands):
+        """The filter to write with, trying each one on some bands of the image for 'trial'
+
+        :param bands: list of numpy.ndarray bands (rows x (cols * channels)) of samples
+        :return: Filter name (see FILTERS), or "adaptive"
+        """
+        if self.filter != "trial":
+            return self.filter
+        return pick_filter(bands, len(self.mode) * self.bitdepth // 8,
+                           level=self._png["level"], strategy=self._png["strategy"])
+
+    def _palette(self):
+        """The palette for mode P: the color map, then a transparent gray for NaN
+
+        :return: numpy.ndarray (entries x 4) of RGBA uint8
+        """
+        _rgb = palette(self._colormap)
+        _pal = np.full((len(_rgb) + 1, 4), 255, dtype=np.uint8)
+        _pal[:-1, :3] = _rgb
+        _pal[-1] = [127, 127, 127, 0]
+        return _pal
+
+    def _palette_chunks(self):
+        """Prepare the PLTE and tRNS chunks for mode P
+
+        :return: list of chunk tuples
+        """
+        _pal = self._palette()
+        return [(b'PLTE', _pal[:, :3].tobytes()), (b'tRNS', _pal[:, 3].tobytes())]
+
+    def _metadata_chunks(self):
+        """Prepare the chunks that describe the matrix
+
+        :return: list of chunk tuples
         """
-        # Convert the png "image" to a list of chunks
-        # (Use a list because we're appending to it)
-        chunklist = []
-        for c in png.Reader(file=fp).chunks():
-            chunklist.append(c)
-        fp.close()
-        # Add text chunks
         # Scale information
-        for k in self._scale.keys():
-            chunklist.insert(-1, ChunkITXT(keyword=k, text=str(self._scale[k])).get_chunk())
-        # Color map name (only valid for RGB/RGBA)
-        if self.mode.startswith('RGB'):
-            chunklist.insert(-1, ChunkITXT(keyword='colormap', text=self._colormap).get_chunk())
+        _values = dict(self._scale)
+        # Color map name (only valid for RGB/RGBA/P)
+        if self.mode.startswith('RGB') or self.mode == 'P':
+            _values["colormap"] = self._colormap
         # Which way does the y axis ascend?
-        if self._y_invert:
-            chunklist.insert(-1, ChunkITXT(keyword='y_ascend', text="up").get_chunk())
-        else:
-            chunklist.insert(-1, ChunkITXT(keyword='y_ascend', text="down").get_chunk())
-        # Write the PNG
-        png.write_chunks(file, chunklist)
-
-    def _setminmax(self, matrix):
-        """Set default values for scales"""
-        if self._scale["z_min"] is None:
-            self._scale["z_min"] = matrix.min()
-        if self._scale["z_max"] is None:
-            self._scale["z_max"] = matrix.max()
+        _values["y_ascend_up"] = bool(self._y_invert)
+        return [pack_metadata(_values, level=self._png["level"])]
+
+    def _setminmax(self, matrix, memory_budget=None, sample=None, stats=None):
+        """Set default values for scales
+
+        :param matrix: 2-D sliceable matrix (see matrix2png)
+        :param memory_budget: Approximate memory for each block read for the z range, in bytes (default = 64 MiB)
+        :param sample: Fraction of the matrix to read for the z range (default = all of it)
+        :param stats: StageStats to record the time of the z range in (optional)
+        """
+        if self._scale["z_min"] is None or self._scale["z_max"] is None:
+            # One pass for both, skipping NaN
+            _n = int(matrix.shape[0] * matrix.shape[1] * min(1, sample or 1))
+            with stage(stats, "range", bytes_in=_n * np.dtype(matrix.dtype).itemsize, pixels=_n):
+                _min, _max = value_range(matrix, memory_budget or 64 * 2 ** 20, sample)
+            if self._scale["z_min"] is None:
+                self._scale["z_min"] = _min
+            if self._scale["z_max"] is None:
+                self._scale["z_max"] = _max
         if self._scale["x_min"] is None:
             self._scale["x_min"] = 0
         if self._scale["x_max"] is None:
-            self._scale["x_max"] = len(matrix)
+            self._scale["x_max"] = matrix.shape[0]
         if self._scale["y_min"] is None:
             self._scale["y_min"] = 0
         if self._scale["y_max"] is None:
-            self._scale["y_max"] = len(matrix[0])
+            self._scale["y_max"] = matrix.shape[1]
         # Reset the quantization info
         self._setup_quantization()
 
-    def pngfile2matrix(self, filename):
+    def pngfile2matrix(self, filename, x_axis_first=True, exact=False, stats=None, out=None):
         """Read a PNG from a filename and build a matrix
 
         :param filename: File name
+        :param x_axis_first: Whether the x axis should be the first axis in the 2-D array
+        :param exact: Return the exact values stored with the image, rather than the quantized ones
+        :param stats: StageStats to record the time of each stage in (optional)
+        :param out: numpy.ndarray of floats to write the matrix into (optional; see png2matrix)
         :return: dict of matrix information
         """
         with open(filename, 'rb') as fp:
-            r = self.png2matrix(fp)
+            r = self.png2matrix(fp, x_axis_first=x_axis_first, exact=exact, stats=stats, out=out)
         return r
 
-    def png2matrix(self, fp):
+    def png2matrix(self, fp, x_axis_first=True, exact=False, stats=None, out=None):
         """Read a PNG from a file pointer and build a matrix
 
+        The returned dict holds the matrix under "matrix", along with the scale information,
+        the colormap name, and the y orientation ("y_ascend_up").
+        Colors that are not in the colormap (such as the NaN gray) come back as np.nan.
         :param fp: File pointer, opened in binary mode
+        :param x_axis_first: Whether the x axis should be the first axis in the 2-D array
+        :param exact: Return the exact values stored with the image (see exact), rather than the quantized ones
+        :param stats: StageStats to record the time of each stage in (optional)
+        :param out: numpy.ndarray of floats to write the matrix into, in place of a new array (optional);
+                    it must have the shape of the returned matrix, and is returned as the matrix
         :return: dict of matrix information
         """
         # Read in the data
-        f = io.BytesIO(fp.read())
+        with stage(stats, "read") as _s:
+            _file = fp.read()
+            _s.add(bytes_out=len(_file))
+        f = io.BytesIO(_file)
         # Close the file pointer
         fp.close()
-        # Get the chunks
-        for c in png.Reader(f).chunks():
-            # Process iTXt chunks
-            if c[0].lower() == 'itxt':
-                cd = ChunkITXT(c[1]).get_chunkdata()
-                # Does the keyword match a known scale key?
-                if cd["keyword"] in self._scale.keys():
-                    # Try to cast as int or float before saving as text
-                    try:
-                        t = int(cd["text"])
-                    except:
-                        try:
-                            t = float(cd["text"])
-                        except:
-                            t = cd["text"]
-                    self._scale[cd["keyword"]] = t
-                # Other known keywords
-                elif cd["keyword"] == "colormap":
-                    self._colormap = cd["text"]
-                elif cd["keyword"] == "y_ascend":
-                    if cd["text"] == "down":
-                        self._y_invert = False
-                    elif cd["text"] == "up":
-                        self._y_invert = True
-        # Set up the color map
-        self._setup_colors()
-        # Set up quantization
-        self._setup_quantization()
+        # Get the metadata
+        with stage(stats, "metadata"):
+            _chunks = {}
+            _meta = _read_metadata(f, _chunks)
+            self._apply_metadata(_meta)
+        if out is not None:
+            # Check the output array before decoding anything
+            _shape = (_meta.width, _meta.height) if x_axis_first else (_meta.height, _meta.width)
+            if out.shape != _shape:
+                raise ValueError('The output array has shape ' + str(out.shape) + ', not ' + str(_shape) + '.')
+            if not np.can_cast(np.float64, out.dtype, "same_kind"):
+                raise ValueError('The output array has dtype ' + str(out.dtype) + ', which can not hold NaN.')
         # Reset f
         f.seek(0)
         # Get the matrix representing the PNG
-        # Read in using 'direct' format
-        m = png.Reader(f).asDirect()
-        # TODO: Convert to matrix
-        print(str(m[0]) + "x" + str(m[1]) + "; " + "planes: " + str(m[3]["planes"]) + ", alpha: " + str(m[3]["alpha"]))
-        return None
+        # Take the mode and bit depth from the file
+        # (The setters also set up the color map)
+        self._png["bitdepth"] = _meta.bitdepth
+        _arr = None
+        with stage(stats, "decode", bytes_in=len(_file), pixels=_meta.width * _meta.height) as _s:
+            # The numpy decoder gives the samples as stored, which is what we want
+            # unless a tRNS chunk would add an alpha channel
+            if self.engine == "numpy" and (_meta.mode == 'P' or b'tRNS' not in _chunks):
+                _arr = read_image(f)
+                if _arr is not None:
+                    self.mode = _meta.mode
+            if _arr is None:
+                f.seek(0)
+                if _meta.mode == 'P':
+                    # Read the palette indices themselves
+                    _width, _height, _rows, _info = png.Reader(f).read()
+                    self.mode = 'P'
+                else:
+                    # Read in using 'direct' format
+                    _width, _height, _rows, _info = png.Reader(f).asDirect()
+                    self.mode = ("L" if _info["greyscale"] else "RGB") + ("A" if _info["alpha"] else "")
+                # Stack the rows into a (rows x cols x channels) array
+                _arr = np.vstack([np.asarray(r, dtype=self._dtype) for r in _rows])
+                _arr = _arr.reshape(_height, _width, _info["planes"])
+            _s.add(bytes_out=_arr.nbytes)
+        # Set up quantization
+        self._setup_quantization()
+        # Convert colors to z values
+        with stage(stats, "color", bytes_in=_arr.nbytes, pixels=_arr.shape[0] * _arr.shape[1]) as _s:
+            m = self._color_to_z_value(_arr)
+            _s.add(bytes_out=m.nbytes)
+        if exact:
+            with stage(stats, "exact", pixels=m.size) as _s:
+                f.seek(0)
+                _data = b''.join(read_chunks(f, EXACT_TAG))
+                if not _data:
+                    raise ValueError('No exact values are stored in this file.')
+                m = read_exact(_data, m)
+                _s.add(bytes_in=len(_data), bytes_out=m.nbytes)
+        # Undo the orientation changes made by matrix2png
+        with stage(stats, "orient", bytes_in=m.nbytes, pixels=m.size) as _s:
+            if self._y_invert:
+                m = np.flipud(m)
+            if x_axis_first:
+                m = np.transpose(m)
+            if out is None:
+                m = np.ascontiguousarray(m)
+            else:
+                np.copyto(out, m, casting="same_kind")
+                m = out
+            _s.add(bytes_out=m.nbytes)
+        # Return the matrix along with its metadata
+        r = dict(self._scale)
+        r["matrix"] = m
+        r["colormap"] = self._colormap
+        r["y_ascend_up"] = self._y_invert
+        return r
+
+    def read_region(self, filename, x_range=None, y_range=None, x_axis_first=True):
+        """Read part of a matrix from a PNG file
+
+        Ranges are (start, stop) tuples of matrix indices, as in matrix[start:stop].
+        Files written with index_rows only have the bands that hold the region read and inflated;
+        other files are decoded whole and then cut down.
+        :param filename: File name
+        :param x_range: Range of x indices (default = all)
+        :param y_range: Range of y indices (default = all)
+        :param x_axis_first: Whether the x axis should be the first axis in the 2-D array
+        :return: dict of matrix information, as from png2matrix, with the ranges read as "x_range" and "y_range"
+        """
+        with open(filename, 'rb') as fp:
+            _meta, _index_pos, _index = self._read_index(fp)
+            x0, x1 = slice(*(x_range or (None,))).indices(_meta.width)[:2]
+            y0, y1 = slice(*(y_range or (None,))).indices(_meta.height)[:2]
+            x1 = max(x0, x1)
+            y1 = max(y0, y1)
+            if _index is None:
+                # No index; decode everything
+                fp.seek(0)
+                r = self.png2matrix(fp, x_axis_first=False)
+                r["matrix"] = np.ascontiguousarray(r["matrix"][y0:y1, x0:x1].T if x_axis_first else
+                                                   r["matrix"][y0:y1, x0:x1])
+                r["x_range"] = (x0, x1)
+                r["y_range"] = (y0, y1)
+                return r
+            self._configure_from(_meta)
+            # The image rows that hold the y range
+            if self._y_invert:
+                r0, r1 = _meta.height - y1, _meta.height - y0
+            else:
+                r0, r1 = y0, y1
+            _planes = 1 if self.mode == 'P' else len(self.mode)
+            _bpp = _planes * self.bitdepth // 8
+            _bytes = read_rows(fp, _index_pos, _index, _meta.height, _meta.width * _bpp, _bpp, r0, r1)
+        _arr = bytes_to_samples(_bytes, self.bitdepth).reshape(r1 - r0, _meta.width, _planes)[:, x0:x1]
+        # Convert colors to z values
+        m = self._color_to_z_value(_arr)
+        # Undo the orientation changes made by matrix2png
+        if self._y_invert:
+            m = np.flipud(m)
+        if x_axis_first:
+            m = np.transpose(m)
+        r = dict(self._scale)
+        r["matrix"] = np.ascontiguousarray(m)
+        r["colormap"] = self._colormap
+        r["y_ascend_up"] = self._y_invert
+        r["x_range"] = (x0, x1)
+        r["y_range"] = (y0, y1)
+        return r
+
+    def update_region(self, filename, sub_matrix, x0, y0, x_axis_first=True):
+        """Replace part of the matrix in a PNG file written with index_rows
+
+        Only the bands that hold the region are colored, compressed, and rewritten,
+        so the cost depends on the size of the region rather than the size of the image.
+        The file keeps its own scale, color map, and mode; values outside its z range are clipped.
+        The rewritten bands are compressed with this transformer's profile and filter.
+        Files that also store their exact values (see exact) can't be updated, since those would go stale.
+        :param filename: File name
+        :param sub_matrix: 2-D numpy.ndarray of the new values
+        :param x0: x index of the first column of sub_matrix
+        :param y0: y index of the first row of sub_matrix
+        :param x_axis_first: Whether the x axis is the first axis in the 2-D array
+        :return: None
+        """
+        with open(filename, 'r+b') as fp:
+            _meta, _index_pos, _index = self._read_index(fp)
+            if _index is None:
+                raise ValueError('File ' + str(filename) + ' has no band index.')
+            fp.seek(0)
+            if find_chunk(fp, EXACT_TAG) is not None:
+                raise ValueError('File ' + str(filename) + ' stores exact values, which would go stale.')
+            self._configure_from(_meta)
+            # Orient the new values as the image is (rows = y, cols = x)
+            if x_axis_first:
+                sub_matrix = np.transpose(sub_matrix)
+            _rows, _cols = np.shape(sub_matrix)
+            if x0 < 0 or y0 < 0 or x0 + _cols > _meta.width or y0 + _rows > _meta.height:
+                raise ValueError('The region does not fit in the image.')
+            # Make y ascend upward rather than downward
+            if self._y_invert:
+                r0 = _meta.height - y0 - _rows
+                sub_matrix = sub_matrix[::-1]
+            else:
+                r0 = y0
+            _planes = 1 if self.mode == 'P' else len(self.mode)
+            _bpp = _planes * self.bitdepth // 8
+            _band = self._colorize(sub_matrix).reshape(_rows, -1)
+            update_rows(fp, _index_pos, _index, _meta.height, _meta.width * _bpp, _bpp, r0, x0 * _bpp,
+                        sample_bytes(_band), level=self._png["level"], strategy=self._png["strategy"],
+                        method=self._filter_for([_band]))
+
+    def _read_index(self, fp):
+        """Read the metadata and band index of a PNG file
+
+        :param fp: File pointer, opened in binary mode
+        :return: tuple of (MatrixMetadata, position of the index chunk, index), with None for no index
+        """
+        _chunks = {}
+        _meta = _read_metadata(fp, _chunks)
+        if INDEX_TAG not in _chunks:
+            return _meta, None, None
+        return _meta, _chunks[INDEX_TAG][0], parse_index(_chunks[INDEX_TAG][1])
+
+    def _configure_from(self, meta):
+        """Set this transformer up to read or write pixels of a file as they are
+
+        :param meta: MatrixMetadata
+        :return: None
+        """
+        self._apply_metadata(meta)
+        self._png["bitdepth"] = meta.bitdepth
+        self.mode = meta.mode
+        self._setup_quantization()
+
+    def _apply_metadata(self, meta):
+        """Take the scale information, colormap, and y orientation from a file's metadata
+
+        :param meta: MatrixMetadata
+        :return: None
+        """
+        for k in self._scale.keys():
+            self._scale[k] = getattr(meta, k)
+        if meta.colormap is not None:
+            self._colormap = meta.colormap
+        if meta.y_ascend_up is not None:
+            self._y_invert = meta.y_ascend_up
 
     def _setup_colors(self):
-        """Initialize the color map
+        """Initialize the color map and its inverse
 
         :return: None
         """
         # Load our color map
+        # (The tables are built once per process and shared)
         if self.mode is not None and self.bitdepth is not None:
-            self._png["colormap"] = ColorMaps(mode=self.mode, bd=self.bitdepth, colormap=self._colormap)
+            _forward, _keys, _order = color_tables(mode=self.mode, bd=self.bitdepth, colormap=self._colormap)
+            self._png["colormap"] = _forward
+            # The inverse lookup is a sorted list of packed colors
+            # and the quantization index each one came from
+            self._png["inverse"] = (_keys, _order)
 
     def _setup_quantization(self):
         """Do some preliminary work to save some hassle later
@@ -334,12 +966,54 @@ class MatrixPNG:
                                    float(self.quantization_levels - 1)
 
     def _color_to_z_value(self, color):
-        """Convert a color to a z value
+        """Convert colors to z values
+
+        :param color: Color value (list or tuple), or numpy.ndarray with channels along the last axis
+        :return: z value (float), or numpy.ndarray of z values; unknown colors give np.nan
+        """
+        _colors = np.asarray(color, dtype=self._dtype)
+        # A single color is looked up as an array of one
+        _single = _colors.ndim == 1
+        if _single:
+            _colors = _colors[np.newaxis]
+        if self.mode == 'P':
+            # Palette indices are the quantization indices (the entry after the color map is NaN)
+            _index = _colors[..., 0]
+            _found = _index < self.quantization_levels
+        else:
+            _colors = _colors[..., :len(self.mode.rstrip('A'))]
+            _lookup = inverse_lookup(self.mode, self.bitdepth, self._colormap)
+            if _lookup is not None:
+                # Look each key up directly
+                # (The keys fit in 32 bits, which are cheaper to pack)
+                _index = _lookup[pack_colors(_colors, self.bitdepth, np.uint32)]
+                _found = _index < self.quantization_levels
+            else:
+                # Find each key in the sorted table
+                _keys = pack_colors(_colors, self.bitdepth)
+                _sorted, _order = self._png["inverse"]
+                _pos = np.searchsorted(_sorted, _keys)
+                np.clip(_pos, 0, len(_sorted) - 1, out=_pos)
+                _found = _sorted[_pos] == _keys
+                _index = _order[_pos]
+        # z = z_min + index * delta
+        _z = _index * self.quantization_delta
+        _z += self._scale["z_min"]
+        _z[~_found] = np.nan
+        if _single:
+            return float(_z[0])
+        return _z
 
-        :param color: Color value (list or tuple)
-        :return: z value (float)
+    def _copy(self):
+        """A copy of this transformer that can be used without changing this one
+
+        The (read-only) color tables are shared rather than copied.
+        :return: MatrixPNG
         """
-        # TODO
+        _c = copy.copy(self)
+        _c._png = dict(self._png)
+        _c._scale = dict(self._scale)
+        return _c
 
     @property
     def quantization_levels(self):
@@ -357,6 +1031,15 @@ class MatrixPNG:
         """
         return self._quantization_delta
 
+
+# The batch and time-series APIs build on MatrixPNG, so they are imported last
+from ._batch import encode_many, decode_many
+from ._apng import APNGWriter, read_frame
+from ._codec import MatrixPNGConfig, encode, decode
+from ._asyncCodec import aencode, aencode_stream, adecode, aread_metadata
+from ._decodeCache import DecodeCache, CacheInfo
+
+
 def _main():
     raise (SyntaxError, "Don't call this module directly. Use 'import matrixpng'.")
 
@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""Store a time series of matrices as frames of one animated PNG (APNG)
+
+The canonical source for this package is https://github.com/finitemobius/matrixpng-py
+All frames share one header: size, mode, color map, and scale.
+Frames are appended as they are produced. A frame may hold just the rectangle that changed
+since the one before (placed with fcTL offsets), with a full keyframe every so often.
+A private chunk just before IEND (mpFX) indexes where each frame starts,
+so frame k is read from the last keyframe at or before it, not from the start of the file.
+Viewers that don't know APNG show the first frame; readers that don't know mpFX skip it.
+See the APNG specification for the frame chunks:
+https://wiki.mozilla.org/APNG_Specification
+"""
+
+import os
+import struct
+import zlib
+import numpy as np
+from . import MatrixPNG
+from ._pngEncoder import write_header, write_chunk, pack_scanlines, COLOR_TYPES
+from ._pngMetadata import _read_metadata
+from ._pngDecoder import unfilter_scanlines, bytes_to_samples
+from ._matrixBlocks import open_matrix
+
+__author__ = "Finite Mobius, LLC"
+__credits__ = ["Jason R. Miller"]
+__license__ = "MIT"
+__version__ = "alpha"
+__maintainer__ = "Finite Mobius, LLC"
+__email__ = "jason@finitemobius.com"
+__status__ = "Development"
+
+# The chunk type of the frame index
+FRAME_INDEX_TAG = b'mpFX'
+# Bump this when the index layout changes
+_VERSION = 1
+# Number of frames and number of plays (0 = loop forever)
+_ACTL = struct.Struct("!2I")
+# Sequence number, width, height, x and y offsets, delay numerator and denominator, dispose and blend ops
+_FCTL = struct.Struct("!5I2H2B")
+# Position of a frame's fcTL chunk, and whether it is a keyframe (the whole image)
+_ENTRY = struct.Struct("!QB")
+# The end of the index: version, number of frames, next sequence number
+_TAIL = struct.Struct("!B2I")
+# Compressed bytes per IDAT or fdAT chunk
+_CHUNK_LIMIT = 2 ** 20
+
+
+class APNGWriter:
+    """Write matrices as the frames of an animated PNG, one at a time"""
+
+    def __init__(self, filename, transformer=None, changed_only=False, keyframe_interval=16, delay=(1, 10),
+                 append=False):
+        """Open a file for frames
+
+        The scale (z_min and z_max) is fixed for the whole series.
+        If the transformer doesn't set it, it is taken from the first frame, and later values outside it are clipped.
+        :param filename: File name
+        :param transformer: MatrixPNG with the output settings (default = MatrixPNG defaults)
+        :param changed_only: Write only the rectangle that changed since the frame before
+        :param keyframe_interval: With changed_only, write the whole image every this many frames
+        :param delay: Default frame delay, as (numerator, denominator) seconds
+        :param append: Add frames to the end of an existing file (its settings are used, not the transformer's)
+        """
+        self._t = (transformer or MatrixPNG())._copy()
+        self._changed_only = changed_only
+        self._keyframe_interval = keyframe_interval
+        self._delay = delay
+        # (fcTL position, keyframe) for each frame
+        self._frames = []
+        self._seq = 0
+        # Image size, and where the acTL chunk is
+        self._size = None
+        self._actl_pos = None
+        # Samples of the last frame, for finding what changed
+        self._prev = None
+        self._filename = filename
+        self._closed = False
+        if append and os.path.exists(filename):
+            self._fp = open(filename, 'r+b')
+            try:
+                self._reopen()
+            except BaseException:
+                self._fp.close()
+                raise
+        else:
+            # The file is created with the first frame, so a writer with no frames leaves no file behind
+            self._fp = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def frame_count(self):
+        """The number of frames written so far
+
+        :return: int
+        """
+        return len(self._frames)
+
+    def append(self, matrix, x_axis_first=True, delay=None):
+        """Write the next frame
+
+        :param matrix: 2-D numpy.ndarray, numpy.memmap, sliceable array, or .npy file name (the same shape each time)
+        :param x_axis_first: Whether the x axis is the first axis in the 2-D array
+        :param delay: Frame delay, as (numerator, denominator) seconds (default = the writer's delay)
+        :return: None
+        """
+        if self._closed:
+            raise ValueError('The writer is closed.')
+        matrix = open_matrix(matrix)
+        _width, _height = matrix.shape if x_axis_first else matrix.shape[::-1]
+        if self._size is None:
+            self._start(matrix, _width, _height)
+        elif (_width, _height) != self._size:
+            raise ValueError('Frame size ' + str((_width, _height)) + ' does not match ' + str(self._size) + '.')
+        _pixels = np.concatenate(list(self._t._iter_bands(matrix, x_axis_first)))
+        _pixels = _pixels.reshape(_height, _width, -1)
+        # Decide what to write: the whole image, or the rectangle that changed
+        n = len(self._frames)
+        _key = n == 0 or not self._changed_only or n % self._keyframe_interval == 0
+        if _key:
+            x0, y0, x1, y1 = 0, 0, _width, _height
+        else:
+            _changed = np.any(_pixels != self._prev, axis=2)
+            _rows = np.flatnonzero(_changed.any(axis=1))
+            _cols = np.flatnonzero(_changed.any(axis=0))
+            if len(_rows):
+                x0, y0, x1, y1 = _cols[0], _rows[0], _cols[-1] + 1, _rows[-1] + 1
+            else:
+                # Frames can't be empty; rewrite one unchanged pixel
+                x0, y0, x1, y1 = 0, 0, 1, 1
+        _sub = _pixels[y0:y1, x0:x1].reshape(y1 - y0, -1)
+        _bpp = _pixels.shape[2] * self._t.bitdepth // 8
+        _lines = pack_scanlines(_sub, bpp=_bpp, method=self._t._filter_for([_sub]))
+        _compressor = zlib.compressobj(self._t._png["level"], zlib.DEFLATED, zlib.MAX_WBITS, zlib.DEF_MEM_LEVEL,
+                                       self._t._png["strategy"])
+        _data = _compressor.compress(_lines) + _compressor.flush()
+        # Frame control, then the frame data
+        # (Each frame replaces its rectangle, and is left in place for the next one)
+        _delay = delay or self._delay
+        _pos = self._fp.tell()
+        write_chunk(self._fp, b'fcTL', _FCTL.pack(self._seq, x1 - x0, y1 - y0, x0, y0, _delay[0], _delay[1], 0, 0))
+        self._seq += 1
+        for s in range(0, len(_data), _CHUNK_LIMIT):
+            if n == 0:
+                # The first frame is also the image that viewers without APNG show
+                write_chunk(self._fp, b'IDAT', _data[s:s + _CHUNK_LIMIT])
+            else:
+                write_chunk(self._fp, b'fdAT', struct.pack("!I", self._seq) + _data[s:s + _CHUNK_LIMIT])
+                self._seq += 1
+        self._frames.append((_pos, _key))
+        self._prev = _pixels
+
+    def close(self):
+        """Write the frame index and end chunk, and fill in the number of frames
+
+        :return: None
+        """
+        self._closed = True
+        if self._fp is None:
+            return
+        if self._frames:
+            _index = b''.join(_ENTRY.pack(p, k) for p, k in self._frames)
+            write_chunk(self._fp, FRAME_INDEX_TAG, _index + _TAIL.pack(_VERSION, len(self._frames), self._seq))
+            write_chunk(self._fp, b'IEND')
+            self._fp.seek(self._actl_pos)
+            write_chunk(self._fp, b'acTL', _ACTL.pack(len(self._frames), 0))
+        self._fp.close()
+        self._fp = None
+
+    def _start(self, matrix, width, height):
+        """Create the file and write the header, ahead of the first frame"""
+        self._fp = open(self._filename, 'w+b')
+        self._t._setminmax(matrix)
+        self._size = (width, height)
+        _chunks = [(b'acTL', _ACTL.pack(0, 0))]
+        if self._t.mode == 'P':
+            _chunks += self._t._palette_chunks()
+        _chunks += self._t._metadata_chunks()
+        write_header(self._fp, width, height, self._t.bitdepth, COLOR_TYPES[self._t.mode], _chunks)
+        # acTL comes right after the signature and IHDR
+        self._actl_pos = 8 + 25
+
+    def _reopen(self):
+        """Pick up an existing file where it left off"""
+        _chunks = {}
+        _meta = _read_metadata(self._fp, _chunks)
+        if b'acTL' not in _chunks:
+            raise ValueError('Not an animated PNG.')
+        self._t._configure_from(_meta)
+        self._size = (_meta.width, _meta.height)
+        self._actl_pos = _chunks[b'acTL'][0]
+        _index_pos, self._frames, self._seq = _read_frame_index(self._fp)
+        self._prev = _frame_samples(self._fp, self._frames, len(self._frames) - 1, _meta)
+        # New frames go where the index was
+        self._fp.seek(_index_pos)
+        self._fp.truncate()
+
+
+def read_frame(filename, k, x_axis_first=True):
+    """Read one frame of an animated PNG written by APNGWriter
+
+    Only the frames from the last keyframe at or before k are decoded.
+    :param filename: File name
+    :param k: Frame number (negative numbers count from the end)
+    :param x_axis_first: Whether the x axis should be the first axis in the 2-D array
+    :return: dict of matrix information, as from MatrixPNG.png2matrix, with "frame" and "frames"
+    """
+    with open(filename, 'rb') as fp:
+        _meta = _read_metadata(fp)
+        _, _frames, _ = _read_frame_index(fp)
+        if k < 0:
+            k += len(_frames)
+        if not 0 <= k < len(_frames):
+            raise ValueError('Frame ' + str(k) + ' is out of range.')
+        _samples = _frame_samples(fp, _frames, k, _meta)
+    _t = MatrixPNG()
+    _t._configure_from(_meta)
+    m = _t._color_to_z_value(_samples)
+    # Undo the orientation changes made by matrix2png
+    if _t._y_invert:
+        m = np.flipud(m)
+    if x_axis_first:
+        m = np.transpose(m)
+    r = dict(_t._scale)
+    r["matrix"] = np.ascontiguousarray(m)
+    r["colormap"] = _t._colormap
+    r["y_ascend_up"] = _t._y_invert
+    r["frame"] = k
+    r["frames"] = len(_frames)
+    return r
+
+
+def _read_frame_index(fp):
+    """Read the frame index from the end of a file
+
+    :param fp: File pointer, opened in binary mode (seekable)
+    :return: tuple of (position of the index chunk, list of (fcTL position, keyframe), next sequence number)
+    """
+    # The index is the chunk just before IEND, and ends with its own length
+    fp.seek(0, 2)
+    _end = fp.tell() - 12
+    fp.seek(_end - 4 - _TAIL.size)
+    _version, _count, _seq = _TAIL.unpack(fp.read(_TAIL.size))
+    _length = _count * _ENTRY.size + _TAIL.size
+    _pos = _end - 12 - _length
+    if _version != _VERSION or _pos < 0:
+        raise ValueError('No frame index found.')
+    fp.seek(_pos)
+    _head = fp.read(8)
+    _data = fp.read(_length)
+    _crc = struct.unpack("!I", fp.read(4))[0]
+    if _head != struct.pack("!I4s", _length, FRAME_INDEX_TAG) or \
+            zlib.crc32(_data, zlib.crc32(FRAME_INDEX_TAG)) & 0xffffffff != _crc:
+        raise ValueError('No frame index found.')
+    _frames = [_ENTRY.unpack_from(_data, n * _ENTRY.size) for n in range(_count)]
+    return _pos, [(p, bool(k)) for p, k in _frames], _seq
+
+
+def _frame_samples(fp, frames, k, meta):
+    """Rebuild the whole image of frame k, from the last keyframe at or before it
+
+    :return: numpy.ndarray (rows x cols x planes) of samples
+    """
+    _start = max(n for n in range(k + 1) if frames[n][1])
+    _planes = 1 if meta.mode == 'P' else len(meta.mode)
+    _image = None
+    for n in range(_start, k + 1):
+        x0, y0, _sub = _read_frame_rect(fp, frames[n][0], _planes, meta.bitdepth)
+        if _image is None:
+            _image = _sub
+        else:
+            _image[y0:y0 + len(_sub), x0:x0 + _sub.shape[1]] = _sub
+    return _image
+
+
+def _read_frame_rect(fp, pos, planes, bitdepth):
+    """Decode the rectangle of one frame
+
+    :return: tuple of (x offset, y offset, numpy.ndarray (rows x cols x planes) of samples)
+    """
+    fp.seek(pos)
+    _length = struct.unpack("!I4s", fp.read(8))[0]
+    _, _width, _height, x0, y0 = _FCTL.unpack(fp.read(_length + 4)[:_FCTL.size])[:5]
+    # Collect the frame's data chunks
+    _decompressor = zlib.decompressobj()
+    _bytes = bytearray()
+    while True:
+        _head = fp.read(8)
+        if len(_head) < 8:
+            break
+        _length, _tag = struct.unpack("!I4s", _head)
+        if _tag not in (b'IDAT', b'fdAT'):
+            break
+        _data = fp.read(_length)
+        fp.seek(4, 1)
+        # fdAT chunks start with a sequence number
+        _bytes += _decompressor.decompress(_data[4:] if _tag == b'fdAT' else _data)
+    _bpp = planes * bitdepth // 8
+    _lines = np.frombuffer(bytes(_bytes), dtype=np.uint8).reshape(_height, 1 + _width * _bpp)
+    _samples = bytes_to_samples(unfilter_scanlines(_lines, _bpp), bitdepth)
+    return x0, y0, _samples.reshape(_height, _width, planes)
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""Encode and decode from asyncio code without blocking the event loop
+
+The canonical source for this package is https://github.com/finitemobius/matrixpng-py
+The work runs on an executor (the event loop's default one unless another is given),
+through the stateless encode() and decode(), and so does all blocking file I/O.
+Files are read a chunk at a time, so the loop stays responsive and a read can stop between chunks.
+aencode_stream() hands back the PNG as it is written, a chunk of bytes at a time,
+so a response can start going out before the image is fully compressed.
+Cancelling an encode stops it at its next write and waits for the worker to finish;
+a partly written file is removed.
+A decode is stopped between reads; once the image itself is being decoded, that runs to the end
+in its worker and the result is dropped.
+"""
+
+import io
+import os
+import asyncio
+import inspect
+import threading
+from ._codec import encode, decode
+from ._pngMetadata import read_metadata
+
+__author__ = "Finite Mobius, LLC"
+__credits__ = ["Jason R. Miller"]
+__license__ = "MIT"
+__version__ = "alpha"
+__maintainer__ = "Finite Mobius, LLC"
+__email__ = "jason@finitemobius.com"
+__status__ = "Development"
+
+# Bytes per chunk read from a file, or handed out by aencode_stream()
+CHUNK_SIZE = 2 ** 16
+# Chunks aencode_stream() lets the encoder get ahead of the reader by
+_QUEUE_CHUNKS = 4
+
+
+class _Cancelled(Exception):
+    """Raised in the worker thread to stop an encode that was cancelled"""
+
+
+class _CancellableFile:
+    """A file the encoder writes to, which stops the encode once it is cancelled"""
+
+    def __init__(self, fp, cancelled):
+        """Constructor
+
+        :param fp: File pointer, opened in binary mode
+        :param cancelled: threading.Event, set when the encode is cancelled
+        """
+        self._fp = fp
+        self._cancelled = cancelled
+
+    def write(self, data):
+        if self._cancelled.is_set():
+            raise _Cancelled()
+        return self._fp.write(data)
+
+    def seekable(self):
+        return self._fp.seekable()
+
+    def seek(self, *args):
+        return self._fp.seek(*args)
+
+    def tell(self):
+        return self._fp.tell()
+
+    def read(self, *args):
+        return self._fp.read(*args)
+
+
+class _QueueWriter:
+    """A file the encoder writes to from its worker thread, which hands chunks of bytes to the event loop
+
+    Writes wait while the queue is full, so the encoder never gets far ahead of the reader.
+    """
+
+    def __init__(self, loop, queue, cancelled, chunk_size=CHUNK_SIZE):
+        """Constructor
+
+        :param loop: The event loop reading the queue
+        :param queue: asyncio.Queue to put chunks in (None marks the end)
+        :param cancelled: threading.Event, set when the encode is cancelled
+        :param chunk_size: Bytes to collect before handing them over
+        """
+        self._loop = loop
+        self._queue = queue
+        self._cancelled = cancelled
+        self._chunk_size = chunk_size
+        self._data = bytearray()
+        self._count = 0
+
+    def write(self, data):
+        if self._cancelled.is_set():
+            raise _Cancelled()
+        self._data += data
+        self._count += len(data)
+        while len(self._data) >= self._chunk_size:
+            self._put(bytes(self._data[:self._chunk_size]))
+            del self._data[:self._chunk_size]
+        return len(data)
+
+    def seekable(self):
+        # The band index needs to go back and fill itself in, so it is refused (see write_idat_indexed)
+        return False
+
+    def tell(self):
+        return self._count
+
+    def close(self):
+        """Hand over what is left, and mark the end"""
+        if self._data:
+            self._put(bytes(self._data))
+            self._data = bytearray()
+        self.end()
+
+    def end(self):
+        """Mark the end (unless the reader has gone)"""
+        if not self._cancelled.is_set():
+            self._put(None)
+
+    def _put(self, item):
+        """Put an item in the queue, waiting for room"""
+        if self._cancelled.is_set():
+            raise _Cancelled()
+        asyncio.run_coroutine_threadsafe(self._queue.put(item), self._loop).result()
+
+
+async def aencode(matrix, file, config=None, x_axis_first=True, memory_budget=None, range_sample=None,
+                  executor=None):
+    """Build a PNG file from a matrix on an executor (see encode)
+
+    :param matrix: 2-D numpy.ndarray, numpy.memmap, sliceable array, or .npy file name
+    :param file: File name (string) to write
+    :param config: MatrixPNGConfig (default = MatrixPNG defaults)
+    :param x_axis_first: Whether the x axis is the first axis in the 2-D array
+    :param memory_budget: Approximate working memory per band, in bytes (default = 64 MiB)
+    :param range_sample: Fraction of the matrix to read for the z range (default = all of it)
+    :param executor: concurrent.futures.Executor to run on (default = the event loop's default executor)
+    :return: dict of the scale information written
+    """
+    _cancelled = threading.Event()
+
+    def _run():
+        with open(file, 'wb') as fp:
+            return encode(matrix, _CancellableFile(fp, _cancelled), config, x_axis_first=x_axis_first,
+                          memory_budget=memory_budget, range_sample=range_sample)
+
+    _future = asyncio.get_running_loop().run_in_executor(executor, _run)
+    try:
+        # Shielded, so a cancel leaves the worker's future for us to wait on
+        return await asyncio.shield(_future)
+    except asyncio.CancelledError:
+        _cancelled.set()
+        await asyncio.wait([_future])
+        # Remove what was written, unless the encode finished first
+        if _future.exception() is not None:
+            try:
+                os.remove(file)
+            except OSError:
+                pass
+        raise
+
+
+async def aencode_stream(matrix, config=None, x_axis_first=True, memory_budget=None, range_sample=None,
+                         executor=None, chunk_size=CHUNK_SIZE):
+    """Build a PNG from a matrix on an executor, handing back its bytes as they are written
+
+    The band index (index_rows) needs a seekable file, so it can't be used here.
+    :param matrix: 2-D numpy.ndarray, numpy.memmap, sliceable array, or .npy file name
+    :param config: MatrixPNGConfig (default = MatrixPNG defaults)
+    :param x_axis_first: Whether the x axis is the first axis in the 2-D array
+    :param memory_budget: Approximate working memory per band, in bytes (default = 64 MiB)
+    :param range_sample: Fraction of the matrix to read for the z range (default = all of it)
+    :param executor: concurrent.futures.Executor to run on (default = the event loop's default executor)
+    :param chunk_size: Bytes per chunk (the last one may be shorter)
+    :return: async generator of bytes
+    """
+    _loop = asyncio.get_running_loop()
+    _queue = asyncio.Queue(_QUEUE_CHUNKS)
+    _cancelled = threading.Event()
+    _writer = _QueueWriter(_loop, _queue, _cancelled, chunk_size)
+
+    def _run():
+        try:
+            encode(matrix, _writer, config, x_axis_first=x_axis_first, memory_budget=memory_budget,
+                   range_sample=range_sample)
+        except BaseException:
+            # Stop the reader waiting for chunks
+            _writer.end()
+            raise
+        _writer.close()
+
+    _future = _loop.run_in_executor(executor, _run)
+    try:
+        while True:
+            _data = await _queue.get()
+            if _data is None:
+                break
+            yield _data
+        # Raise the encoder's error, if it had one
+        await _future
+    finally:
+        if not _future.done():
+            # Stop the encoder, and make room in the queue in case it is waiting for some
+            _cancelled.set()
+            while not _queue.empty():
+                _queue.get_nowait()
+            await asyncio.wait([_future])
+            # (It stopped with _Cancelled, which nobody needs to see)
+            _future.exception()
+
+
+async def adecode(file, x_axis_first=True, exact=False, engine="numpy", executor=None):
+    """Build a matrix from a PNG on an executor (see decode)
+
+    :param file: File name, bytes, file pointer opened in binary mode,
+                 or an asyncio reader (such as asyncio.StreamReader) with a coroutine read(n)
+    :param x_axis_first: Whether the x axis should be the first axis in the 2-D array
+    :param exact: Return the exact values stored with the image, rather than the quantized ones
+    :param engine: PNG decoder, 'numpy' or 'pypng' (default = 'numpy')
+    :param executor: concurrent.futures.Executor to run on (default = the event loop's default executor)
+    :return: dict of matrix information
+    """
+    _data = await _read_all(file, executor)
+    return await asyncio.get_running_loop().run_in_executor(
+        executor, lambda: decode(io.BytesIO(_data), x_axis_first=x_axis_first, exact=exact, engine=engine))
+
+
+async def aread_metadata(file, executor=None):
+    """Read the matrix metadata of a PNG on an executor (see read_metadata)
+
+    Only the start of the file is read.
+    :param file: File name or file pointer (opened in binary mode)
+    :param executor: concurrent.futures.Executor to run on (default = the event loop's default executor)
+    :return: MatrixMetadata
+    """
+    return await asyncio.get_running_loop().run_in_executor(executor, read_metadata, file)
+
+
+async def _read_all(file, executor=None):
+    """Read a whole file a chunk at a time, without blocking the event loop
+
+    :param file: File name, bytes, file pointer, or asyncio reader (see adecode)
+    :param executor: concurrent.futures.Executor for blocking reads
+    :return: bytes
+    """
+    if isinstance(file, (bytes, bytearray, memoryview)):
+        return bytes(file)
+    _loop = asyncio.get_running_loop()
+    if isinstance(file, str):
+        _fp = await _loop.run_in_executor(executor, open, file, 'rb')
+        try:
+            return await _read_all(_fp, executor)
+        finally:
+            _fp.close()
+    _data = bytearray()
+    while True:
+        if inspect.iscoroutinefunction(file.read):
+            _chunk = await file.read(CHUNK_SIZE)
+        else:
+            _chunk = await _loop.run_in_executor(executor, file.read, CHUNK_SIZE)
+        if not _chunk:
+            return bytes(_data)
+        _data += _chunk
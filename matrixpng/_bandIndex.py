@@ -0,0 +1,395 @@
+#!/usr/bin/env python3
+"""Random access to bands of rows in a PNG
+
+The canonical source for this package is https://github.com/finitemobius/matrixpng-py
+The image data is compressed with a full flush every few rows, which resets the compressor,
+and each of these segments starts a new IDAT chunk.
+A private chunk before the image data (mpIX) records the first row of each segment and where it starts,
+so a reader can inflate just the segments it needs.
+The first row of each segment uses a filter that does not look at the row above,
+so segments can also be unfiltered on their own.
+Other PNG readers ignore mpIX and see an ordinary zlib stream.
+mpIX is marked unsafe to copy, so editors that change the image data drop it rather than keep a stale index.
+"""
+
+import bisect
+import struct
+import zlib
+import numpy as np
+from ._pngEncoder import write_chunk, pack_scanlines, sample_bytes
+from ._pngDecoder import unfilter_scanlines
+from ._parallel import zlib_header, adler32_replace
+
+__author__ = "Finite Mobius, LLC"
+__credits__ = ["Jason R. Miller"]
+__license__ = "MIT"
+__version__ = "alpha"
+__maintainer__ = "Finite Mobius, LLC"
+__email__ = "jason@finitemobius.com"
+__status__ = "Development"
+
+# The chunk type of the band index
+INDEX_TAG = b'mpIX'
+# Bump this when the index layout changes
+_VERSION = 1
+# Version, rows per segment, number of segments
+_HEAD = struct.Struct("!BII")
+# First row of a segment, and the offset of its first IDAT chunk from the start of the mpIX chunk
+_ENTRY = struct.Struct("!IQ")
+# Filters for the first row of a segment, which may not depend on the row above
+_FIRST_ROW_FILTERS = {
+    "none": "none",
+    "sub": "sub",
+    "up": "none",
+    "average": "sub",
+    "paeth": "sub",
+    "adaptive": "sub"
+}
+# Deflate blocks that hold no data, for padding a rewritten segment to the space it had
+# (an empty stored block, and the same block marked as the last one in the stream)
+_EMPTY_BLOCK = b'\x00\x00\x00\xff\xff'
+_FINAL_BLOCK = b'\x01\x00\x00\xff\xff'
+# Bytes to copy at once when moving the end of the file
+_COPY_SIZE = 2 ** 20
+
+
+def pack_index(index_rows, entries):
+    """Build the data of an mpIX chunk
+
+    :param index_rows: Rows per segment
+    :param entries: list of (first row, offset) tuples, one per segment
+    :return: bytes
+    """
+    return _HEAD.pack(_VERSION, index_rows, len(entries)) + b''.join(_ENTRY.pack(*e) for e in entries)
+
+
+def parse_index(data):
+    """Read the data of an mpIX chunk
+
+    :param data: Chunk data (bytes)
+    :return: tuple of (rows per segment, list of (first row, offset) tuples), or None if the index is not usable
+    """
+    if len(data) < _HEAD.size:
+        return None
+    _version, _rows, _count = _HEAD.unpack_from(data)
+    if _version != _VERSION or len(data) != _HEAD.size + _count * _ENTRY.size:
+        return None
+    _entries = [_ENTRY.unpack_from(data, _HEAD.size + n * _ENTRY.size) for n in range(_count)]
+    # An offset of 0 means the index was never filled in (the write did not finish)
+    if not _entries or any(e[1] == 0 for e in _entries):
+        return None
+    return _rows, _entries
+
+
+def write_idat_indexed(fp, bands, bpp, height, index_rows, level=-1, strategy=zlib.Z_DEFAULT_STRATEGY,
+                       method="none", chunk_limit=2 ** 20):
+    """Filter, compress, and write bands of rows as IDAT chunks, with a band index before them
+
+    The index is written first with empty offsets, then filled in once the image data is written,
+    so the file must be seekable.
+    :param fp: File pointer, opened in binary mode
+    :param bands: iterable of numpy.ndarray bands (rows x (cols * channels)), top to bottom
+    :param bpp: Bytes per complete pixel
+    :param height: Image height
+    :param index_rows: Rows per segment
+    :param level: zlib compression level (default = zlib's default)
+    :param strategy: zlib compression strategy (default = zlib's default)
+    :param method: Filter name (see FILTERS), or "adaptive"
+    :param chunk_limit: Compressed bytes to collect before writing an IDAT chunk
+    """
+    if not fp.seekable():
+        raise ValueError('The band index needs a seekable file.')
+    _count = -(-height // index_rows)
+    _index_pos = fp.tell()
+    write_chunk(fp, INDEX_TAG, pack_index(index_rows, [(0, 0)] * _count))
+    write_chunk(fp, b'IDAT', zlib_header(level, strategy))
+    # A raw deflate stream; the zlib header and trailer are written separately
+    _compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS, zlib.DEF_MEM_LEVEL, strategy)
+    _adler = zlib.adler32(b'')
+    _data = bytearray()
+    _entries = []
+    _row = 0
+    # The last unfiltered row written
+    _prev = None
+    for b in bands:
+        _start = 0
+        while _start < len(b):
+            if _row % index_rows == 0:
+                if _row > 0:
+                    # End the segment before on a byte boundary, with nothing left for later data to refer to
+                    _data += _compressor.flush(zlib.Z_FULL_FLUSH)
+                    write_chunk(fp, b'IDAT', bytes(_data))
+                    _data = bytearray()
+                _entries.append((_row, fp.tell() - _index_pos))
+                # The first row of the segment doesn't look at the row above
+                _lines = pack_scanlines(b[_start:_start + 1], bpp=bpp, prev=None,
+                                        method=_FIRST_ROW_FILTERS[method] if _row > 0 else method)
+                _prev = sample_bytes(b[_start:_start + 1])[0]
+                _start += 1
+                _row += 1
+            else:
+                # The rest of the segment (or of this band, if it ends first)
+                _stop = min(len(b), _start + index_rows - _row % index_rows)
+                _lines = pack_scanlines(b[_start:_stop], bpp=bpp, prev=_prev, method=method)
+                _prev = sample_bytes(b[_stop - 1:_stop])[0]
+                _row += _stop - _start
+                _start = _stop
+            _data += _compressor.compress(_lines)
+            _adler = zlib.adler32(_lines, _adler)
+            if len(_data) >= chunk_limit:
+                write_chunk(fp, b'IDAT', bytes(_data))
+                _data = bytearray()
+    _data += _compressor.flush(zlib.Z_FINISH)
+    write_chunk(fp, b'IDAT', bytes(_data))
+    # The stream trailer
+    write_chunk(fp, b'IDAT', struct.pack("!I", _adler))
+    # Fill in the index
+    _end = fp.tell()
+    fp.seek(_index_pos)
+    write_chunk(fp, INDEX_TAG, pack_index(index_rows, _entries))
+    fp.seek(_end)
+
+
+def pack_segment(rows, bpp, method, top):
+    """Filter the rows of one segment
+
+    :param rows: numpy.ndarray (rows x bytes per row) of unfiltered uint8
+    :param bpp: Bytes per complete pixel
+    :param method: Filter name (see FILTERS), or "adaptive"
+    :param top: Whether this is the first segment of the image
+    :return: numpy.ndarray (rows x (1 + bytes per row)) of uint8
+    """
+    _lines = np.empty((len(rows), rows.shape[1] + 1), dtype=np.uint8)
+    _lines[:1] = pack_scanlines(rows[:1], bpp=bpp, prev=None, method=method if top else _FIRST_ROW_FILTERS[method])
+    if len(rows) > 1:
+        _lines[1:] = pack_scanlines(rows[1:], bpp=bpp, prev=rows[0], method=method)
+    return _lines
+
+
+def read_rows(fp, index_pos, index, height, row_bytes, bpp, r0, r1):
+    """Read a range of rows using the band index
+
+    Only the segments that hold the rows are read and inflated.
+    :param fp: File pointer, opened in binary mode (seekable)
+    :param index_pos: Position of the mpIX chunk in the file
+    :param index: tuple from parse_index()
+    :param height: Image height
+    :param row_bytes: Bytes per row (without the filter type)
+    :param bpp: Bytes per complete pixel
+    :param r0: First row
+    :param r1: Row after the last row
+    :return: numpy.ndarray ((r1 - r0) x row_bytes) of unfiltered uint8
+    """
+    _, _entries = index
+    if r1 <= r0:
+        return np.empty((0, row_bytes), dtype=np.uint8)
+    _first, _last = _segments(_entries, r0, r1)
+    _blocks = [unfilter_scanlines(_read_segment(fp, index_pos, _entries, k, height, row_bytes), bpp)
+               for k in range(_first, _last + 1)]
+    _rows = np.concatenate(_blocks) if len(_blocks) > 1 else _blocks[0]
+    _skip = r0 - _entries[_first][0]
+    return _rows[_skip:_skip + r1 - r0]
+
+
+def update_rows(fp, index_pos, index, height, row_bytes, bpp, r0, c0, patch, level=-1,
+                strategy=zlib.Z_DEFAULT_STRATEGY, method="none"):
+    """Replace a rectangle of the image, re-encoding only the segments that hold it
+
+    Each rewritten segment is padded out to the space the old one took, if it fits
+    (with empty deflate blocks and empty IDAT chunks, which decoders skip).
+    If not, the rest of the file is moved along, and some slack is left so later updates fit.
+    The Adler-32 of the image data, the IDAT CRCs, and the index are brought up to date.
+    :param fp: File pointer, opened for reading and writing in binary mode (seekable)
+    :param index_pos: Position of the mpIX chunk in the file
+    :param index: tuple from parse_index()
+    :param height: Image height
+    :param row_bytes: Bytes per row (without the filter type)
+    :param bpp: Bytes per complete pixel
+    :param r0: First row of the rectangle
+    :param c0: First byte column of the rectangle
+    :param patch: numpy.ndarray (rows x bytes) of uint8, the new unfiltered bytes
+    :param level: zlib compression level (default = zlib's default)
+    :param strategy: zlib compression strategy (default = zlib's default)
+    :param method: Filter name (see FILTERS), or "adaptive"
+    """
+    _rows_per_segment, _entries = index
+    r1 = r0 + len(patch)
+    if r1 <= r0 or patch.shape[1] == 0:
+        return
+    _first, _last = _segments(_entries, r0, r1)
+    # Where the segments start and end, and where the stream trailer is
+    _trailer = _find_trailer(fp, index_pos + _entries[-1][1])
+    _start = index_pos + _entries[_first][1]
+    _end = index_pos + _entries[_last + 1][1] if _last + 1 < len(_entries) else _trailer
+    fp.seek(_trailer + 8)
+    _adler = struct.unpack("!I", fp.read(4))[0]
+    # Re-encode the segments
+    _pieces = []
+    for k in range(_first, _last + 1):
+        _old = _read_segment(fp, index_pos, _entries, k, height, row_bytes)
+        _rows = unfilter_scanlines(_old, bpp)
+        # The part of the rectangle in this segment
+        _top = max(r0, _entries[k][0])
+        _bottom = min(r1, _entries[k][0] + len(_rows))
+        _rows[_top - _entries[k][0]:_bottom - _entries[k][0], c0:c0 + patch.shape[1]] = patch[_top - r0:_bottom - r0]
+        _lines = pack_segment(_rows, bpp, method, k == 0)
+        _adler = adler32_replace(_adler, _old, _lines, _entries[k][0] * (row_bytes + 1), height * (row_bytes + 1))
+        _compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS, zlib.DEF_MEM_LEVEL, strategy)
+        _pieces.append(_compressor.compress(_lines) + _compressor.flush(zlib.Z_FULL_FLUSH))
+    # Pad out to the old space if we can; otherwise take more, with some slack
+    # (The padding, and the end of the stream, go in IDAT chunks of their own after the last piece)
+    _size = sum(_chunked_size(len(p)) for p in _pieces)
+    _is_end = _last + 1 == len(_entries)
+    _padding = _padding_for(_end - _start - _size, _is_end)
+    if _padding is None:
+        _spare = max(_end - _start - _size, 64, _size // 8)
+        while _padding_for(_spare, _is_end) is None:
+            _spare += 1
+        _padding = _padding_for(_spare, _is_end)
+        _shift = _size + _spare - (_end - _start)
+        _move(fp, _end, _shift)
+    else:
+        _shift = 0
+    _blocks, _empty_chunks = _padding
+    # Write the segments, then the new trailer and index
+    fp.seek(_start)
+    for n, p in enumerate(_pieces):
+        _entries[_first + n] = (_entries[_first + n][0], fp.tell() - index_pos)
+        _write_chunked(fp, p)
+    if _blocks or _is_end:
+        _write_chunked(fp, _EMPTY_BLOCK * _blocks + (_FINAL_BLOCK if _is_end else b''))
+    for _ in range(_empty_chunks):
+        write_chunk(fp, b'IDAT')
+    for k in range(_last + 1, len(_entries)):
+        _entries[k] = (_entries[k][0], _entries[k][1] + _shift)
+    fp.seek(_trailer + _shift)
+    write_chunk(fp, b'IDAT', struct.pack("!I", _adler))
+    fp.seek(index_pos)
+    write_chunk(fp, INDEX_TAG, pack_index(_rows_per_segment, _entries))
+
+
+def _segments(entries, r0, r1):
+    """The first and last segments that hold rows r0 to r1 - 1"""
+    _starts = [e[0] for e in entries]
+    return bisect.bisect_right(_starts, r0) - 1, bisect.bisect_right(_starts, r1 - 1) - 1
+
+
+def _read_segment(fp, index_pos, entries, k, height, row_bytes):
+    """Read and inflate one segment
+
+    :return: numpy.ndarray (rows x (1 + row_bytes)) of filtered uint8 scanlines
+    """
+    if k + 1 < len(entries):
+        _stop_row, _stop_pos = entries[k + 1][0], index_pos + entries[k + 1][1]
+    else:
+        _stop_row, _stop_pos = height, None
+    _n = _stop_row - entries[k][0]
+    _lines = zlib.decompressobj(-zlib.MAX_WBITS).decompress(
+        _read_idat(fp, index_pos + entries[k][1], _stop_pos), _n * (row_bytes + 1))
+    if len(_lines) != _n * (row_bytes + 1):
+        raise ValueError('The band index does not match the image data.')
+    return np.frombuffer(_lines, dtype=np.uint8).reshape(_n, -1)
+
+
+def _find_trailer(fp, start):
+    """Find the last IDAT chunk (the one holding the stream trailer)
+
+    :param fp: File pointer, opened in binary mode (seekable)
+    :param start: Position of an IDAT chunk at or before the last one
+    :return: Position of the last IDAT chunk
+    """
+    fp.seek(start)
+    _pos = None
+    _last_length = None
+    while True:
+        _head = fp.read(8)
+        if len(_head) < 8:
+            break
+        _length, _tag = struct.unpack("!I4s", _head)
+        if _tag != b'IDAT':
+            break
+        _pos = fp.tell() - 8
+        _last_length = _length
+        fp.seek(_length + 4, 1)
+    # The trailer is the four-byte Adler-32
+    if _last_length != 4:
+        raise ValueError('The band index does not match the image data.')
+    return _pos
+
+
+def _chunked_size(length, chunk_limit=2 ** 20):
+    """Bytes taken by length bytes of data written with _write_chunked()"""
+    return length + 12 * max(1, -(-length // chunk_limit))
+
+
+def _write_chunked(fp, data, chunk_limit=2 ** 20):
+    """Write data as IDAT chunks of at most chunk_limit bytes"""
+    for n in range(0, max(1, len(data)), chunk_limit):
+        write_chunk(fp, b'IDAT', data[n:n + chunk_limit])
+
+
+def _padding_for(size, is_end=False, chunk_limit=2 ** 20):
+    """Split padding into empty deflate blocks (5 bytes each) and empty IDAT chunks (12 bytes each)
+
+    The blocks (and the final block, if the padding ends the stream) are written with _write_chunked(),
+    so the chunks that hold them count towards the size too; with no blocks to write, none is needed.
+    :param size: Bytes of padding needed
+    :param is_end: Whether the padding ends the deflate stream (with _FINAL_BLOCK)
+    :param chunk_limit: As for _write_chunked()
+    :return: tuple of (blocks, empty chunks), or None if size can't be made from them
+    """
+    _final = len(_FINAL_BLOCK) if is_end else 0
+    # (Five more empty chunks cover every remainder, even where the blocks need one more chunk)
+    for _chunks in range(10):
+        _rest = size - 12 * _chunks
+        if _rest == 0 and not is_end:
+            # No blocks, and no chunk to hold them
+            return 0, _chunks
+        # Only one number of chunks can hold the rest of the padding
+        _data = _rest - 12 * max(1, -(-_rest // (chunk_limit + 12)))
+        if _data >= _final and (_data - _final) % len(_EMPTY_BLOCK) == 0 and \
+                _chunked_size(_data, chunk_limit) == _rest:
+            if _data == 0:
+                # The chunk that would hold the blocks is just another empty chunk
+                return 0, _chunks + 1
+            return (_data - _final) // len(_EMPTY_BLOCK), _chunks
+    return None
+
+
+def _move(fp, start, shift):
+    """Move everything from start to the end of the file along by shift bytes (shift > 0)"""
+    fp.seek(0, 2)
+    _pos = fp.tell()
+    # Copy from the end backwards, so nothing is overwritten before it is moved
+    while _pos > start:
+        _n = min(_COPY_SIZE, _pos - start)
+        _pos -= _n
+        fp.seek(_pos)
+        _data = fp.read(_n)
+        fp.seek(_pos + shift)
+        fp.write(_data)
+
+
+def _read_idat(fp, start, stop=None):
+    """Collect the data of consecutive IDAT chunks
+
+    :param fp: File pointer, opened in binary mode (seekable)
+    :param start: Position of the first IDAT chunk
+    :param stop: Position to stop at (default = the end of the IDAT chunks)
+    :return: bytes
+    """
+    fp.seek(start)
+    _data = bytearray()
+    while stop is None or fp.tell() < stop:
+        _head = fp.read(8)
+        if len(_head) < 8:
+            break
+        _length, _tag = struct.unpack("!I4s", _head)
+        if _tag != b'IDAT':
+            break
+        _chunk = fp.read(_length)
+        _crc = struct.unpack("!I", fp.read(4))[0]
+        if zlib.crc32(_chunk, zlib.crc32(_tag)) & 0xffffffff != _crc:
+            raise ValueError('Chunk IDAT has a bad CRC.')
+        _data += _chunk
+    return bytes(_data)
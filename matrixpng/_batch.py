@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""Convert many matrices at once on a pool of processes
+
+The canonical source for this package is https://github.com/finitemobius/matrixpng-py
+Each worker process builds its MatrixPNG (and color tables) once.
+Matrices travel to the workers as memory-mapped .npy files rather than being pickled;
+numpy.memmap inputs are passed by file name and not copied at all.
+Only a few items are in flight at a time, so the input iterable is never fully materialized.
+"""
+
+import os
+import mmap
+import shutil
+import tempfile
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+import numpy as np
+from . import MatrixPNG
+from ._matrixBlocks import open_matrix
+
+__author__ = "Finite Mobius, LLC"
+__credits__ = ["Jason R. Miller"]
+__license__ = "MIT"
+__version__ = "alpha"
+__maintainer__ = "Finite Mobius, LLC"
+__email__ = "jason@finitemobius.com"
+__status__ = "Development"
+
+# The MatrixPNG each worker process copies for every item
+_template = None
+
+
+def _init_worker(config):
+    """Set up a worker process
+
+    :param config: dict of MatrixPNG constructor arguments
+    """
+    global _template
+    _template = MatrixPNG(**config)
+
+
+def _share(matrix, tmpdir, n):
+    """Describe a matrix so a worker process can map it
+
+    :param matrix: 2-D numpy.ndarray, numpy.memmap, sliceable array, or .npy file name
+    :param tmpdir: Directory for temporary .npy files
+    :param n: Item number (for the file name)
+    :return: tuple of (source description, temporary file name or None)
+    """
+    # A .npy file can be mapped as it is
+    if isinstance(matrix, str):
+        return ("npy", matrix), None
+    # A memmap is already on disk; just tell the worker where
+    # (Views of a memmap don't own their mapping, so those are copied like any other array)
+    if isinstance(matrix, np.memmap) and isinstance(matrix.base, mmap.mmap):
+        _order = "F" if matrix.flags.f_contiguous and not matrix.flags.c_contiguous else "C"
+        return ("memmap", matrix.filename, matrix.dtype.str, matrix.shape, matrix.offset, _order), None
+    # Anything else is written once to a .npy file that the worker maps
+    _name = os.path.join(tmpdir, "matrix" + str(n) + ".npy")
+    matrix = open_matrix(matrix)
+    _m = np.lib.format.open_memmap(_name, mode="w+", dtype=matrix.dtype, shape=matrix.shape)
+    _m[...] = matrix
+    _m.flush()
+    del _m
+    return ("npy", _name), _name
+
+
+def _open(source):
+    """Map a matrix described by _share()
+
+    :param source: Source description
+    :return: numpy.ndarray (read-only)
+    """
+    if source[0] == "npy":
+        return np.load(source[1], mmap_mode="r")
+    _, _filename, _dtype, _shape, _offset, _order = source
+    return np.memmap(_filename, dtype=_dtype, mode="r", offset=_offset, shape=_shape, order=_order)
+
+
+def _encode_item(source, path, x_axis_first):
+    """Encode one matrix in a worker process"""
+    _template._copy().matrix2png(_open(source), path, x_axis_first=x_axis_first)
+
+
+def _decode_item(path, x_axis_first):
+    """Decode one PNG in a worker process"""
+    return _template._copy().pngfile2matrix(path, x_axis_first=x_axis_first)
+
+
+def encode_many(items, config=None, workers=None, x_axis_first=True, tmpdir=None):
+    """Encode many matrices to PNG files on a pool of processes
+
+    Results come back in input order, one per item, as (path, error);
+    error is None on success, or the exception that item raised.
+    :param items: iterable of (matrix, path) tuples
+    :param config: dict of MatrixPNG constructor arguments (default = MatrixPNG defaults)
+    :param workers: Number of processes (default = os.cpu_count())
+    :param x_axis_first: Whether the x axis is the first axis in each 2-D array
+    :param tmpdir: Directory for temporary .npy files (default = the system temp dir; '/dev/shm' keeps them in RAM)
+    :return: generator of (path, error) tuples
+    """
+    workers = workers or os.cpu_count()
+    _tmp = tempfile.mkdtemp(prefix="matrixpng", dir=tmpdir)
+    try:
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(config or {},)) as _pool:
+            _pending = deque()
+            for n, (m, p) in enumerate(items):
+                try:
+                    _source, _name = _share(m, _tmp, n)
+                    _future = _pool.submit(_encode_item, _source, p, x_axis_first)
+                except Exception as e:
+                    # Report this item's error in order, like any other
+                    _name = None
+                    _future = Future()
+                    _future.set_exception(e)
+                _pending.append((p, _name, _future))
+                # Backpressure: wait for the oldest item before taking more
+                if len(_pending) >= 2 * workers:
+                    yield _finish_encode(*_pending.popleft())
+            while _pending:
+                yield _finish_encode(*_pending.popleft())
+    finally:
+        shutil.rmtree(_tmp, ignore_errors=True)
+
+
+def _finish_encode(path, name, future):
+    """Wait for an encode and clean up its temporary file
+
+    :return: (path, error) tuple
+    """
+    try:
+        future.result()
+        _error = None
+    except Exception as e:
+        _error = e
+    if name is not None:
+        os.remove(name)
+    return path, _error
+
+
+def decode_many(paths, config=None, workers=None, x_axis_first=True):
+    """Decode many PNG files on a pool of processes
+
+    Results come back in input order, one per path, as (path, result, error);
+    result is the dict from MatrixPNG.png2matrix (None on error),
+    and error is None on success, or the exception that path raised.
+    :param paths: iterable of file names
+    :param config: dict of MatrixPNG constructor arguments (default = MatrixPNG defaults)
+    :param workers: Number of processes (default = os.cpu_count())
+    :param x_axis_first: Whether the x axis should be the first axis in each 2-D array
+    :return: generator of (path, result, error) tuples
+    """
+    workers = workers or os.cpu_count()
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(config or {},)) as _pool:
+        _pending = deque()
+        for p in paths:
+            _pending.append((p, _pool.submit(_decode_item, p, x_axis_first)))
+            # Backpressure: wait for the oldest item before taking more
+            if len(_pending) >= 2 * workers:
+                yield _finish_decode(*_pending.popleft())
+        while _pending:
+            yield _finish_decode(*_pending.popleft())
+
+
+def _finish_decode(path, future):
+    """Wait for a decode
+
+    :return: (path, result, error) tuple
+    """
+    try:
+        return path, future.result(), None
+    except Exception as e:
+        return path, None, e
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""Encode and decode without shared state, for use from many threads at once
+
+The canonical source for this package is https://github.com/finitemobius/matrixpng-py
+A MatrixPNG keeps what it learns from each call: matrix2png() fills in the z range it computed,
+and png2matrix() takes on the scale and color map of the file it read.
+encode() and decode() instead work on a fresh copy of a transformer for every call,
+so nothing carries over between calls and one config can be shared by any number of threads.
+The color tables are built once per process and shared (they are read-only).
+The heavy work is done inside numpy and zlib, which release the GIL,
+so conversions on a thread pool run in parallel.
+"""
+
+import functools
+from collections import namedtuple
+from . import MatrixPNG
+
+__author__ = "Finite Mobius, LLC"
+__credits__ = ["Jason R. Miller"]
+__license__ = "MIT"
+__version__ = "alpha"
+__maintainer__ = "Finite Mobius, LLC"
+__email__ = "jason@finitemobius.com"
+__status__ = "Development"
+
+# The MatrixPNG constructor arguments, and their defaults
+_DEFAULTS = {
+    "mode": "RGB",
+    "bitdepth": 8,
+    "colormap": "ebb",
+    "z_min": None,
+    "z_max": None,
+    "z_units": None,
+    "x_min": None,
+    "x_max": None,
+    "x_units": None,
+    "y_min": None,
+    "y_max": None,
+    "y_units": None,
+    "y_ascend_up": True,
+    "engine": "numpy",
+    "profile": "balanced",
+    "filter": None,
+    "workers": 1,
+    "index_rows": None,
+    "exact": None
+}
+
+MatrixPNGConfig = namedtuple("MatrixPNGConfig", _DEFAULTS.keys(), defaults=_DEFAULTS.values())
+MatrixPNGConfig.__doc__ = """Settings for encode() and decode(), as for the MatrixPNG constructor
+
+Configs can't be changed, so they are safe to share; use _replace() to derive a new one."""
+
+
+@functools.lru_cache(maxsize=64)
+def _template(config):
+    """The transformer every call with a config is copied from
+
+    Building it checks the settings and the color tables once per config.
+    :param config: MatrixPNGConfig
+    :return: MatrixPNG (never used directly)
+    """
+    return MatrixPNG(**config._asdict())
+
+
+def encode(matrix, file, config=None, x_axis_first=True, memory_budget=None, range_sample=None, stats=None):
+    """Build a PNG from a matrix (see MatrixPNG.matrix2png)
+
+    :param matrix: 2-D numpy.ndarray, numpy.memmap, sliceable array, or .npy file name
+    :param file: File name (string) to write
+    :param config: MatrixPNGConfig (default = MatrixPNG defaults)
+    :param x_axis_first: Whether the x axis is the first axis in the 2-D array
+    :param memory_budget: Approximate working memory per band, in bytes (default = 64 MiB)
+    :param range_sample: Fraction of the matrix to read for the z range (default = all of it)
+    :param stats: StageStats to record the time of each stage in (optional)
+    :return: dict of the scale information written (with the z range used for this matrix)
+    """
+    _t = _template(config or MatrixPNGConfig())._copy()
+    _t.matrix2png(matrix, file, x_axis_first=x_axis_first, memory_budget=memory_budget, range_sample=range_sample,
+                  stats=stats)
+    return dict(_t._scale)
+
+
+def decode(fp, x_axis_first=True, exact=False, engine="numpy", stats=None, out=None):
+    """Build a matrix from a PNG (see MatrixPNG.png2matrix)
+
+    :param fp: File name, or file pointer opened in binary mode (which is closed afterward)
+    :param x_axis_first: Whether the x axis should be the first axis in the 2-D array
+    :param exact: Return the exact values stored with the image, rather than the quantized ones
+    :param engine: PNG decoder, 'numpy' or 'pypng' (default = 'numpy')
+    :param stats: StageStats to record the time of each stage in (optional)
+    :param out: numpy.ndarray of floats to write the matrix into (optional; see MatrixPNG.png2matrix)
+    :return: dict of matrix information
+    """
+    _t = _template(MatrixPNGConfig(engine=engine))._copy()
+    if isinstance(fp, str):
+        return _t.pngfile2matrix(fp, x_axis_first=x_axis_first, exact=exact, stats=stats, out=out)
+    return _t.png2matrix(fp, x_axis_first=x_axis_first, exact=exact, stats=stats, out=out)
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""Generate color maps at any bit depth
+
+The canonical source for this package is https://github.com/finitemobius/matrixpng-py
+Control points are interpolated in CIELAB, evenly by perceptual (Lab) distance,
+then rounded to the bit depth. Colors that come out the same after rounding are dropped,
+so every color in a generated map is unique and decodes to exactly one index.
+Generated tables are cached on disk, so each one is only computed once.
+"""
+
+import os
+import tempfile
+import numpy as np
+
+__author__ = "Finite Mobius, LLC"
+__credits__ = ["Jason R. Miller"]
+__license__ = "MIT"
+__version__ = "alpha"
+__maintainer__ = "Finite Mobius, LLC"
+__email__ = "jason@finitemobius.com"
+__status__ = "Development"
+
+# Bump this when the generated colors change, so stale disk caches are ignored
+_VERSION = 1
+# Points sampled along each color map before rounding and dropping repeats
+_SAMPLES = 2 ** 16
+
+# sRGB (D65) to CIE XYZ
+_RGB_TO_XYZ = np.array([
+    [0.4124564, 0.3575761, 0.1804375],
+    [0.2126729, 0.7151522, 0.0721750],
+    [0.0193339, 0.1191920, 0.9503041]
+])
+_XYZ_TO_RGB = np.linalg.inv(_RGB_TO_XYZ)
+# D65 white point
+_WHITE = np.array([0.95047, 1.0, 1.08883])
+
+
+def cache_dir():
+    """The directory generated color maps are cached in
+
+    Set MATRIXPNG_CACHE to override the default (~/.cache/matrixpng, or $XDG_CACHE_HOME/matrixpng).
+    :return: directory name (string)
+    """
+    if os.environ.get("MATRIXPNG_CACHE"):
+        return os.environ["MATRIXPNG_CACHE"]
+    _base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(_base, "matrixpng")
+
+
+def generated_colormap(name, control_points, bd):
+    """Get a generated color map, from the disk cache if possible
+
+    :param name: Color map name (used for the cache file name)
+    :param control_points: sRGB control points, (n x 3) floats from 0 to 1
+    :param bd: bit depth
+    :return: numpy.ndarray (levels x 3) of uint8 or uint16
+    """
+    _file = os.path.join(cache_dir(), name + "_" + str(bd) + "_v" + str(_VERSION) + ".npy")
+    try:
+        return np.load(_file)
+    except (OSError, ValueError):
+        pass
+    _table = generate_colormap(control_points, bd)
+    # Write atomically; a read-only or missing cache just means we generate again next time
+    try:
+        os.makedirs(os.path.dirname(_file), exist_ok=True)
+        _fd, _tmp = tempfile.mkstemp(dir=os.path.dirname(_file), suffix=".npy")
+        with os.fdopen(_fd, 'wb') as fp:
+            np.save(fp, _table)
+        os.replace(_tmp, _file)
+    except OSError:
+        pass
+    return _table
+
+
+def generate_colormap(control_points, bd):
+    """Interpolate control points into a color map with unique colors
+
+    :param control_points: sRGB control points, (n x 3) floats from 0 to 1
+    :param bd: bit depth
+    :return: numpy.ndarray (levels x 3) of uint8 or uint16
+    """
+    _lab = srgb_to_lab(np.asarray(control_points, dtype=float))
+    # Distance along the path through Lab space at each control point
+    _steps = np.linalg.norm(np.diff(_lab, axis=0), axis=1)
+    _keep = np.concatenate([[True], _steps > 0])
+    _lab = _lab[_keep]
+    _dist = np.concatenate([[0.0], np.cumsum(_steps[_steps > 0])])
+    # Sample evenly by perceptual distance
+    _s = np.linspace(0.0, _dist[-1], _SAMPLES)
+    _samples = np.stack([np.interp(_s, _dist, _lab[:, c]) for c in range(3)], axis=-1)
+    _rgb = np.clip(lab_to_srgb(_samples), 0.0, 1.0)
+    _table = np.rint(_rgb * (2 ** bd - 1)).astype(np.uint16 if bd > 8 else np.uint8)
+    # Drop repeated colors, keeping the first occurrence of each, in order
+    _packed = (_table[:, 0].astype(np.uint64) << np.uint64(2 * bd)) | \
+              (_table[:, 1].astype(np.uint64) << np.uint64(bd)) | _table[:, 2]
+    _, _first = np.unique(_packed, return_index=True)
+    return np.ascontiguousarray(_table[np.sort(_first)])
+
+
+def srgb_to_lab(rgb):
+    """Convert sRGB colors to CIELAB
+
+    :param rgb: numpy.ndarray (... x 3) of floats from 0 to 1
+    :return: numpy.ndarray (... x 3) of L*, a*, b*
+    """
+    _linear = np.where(rgb <= 0.04045, rgb / 12.92, ((rgb + 0.055) / 1.055) ** 2.4)
+    _xyz = _linear @ _RGB_TO_XYZ.T / _WHITE
+    _f = np.where(_xyz > (6 / 29.) ** 3, np.cbrt(_xyz), _xyz / (3 * (6 / 29.) ** 2) + 4 / 29.)
+    return np.stack([116 * _f[..., 1] - 16,
+                     500 * (_f[..., 0] - _f[..., 1]),
+                     200 * (_f[..., 1] - _f[..., 2])], axis=-1)
+
+
+def lab_to_srgb(lab):
+    """Convert CIELAB colors to sRGB
+
+    :param lab: numpy.ndarray (... x 3) of L*, a*, b*
+    :return: numpy.ndarray (... x 3) of floats (may fall outside 0 to 1)
+    """
+    _fy = (lab[..., 0] + 16) / 116.
+    _f = np.stack([_fy + lab[..., 1] / 500., _fy, _fy - lab[..., 2] / 200.], axis=-1)
+    _xyz = np.where(_f > 6 / 29., _f ** 3, 3 * (6 / 29.) ** 2 * (_f - 4 / 29.)) * _WHITE
+    _linear = np.clip(_xyz @ _XYZ_TO_RGB.T, 0.0, None)
+    return np.where(_linear <= 0.0031308, 12.92 * _linear, 1.055 * _linear ** (1 / 2.4) - 0.055)
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""Cache decoded matrices, so files that are read again and again are only decoded once
+
+The canonical source for this package is https://github.com/finitemobius/matrixpng-py
+A file is known by its path, size, and modification time (key="stat"),
+or by a hash of its contents (key="hash"), which also finds copies of a file under other names.
+The least recently used matrices are dropped once the cache holds more than max_bytes.
+Matrices come back read-only, since every caller shares the same array.
+With a directory, decoded matrices are also kept there as .npy files (with the rest of the result in .json),
+which any process using the same directory maps rather than decoding the file again.
+Nothing is ever removed from the directory; delete its files to empty it.
+"""
+
+import io
+import os
+import json
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict, namedtuple
+import numpy as np
+from ._codec import decode
+
+__author__ = "Finite Mobius, LLC"
+__credits__ = ["Jason R. Miller"]
+__license__ = "MIT"
+__version__ = "alpha"
+__maintainer__ = "Finite Mobius, LLC"
+__email__ = "jason@finitemobius.com"
+__status__ = "Development"
+
+# Ways to tell files apart
+KEYS = ["stat", "hash"]
+# Bump this when the files in the cache directory change
+_VERSION = 1
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "disk_hits", "misses", "evictions", "entries", "bytes", "max_bytes"])
+CacheInfo.__doc__ = """Decode cache counters
+
+hits are found in memory, disk_hits in the cache directory, and misses are decoded."""
+
+
+class DecodeCache:
+    """A least-recently-used cache of decoded PNG files, bounded by bytes"""
+
+    def __init__(self, max_bytes=256 * 2 ** 20, key="stat", directory=None, engine="numpy"):
+        """Constructor
+
+        :param max_bytes: Bytes of matrices to keep in memory (default = 256 MiB)
+        :param key: How files are told apart: 'stat' (path, size, and modification time) or 'hash' (contents)
+        :param directory: Directory to keep decoded matrices in, for other processes (default = memory only)
+        :param engine: PNG decoder, 'numpy' or 'pypng' (default = 'numpy')
+        """
+        if key not in KEYS:
+            raise ValueError('Key ' + str(key) + ' is unknown.')
+        self._max_bytes = max_bytes
+        self._key = key
+        self._directory = directory
+        self._engine = engine
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._lock = threading.Lock()
+
+    def decode(self, filename, x_axis_first=True, exact=False):
+        """Decode a PNG file, or get it from the cache
+
+        :param filename: File name
+        :param x_axis_first: Whether the x axis should be the first axis in the 2-D array
+        :param exact: Return the exact values stored with the image, rather than the quantized ones
+        :return: dict of matrix information (see MatrixPNG.png2matrix), with a read-only matrix
+        """
+        _data = None
+        if self._key == "stat":
+            _st = os.stat(filename)
+            _id = (os.path.realpath(filename), _st.st_ino, _st.st_size, _st.st_mtime_ns)
+        else:
+            with open(filename, 'rb') as fp:
+                _data = fp.read()
+            _id = hashlib.blake2b(_data, digest_size=20).hexdigest()
+        _key = (_id, bool(x_axis_first), bool(exact))
+        with self._lock:
+            r = self._entries.get(_key)
+            if r is not None:
+                self._entries.move_to_end(_key)
+                self._hits += 1
+                return dict(r)
+        r = self._load(_key)
+        if r is not None:
+            with self._lock:
+                self._disk_hits += 1
+        else:
+            # Decode outside the lock, so other files can be served meanwhile
+            r = decode(filename if _data is None else io.BytesIO(_data), x_axis_first=x_axis_first, exact=exact,
+                       engine=self._engine)
+            r["matrix"] = _read_only(r["matrix"])
+            self._store(_key, r)
+            with self._lock:
+                self._misses += 1
+        self._add(_key, r)
+        return dict(r)
+
+    def cache_info(self):
+        """The cache counters
+
+        :return: CacheInfo
+        """
+        with self._lock:
+            return CacheInfo(self._hits, self._disk_hits, self._misses, self._evictions, len(self._entries),
+                             self._bytes, self._max_bytes)
+
+    def clear(self):
+        """Drop everything held in memory (the cache directory is left alone)"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _add(self, key, r):
+        """Keep a result in memory, dropping the least recently used ones to make room"""
+        _n = r["matrix"].nbytes
+        if _n > self._max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = r
+            self._bytes += _n
+            while self._bytes > self._max_bytes:
+                _, _old = self._entries.popitem(last=False)
+                self._bytes -= _old["matrix"].nbytes
+                self._evictions += 1
+
+    def _path(self, key):
+        """The cache directory file name for a key, without the extension"""
+        _name = hashlib.blake2b(repr((_VERSION,) + key).encode('utf-8'), digest_size=20).hexdigest()
+        return os.path.join(self._directory, _name)
+
+    def _load(self, key):
+        """Map a result from the cache directory
+
+        :return: dict of matrix information, or None if it isn't there
+        """
+        if self._directory is None:
+            return None
+        _path = self._path(key)
+        try:
+            with open(_path + ".json") as fp:
+                r = json.load(fp)
+            r["matrix"] = _read_only(np.load(_path + ".npy", mmap_mode="r"))
+        except (OSError, ValueError):
+            return None
+        return r
+
+    def _store(self, key, r):
+        """Write a result to the cache directory
+
+        Each file is written atomically, the .json first, so a .npy is never seen without it.
+        A read-only or missing directory just means other processes decode the file themselves.
+        """
+        if self._directory is None:
+            return
+        _path = self._path(key)
+        _info = {k: v for k, v in r.items() if k != "matrix"}
+        try:
+            os.makedirs(self._directory, exist_ok=True)
+            _fd, _tmp = tempfile.mkstemp(dir=self._directory, suffix=".json")
+            with os.fdopen(_fd, 'w') as fp:
+                json.dump(_info, fp, default=float)
+            os.replace(_tmp, _path + ".json")
+            _fd, _tmp = tempfile.mkstemp(dir=self._directory, suffix=".npy")
+            with os.fdopen(_fd, 'wb') as fp:
+                np.save(fp, r["matrix"])
+            os.replace(_tmp, _path + ".npy")
+        except OSError:
+            pass
+
+
+def _read_only(matrix):
+    """A read-only view of a matrix, to share between callers
+
+    Callers can set writeable back to True on an array they were given, but not on a view of a read-only array.
+    :param matrix: numpy.ndarray (no longer used directly)
+    :return: numpy.ndarray view
+    """
+    matrix.flags.writeable = False
+    return matrix.view()
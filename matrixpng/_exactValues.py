@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""Store the exact matrix values alongside the quantized image
+
+The canonical source for this package is https://github.com/finitemobius/matrixpng-py
+The values go in private chunks (mpEX) after the image data, in one of two forms:
+"residual" stores how far each value is from the value its color decodes to,
+and "raw" stores the values themselves.
+Residuals are differences of the bit patterns, taken as unsigned integers (which wrap),
+so adding them back restores every value bit for bit, whatever the dtype, including NaN and inf.
+Either way the bytes are shuffled (first bytes of every value, then second bytes, ...) and deflated,
+a block of rows at a time, so they can be collected while the image is streamed out.
+The compressed blocks wait in a temporary file until the image data is written.
+mpEX is marked unsafe to copy, since it is only valid with the image data it was written with.
+"""
+
+import struct
+import tempfile
+import zlib
+import numpy as np
+
+__author__ = "Finite Mobius, LLC"
+__credits__ = ["Jason R. Miller"]
+__license__ = "MIT"
+__version__ = "alpha"
+__maintainer__ = "Finite Mobius, LLC"
+__email__ = "jason@finitemobius.com"
+__status__ = "Development"
+
+# The chunk type of the exact values
+EXACT_TAG = b'mpEX'
+# Bump this when the layout changes
+_VERSION = 1
+# Ways to store the exact values
+KINDS = {
+    "residual": 0,
+    "raw": 1
+}
+# Version, kind, length of the dtype string, rows per shuffled block, image height and width
+_HEAD = struct.Struct("!3BI2Q")
+# Compressed bytes per mpEX chunk
+_CHUNK_LIMIT = 2 ** 20
+# Compressed bytes to hold in memory before spilling to disk
+_SPOOL_SIZE = 2 ** 24
+
+
+def prediction(z, dtype):
+    """The value each pixel predicts, in the matrix's dtype
+
+    The writer and the reader must both compute this the same way.
+    :param z: numpy.ndarray of decoded z values (float)
+    :param dtype: dtype of the matrix
+    :return: numpy.ndarray of dtype
+    """
+    _dtype = np.dtype(dtype)
+    # NaN decodes from more than one color, so it predicts nothing
+    _z = np.where(np.isfinite(z), z, 0.0)
+    if _dtype.kind in 'iu':
+        _info = np.iinfo(_dtype)
+        # The largest 64-bit integers round up to a float that would overflow the cast
+        _max = float(_info.max)
+        if int(_max) > _info.max:
+            _max = np.nextafter(_max, 0)
+        _z = np.clip(np.rint(_z), _info.min, _max)
+    return _z.astype(_dtype)
+
+
+def _unsigned(dtype):
+    """The unsigned integer type of the same size"""
+    return np.dtype('u' + str(np.dtype(dtype).itemsize))
+
+
+class ExactWriter:
+    """Collect exact values band by band, and build the mpEX chunks
+
+    The compressed values are kept in a temporary file (in memory while they are small),
+    so memory use doesn't grow with the matrix.
+    """
+
+    def __init__(self, kind, dtype, height, width, block_rows, level=-1):
+        """Constructor
+
+        :param kind: 'residual' or 'raw'
+        :param dtype: dtype of the matrix (real numbers or booleans)
+        :param height: Image height
+        :param width: Image width
+        :param block_rows: Rows per shuffled block
+        :param level: zlib compression level (default = zlib's default)
+        """
+        self._dtype = np.dtype(dtype)
+        if self._dtype.kind not in 'fiub':
+            raise ValueError('Exact values need real numbers, not ' + str(self._dtype) + '.')
+        self._kind = kind
+        self._width = width
+        self._block_rows = block_rows
+        _name = self._dtype.str.encode('ascii')
+        self._compressor = zlib.compressobj(level)
+        self._spool = tempfile.SpooledTemporaryFile(max_size=_SPOOL_SIZE)
+        self._spool.write(_HEAD.pack(_VERSION, KINDS[kind], len(_name), block_rows, height, width) + _name)
+        # Rows waiting for a full block
+        self._rows = []
+        self._count = 0
+
+    def add(self, values, z=None):
+        """Add the next band of rows, top to bottom
+
+        :param values: numpy.ndarray (rows x cols) of the matrix values, as they appear in the image
+        :param z: numpy.ndarray (rows x cols) of the values the pixels decode to (needed for 'residual')
+        """
+        _u = _unsigned(self._dtype)
+        _v = np.ascontiguousarray(values, dtype=self._dtype).view(_u)
+        if self._kind == "residual":
+            # Unsigned arithmetic wraps, so the difference always adds back exactly
+            _v = _v - prediction(z, self._dtype).view(_u)
+        self._rows.append(_v)
+        self._count += len(_v)
+        while self._count >= self._block_rows:
+            self._flush(self._block_rows)
+
+    def chunks(self):
+        """Finish up, and read the chunks back one at a time
+
+        The temporary file is closed once the last chunk has been read.
+        :return: generator of chunk tuples (tag, data)
+        """
+        if self._count:
+            self._flush(self._count)
+        self._spool.write(self._compressor.flush())
+        self._spool.seek(0)
+        with self._spool:
+            while True:
+                _data = self._spool.read(_CHUNK_LIMIT)
+                if not _data:
+                    return
+                yield EXACT_TAG, _data
+
+    def _flush(self, rows):
+        """Shuffle and compress one block of rows"""
+        _all = np.concatenate(self._rows) if len(self._rows) > 1 else self._rows[0]
+        _block, _rest = _all[:rows], _all[rows:]
+        self._rows = [_rest] if len(_rest) else []
+        self._count = len(_rest)
+        self._spool.write(self._compressor.compress(shuffle(_block)))
+
+
+def shuffle(block):
+    """Group the bytes of an array by their place in each value
+
+    :param block: numpy.ndarray
+    :return: numpy.ndarray of uint8
+    """
+    return np.ascontiguousarray(block.reshape(-1).view(np.uint8).reshape(-1, block.dtype.itemsize).T)
+
+
+def read_exact(data, z):
+    """Rebuild the exact values from the mpEX chunks
+
+    :param data: The data of the mpEX chunks, joined in order (bytes)
+    :param z: numpy.ndarray (rows x cols) of the values the pixels decode to, as they appear in the image
+    :return: numpy.ndarray (rows x cols) of the matrix's dtype
+    """
+    _version, _kind, _name_len, _block_rows, _height, _width = _HEAD.unpack_from(data)
+    if _version != _VERSION:
+        raise ValueError('Exact values version ' + str(_version) + ' is unknown.')
+    if (_height, _width) != z.shape:
+        raise ValueError('The exact values do not match the image.')
+    _dtype = np.dtype(data[_HEAD.size:_HEAD.size + _name_len].decode('ascii'))
+    _bytes = np.frombuffer(zlib.decompress(data[_HEAD.size + _name_len:]), dtype=np.uint8)
+    _u = _unsigned(_dtype)
+    _out = np.empty((_height, _width), dtype=_u)
+    _step = _block_rows * _width * _dtype.itemsize
+    for n, r in enumerate(range(0, _height, _block_rows)):
+        _rows = min(_block_rows, _height - r)
+        _block = _bytes[n * _step:n * _step + _rows * _width * _dtype.itemsize]
+        # Unshuffle
+        _out[r:r + _rows] = np.ascontiguousarray(_block.reshape(_dtype.itemsize, -1).T).view(_u).reshape(_rows, -1)
+    if _kind == KINDS["residual"]:
+        _out += prediction(z, _dtype).view(_u)
+    return _out.view(_dtype)
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""Read matrices block by block, in the order they are stored
+
+The canonical source for this package is https://github.com/finitemobius/matrixpng-py
+A matrix may be a numpy.ndarray, a numpy.memmap, the name of a .npy file (which is memory-mapped),
+or any 2-D array-like object that can be sliced, such as dask, zarr, or h5py arrays.
+Objects with a chunks attribute are read in whole chunks, so no chunk is fetched twice.
+"""
+
+import numpy as np
+
+__author__ = "Finite Mobius, LLC"
+__credits__ = ["Jason R. Miller"]
+__license__ = "MIT"
+__version__ = "alpha"
+__maintainer__ = "Finite Mobius, LLC"
+__email__ = "jason@finitemobius.com"
+__status__ = "Development"
+
+
+def open_matrix(matrix):
+    """Get a matrix we can slice without loading it all
+
+    :param matrix: 2-D array-like, or the name of a .npy file
+    :return: numpy.ndarray, numpy.memmap, or the sliceable object itself
+    """
+    if isinstance(matrix, str):
+        return np.load(matrix, mmap_mode="r")
+    # Sliceable arrays stay as they are; anything else (such as nested lists) becomes an array
+    if hasattr(matrix, "shape") and hasattr(matrix, "__getitem__"):
+        return matrix
+    return np.asarray(matrix)
+
+
+def storage_axis(matrix):
+    """The axis that is cheap to take whole slices of (the slowest-varying axis in storage)
+
+    :param matrix: 2-D sliceable matrix
+    :return: 0 or 1
+    """
+    if isinstance(matrix, np.ndarray) and matrix.flags.f_contiguous and not matrix.flags.c_contiguous:
+        return 1
+    return 0
+
+
+def chunk_length(matrix, axis):
+    """The chunk length of a chunked array along an axis
+
+    :param matrix: 2-D sliceable matrix
+    :param axis: 0 or 1
+    :return: int (1 if the matrix is not chunked)
+    """
+    _chunks = getattr(matrix, "chunks", None)
+    if not _chunks:
+        return 1
+    # zarr and h5py give one size per axis; dask gives a tuple of sizes per axis
+    _c = _chunks[axis]
+    if isinstance(_c, tuple):
+        _c = _c[0] if _c else 1
+    return max(1, int(_c))
+
+
+def take(matrix, axis, start, stop):
+    """Read a block of a matrix as a numpy.ndarray
+
+    :param matrix: 2-D sliceable matrix
+    :param axis: Axis to slice along
+    :param start: First index
+    :param stop: Index after the last one
+    :return: numpy.ndarray, in the matrix's own orientation
+    """
+    if axis == 0:
+        return np.asarray(matrix[start:stop])
+    return np.asarray(matrix[:, start:stop])
+
+
+def block_length(matrix, axis, memory_budget):
+    """How many slices along an axis fit in a memory budget, in whole chunks
+
+    :param matrix: 2-D sliceable matrix
+    :param axis: Axis to slice along
+    :param memory_budget: Bytes
+    :return: int
+    """
+    _slice_bytes = max(1, matrix.shape[1 - axis] * np.dtype(matrix.dtype).itemsize)
+    _chunk = chunk_length(matrix, axis)
+    return max(_chunk, int(memory_budget // _slice_bytes) // _chunk * _chunk)
+
+
+def value_range(matrix, memory_budget=64 * 2 ** 20, sample=None):
+    """The minimum and maximum of a matrix, ignoring NaN and +/-inf, in one sequential pass
+
+    :param matrix: 2-D sliceable matrix
+    :param memory_budget: Approximate memory for each block read, in bytes (default = 64 MiB)
+    :param sample: Fraction of the matrix to read, in evenly spaced blocks (default = all of it)
+    :return: tuple of (minimum, maximum); NaN if no element is finite
+    """
+    _axis = storage_axis(matrix)
+    _n = matrix.shape[_axis]
+    _block = block_length(matrix, _axis, memory_budget)
+    _step = _block
+    if sample is not None and sample < 1:
+        # Smaller blocks spread the sample through the whole matrix
+        _chunk = chunk_length(matrix, _axis)
+        _block = min(_block, max(_chunk, -(-_n // 64) // _chunk * _chunk))
+        _step = max(_block, int(round(_block / float(sample))) // _chunk * _chunk)
+    _min = None
+    _max = None
+    for s in range(0, _n, _step):
+        _b = take(matrix, _axis, s, min(s + _block, _n))
+        if _b.dtype.kind == 'f':
+            # An infinite limit would make the quantization delta infinite
+            # (only blocks that need it are copied)
+            _finite = np.isfinite(_b)
+            if not _finite.all():
+                _b = _b[_finite]
+        if _b.size:
+            # fmin and fmax skip NaN (unlike min and max), without warnings for all-NaN blocks
+            # (and keep the matrix's type, so integer matrices get integer limits)
+            _bmin = np.fmin.reduce(_b, axis=None)
+            _bmax = np.fmax.reduce(_b, axis=None)
+            _min = _bmin if _min is None else np.fmin(_min, _bmin)
+            _max = _bmax if _max is None else np.fmax(_max, _bmax)
+    if _min is None:
+        return np.nan, np.nan
+    return _min, _max
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""Compress one image on several cores
+
+The canonical source for this package is https://github.com/finitemobius/matrixpng-py
+This follows the approach of pigz (https://zlib.net/pigz/):
+each band is deflated on its own, primed with the tail of the band before it,
+and ended on a byte boundary with Z_SYNC_FLUSH, so the pieces concatenate into one zlib stream.
+The Adler-32 checksums of the bands are combined for the stream trailer.
+See RFC 1950 for the zlib stream format:
+https://www.rfc-editor.org/rfc/rfc1950
+"""
+
+import struct
+import zlib
+import numpy as np
+from ._pngEncoder import write_chunk, pack_scanlines, sample_bytes
+
+__author__ = "Finite Mobius, LLC"
+__credits__ = ["Jason R. Miller"]
+__license__ = "MIT"
+__version__ = "alpha"
+__maintainer__ = "Finite Mobius, LLC"
+__email__ = "jason@finitemobius.com"
+__status__ = "Development"
+
+# Adler-32 modulus
+_BASE = 65521
+# The deflate window; this much of the previous band primes each compressor
+_WINDOW = 32768
+
+
+def adler32_combine(adler1, adler2, len2):
+    """Combine the Adler-32 checksums of two consecutive pieces of data
+
+    This is adler32_combine() from zlib, which Python does not expose.
+    :param adler1: Checksum of the first piece
+    :param adler2: Checksum of the second piece
+    :param len2: Length of the second piece, in bytes
+    :return: Checksum of both pieces together (int)
+    """
+    _rem = len2 % _BASE
+    _sum1 = adler1 & 0xffff
+    _sum2 = (_rem * _sum1) % _BASE
+    _sum1 += (adler2 & 0xffff) + _BASE - 1
+    _sum2 += (adler1 >> 16) + (adler2 >> 16) + _BASE - _rem
+    _sum1 %= _BASE
+    _sum2 %= _BASE
+    return _sum1 | (_sum2 << 16)
+
+
+def adler32_replace(adler, old, new, offset, total):
+    """Update an Adler-32 checksum for bytes replaced in place
+
+    The checksum is a weighted sum of the bytes, so only the changed bytes are needed,
+    not the rest of the data.
+    :param adler: Checksum of the whole data
+    :param old: numpy.ndarray of the bytes (uint8) that were at offset
+    :param new: numpy.ndarray of the bytes (uint8) that replace them (the same length)
+    :param offset: Position of the replaced bytes in the data
+    :param total: Length of the whole data, in bytes
+    :return: Checksum of the updated data (int)
+    """
+    _delta = new.reshape(-1).astype(np.int64) - old.reshape(-1)
+    # Each byte counts once in the first sum, and (total - position) times in the second
+    _weights = (total - offset - np.arange(len(_delta), dtype=np.int64)) % _BASE
+    _sum1 = ((adler & 0xffff) + int(_delta.sum())) % _BASE
+    _sum2 = ((adler >> 16) + int(np.dot(_delta, _weights))) % _BASE
+    return _sum1 | (_sum2 << 16)
+
+
+def zlib_header(level=-1, strategy=zlib.Z_DEFAULT_STRATEGY):
+    """The two-byte zlib stream header that zlib itself would write
+
+    :param level: zlib compression level
+    :param strategy: zlib compression strategy
+    :return: bytes
+    """
+    # Deflate with a 32K window
+    _cmf = 0x78
+    if level == -1:
+        level = 6
+    # The level hint zlib uses
+    if strategy >= zlib.Z_HUFFMAN_ONLY or level < 2:
+        _flevel = 0
+    elif level < 6:
+        _flevel = 1
+    elif level == 6:
+        _flevel = 2
+    else:
+        _flevel = 3
+    _flg = _flevel << 6
+    _flg += 31 - (_cmf * 256 + _flg) % 31
+    return bytes([_cmf, _flg])
+
+
+def deflate_piece(lines, zdict, level, strategy, last):
+    """Deflate one band's scanlines as a raw piece of a larger zlib stream
+
+    :param lines: 1-D numpy.ndarray of packed, filtered scanlines
+    :param zdict: The bytes that come just before this piece (may be empty)
+    :param level: zlib compression level
+    :param strategy: zlib compression strategy
+    :param last: Whether this is the last piece of the stream
+    :return: tuple of (compressed bytes, Adler-32 of lines, length of lines)
+    """
+    if len(zdict):
+        _compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS, zlib.DEF_MEM_LEVEL, strategy, zdict)
+    else:
+        _compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS, zlib.DEF_MEM_LEVEL, strategy)
+    _data = _compressor.compress(lines)
+    if last:
+        _data += _compressor.flush(zlib.Z_FINISH)
+    else:
+        # End on a byte boundary without ending the stream
+        _data += _compressor.flush(zlib.Z_SYNC_FLUSH)
+    return _data, zlib.adler32(lines), lines.nbytes
+
+
+def write_idat_parallel(fp, bands, bpp, executor, workers, level=-1, strategy=zlib.Z_DEFAULT_STRATEGY,
+                        method="none"):
+    """Filter, compress, and write bands of rows as IDAT chunks, using a pool of workers
+
+    Bands are taken a window of `workers` at a time, so memory stays bounded.
+    :param fp: File pointer, opened in binary mode
+    :param bands: iterable of numpy.ndarray bands (rows x (cols * channels)), top to bottom
+    :param bpp: Bytes per complete pixel
+    :param executor: concurrent.futures.Executor (threads; numpy and zlib release the GIL)
+    :param workers: Number of bands to work on at once
+    :param level: zlib compression level (default = zlib's default)
+    :param strategy: zlib compression strategy (default = zlib's default)
+    :param method: Filter name (see FILTERS), or "adaptive"
+    """
+    write_chunk(fp, b'IDAT', zlib_header(level, strategy))
+    _adler = zlib.adler32(b'')
+    # The last unfiltered row and the last packed bytes of the previous band
+    _prev = None
+    _tail = b''
+    _bands = iter(bands)
+    _window = _next_window(_bands, workers)
+    while _window:
+        # Look ahead, so we know which piece ends the stream
+        _following = _next_window(_bands, workers)
+        # Filter the window's bands in parallel
+        _prevs = [_prev] + [sample_bytes(b[-1:])[0] for b in _window[:-1]]
+        _lines = list(executor.map(lambda b, p: pack_scanlines(b, bpp=bpp, prev=p, method=method).reshape(-1),
+                                   _window, _prevs))
+        # Deflate them in parallel, each primed with the end of the one before
+        _zdicts = [_tail] + [l[-_WINDOW:].tobytes() for l in _lines[:-1]]
+        _last = [False] * len(_lines)
+        if not _following:
+            _last[-1] = True
+        for _data, _a, _n in executor.map(lambda l, z, e: deflate_piece(l, z, level, strategy, e),
+                                          _lines, _zdicts, _last):
+            write_chunk(fp, b'IDAT', _data)
+            _adler = adler32_combine(_adler, _a, _n)
+        _prev = sample_bytes(_window[-1][-1:])[0]
+        _tail = _lines[-1][-_WINDOW:].tobytes()
+        _window = _following
+    # The stream trailer
+    write_chunk(fp, b'IDAT', struct.pack("!I", _adler))
+
+
+def _next_window(bands, workers):
+    """Take up to `workers` bands from an iterator
+
+    :return: list of bands (empty when the iterator is exhausted)
+    """
+    _window = []
+    for b in bands:
+        _window.append(b)
+        if len(_window) == workers:
+            break
+    return _window
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""Decode PNG image data with numpy
+
+The canonical source for this package is https://github.com/finitemobius/matrixpng-py
+This is the reverse of _pngEncoder: filtered scanlines go back to samples.
+read_image() decodes a whole image this way, inflating the IDAT chunks as they are read
+and unfiltering a band of rows at a time, rather than a row at a time in pure Python as pypng does.
+See the PNG specification for the filter definitions:
+http://www.libpng.org/pub/png/spec/1.2/PNG-Filters.html
+"""
+
+import struct
+import zlib
+import numpy as np
+from ._pngEncoder import SIGNATURE
+
+__author__ = "Finite Mobius, LLC"
+__credits__ = ["Jason R. Miller"]
+__license__ = "MIT"
+__version__ = "alpha"
+__maintainer__ = "Finite Mobius, LLC"
+__email__ = "jason@finitemobius.com"
+__status__ = "Development"
+
+# Samples per pixel for each PNG color type
+CHANNELS = {
+    0: 1,
+    2: 3,
+    3: 1,
+    4: 2,
+    6: 4
+}
+# Bytes of scanlines to inflate at once
+_BAND_BYTES = 2 ** 22
+
+
+def read_image(fp, out=None):
+    """Decode the image data of a PNG into an array of samples
+
+    Palette images give the palette indices, and transparency (tRNS) is not applied,
+    as with png.Reader.read().
+    Only 8- and 16-bit, non-interlaced images are handled here.
+    :param fp: File pointer, opened in binary mode, at the start of the file
+    :param out: numpy.ndarray (height x width x channels) to decode into (optional);
+                any dtype that holds the samples without loss will do
+    :return: numpy.ndarray (height x width x channels) of uint8 or uint16 (or out),
+             or None if the image is interlaced or has a bit depth below 8
+    """
+    if fp.read(len(SIGNATURE)) != SIGNATURE:
+        raise ValueError('Not a PNG file.')
+    _header = None
+    _decompressor = zlib.decompressobj()
+    # Scanlines inflated but not yet unfiltered
+    _pending = bytearray()
+    _row = 0
+    _prev = None
+    while True:
+        _head = fp.read(8)
+        if len(_head) < 8:
+            raise ValueError('The PNG file ends before its image data.')
+        _length, _tag = struct.unpack("!I4s", _head)
+        _data = fp.read(_length)
+        _crc = struct.unpack("!I", fp.read(4))[0]
+        if zlib.crc32(_data, zlib.crc32(_tag)) & 0xffffffff != _crc:
+            raise ValueError('Chunk ' + _tag.decode('latin-1') + ' has a bad CRC.')
+        if _tag == b'IHDR':
+            _width, _height, _bitdepth, _color_type, _, _, _interlace = struct.unpack("!2I5B", _data)
+            if _interlace or _bitdepth not in (8, 16):
+                return None
+            _shape = (_height, _width, CHANNELS[_color_type])
+            _dtype = np.dtype(np.uint16 if _bitdepth == 16 else np.uint8)
+            if out is None:
+                out = np.empty(_shape, dtype=_dtype)
+            elif out.shape != _shape:
+                raise ValueError('The output array has shape ' + str(out.shape) + ', not ' + str(_shape) + '.')
+            elif not np.can_cast(_dtype, out.dtype):
+                raise ValueError('The output array can not hold ' + str(_bitdepth) + '-bit samples.')
+            _bpp = _shape[2] * _bitdepth // 8
+            _line = 1 + _width * _bpp
+            _band = max(1, _BAND_BYTES // _line)
+            _header = True
+        elif _tag == b'IDAT':
+            if _header is None:
+                raise ValueError('The image data comes before the header.')
+            # Inflate a band at a time, so the whole image is never held as scanlines
+            # Only whole bands are unfiltered: each step costs as much as the band is wide,
+            # so the rows that arrive in a small chunk wait for the rest of their band (or the end of the data)
+            _chunk = _data
+            while True:
+                if len(_pending) < _band * _line:
+                    if not _chunk:
+                        break
+                    _pending += _decompressor.decompress(_chunk, _band * _line - len(_pending))
+                    _chunk = _decompressor.unconsumed_tail
+                    continue
+                _n = min(_band, _height - _row)
+                if _n <= 0:
+                    break
+                _prev = _unfilter_into(out, _pending, _row, _n, _line, _bpp, _bitdepth, _prev)
+                del _pending[:_n * _line]
+                _row += _n
+        elif _tag == b'IEND':
+            break
+    _pending += _decompressor.flush()
+    _n = min(len(_pending) // _line, _height - _row) if _header else 0
+    if _n:
+        _unfilter_into(out, _pending, _row, _n, _line, _bpp, _bitdepth, _prev)
+        _row += _n
+    if _header is None or _row < _height:
+        raise ValueError('The PNG image data is incomplete.')
+    return out
+
+
+def _unfilter_into(out, pending, row, n, line, bpp, bitdepth, prev):
+    """Unfilter n scanlines from the start of pending into out[row:row + n]
+
+    :return: numpy.ndarray, the last unfiltered row (for the next band)
+    """
+    _lines = np.frombuffer(pending, dtype=np.uint8, count=n * line).reshape(n, line)
+    _rows = unfilter_scanlines(_lines, bpp, prev)
+    _samples = bytes_to_samples(_rows, bitdepth)
+    np.copyto(out[row:row + n], _samples.reshape((n,) + out.shape[1:]), casting='safe')
+    return _rows[-1].copy()
+
+
+def unfilter_scanlines(lines, bpp, prev=None):
+    """Undo the PNG filters of a block of scanlines
+
+    Blocks that only use None, Sub, and Up are undone a row at a time.
+    Average and Paeth depend on both the pixel to the left and the one above,
+    so blocks that use them are undone along anti-diagonals instead,
+    one numpy step per diagonal rather than one Python step per pixel.
+    :param lines: numpy.ndarray (rows x (1 + bytes per row)) of uint8, filter type first
+    :param bpp: Bytes per complete pixel (at least 1)
+    :param prev: numpy.ndarray of uint8, the unfiltered row above the block (None at the top of the image)
+    :return: numpy.ndarray (rows x bytes per row) of unfiltered uint8
+    """
+    _types = lines[:, 0]
+    if np.any(_types > 4):
+        raise ValueError('Unknown filter type ' + str(int(_types.max())) + '.')
+    if not np.any(_types >= 3):
+        return _unfilter_rows(lines[:, 1:], _types, bpp, prev)
+    return _unfilter_diagonals(lines[:, 1:], _types, bpp, prev)
+
+
+def _unfilter_rows(x, types, bpp, prev):
+    """Undo None, Sub, and Up filters, a row at a time"""
+    _out = np.empty_like(x)
+    if prev is None:
+        prev = np.zeros(x.shape[1], dtype=np.uint8)
+    for r in range(len(x)):
+        t = types[r]
+        if t == 0:
+            _out[r] = x[r]
+        elif t == 1:
+            # Each byte adds the reconstructed byte one pixel to the left,
+            # which is a running sum (modulo 256) down each byte position of the pixel
+            np.cumsum(x[r].reshape(-1, bpp), axis=0, dtype=np.uint8, out=_out[r].reshape(-1, bpp))
+        else:
+            np.add(x[r], prev, out=_out[r])
+        prev = _out[r]
+    return _out
+
+
+def _unfilter_diagonals(x, types, bpp, prev):
+    """Undo any mix of filters, along anti-diagonals of pixels"""
+    _rows = len(x)
+    _cols = x.shape[1] // bpp
+    _x = x.reshape(_rows, _cols, bpp)
+    # Pad with a row above (the previous row) and a column of zeros on the left,
+    # so the neighbors of every pixel can be gathered without special cases
+    _out = np.zeros((_rows + 1, _cols + 1, bpp), dtype=np.uint8)
+    if prev is not None:
+        _out[0, 1:] = prev.reshape(_cols, bpp)
+    _t = types.reshape(-1, 1)
+    for d in range(_rows + _cols - 1):
+        r = np.arange(max(0, d - _cols + 1), min(_rows, d + 1))
+        j = d - r
+        a = _out[r + 1, j]
+        b = _out[r, j + 1]
+        c = _out[r, j]
+        t = _t[r]
+        # Predictions for each filter type
+        _pred = np.where(t == 1, a, 0).astype(np.uint8)
+        _pred = np.where(t == 2, b, _pred)
+        _pred = np.where(t == 3, ((a.astype(np.uint16) + b) >> 1).astype(np.uint8), _pred)
+        if np.any(t == 4):
+            _pred = np.where(t == 4, _paeth(a, b, c), _pred)
+        _out[r + 1, j + 1] = _x[r, j] + _pred
+    return _out[1:, 1:].reshape(_rows, -1)
+
+
+def _paeth(a, b, c):
+    """The Paeth predictor for arrays of bytes"""
+    _a = a.astype(np.int16)
+    _b = b.astype(np.int16)
+    _c = c.astype(np.int16)
+    pa = np.abs(_b - _c)
+    pb = np.abs(_a - _c)
+    pc = np.abs(_a + _b - 2 * _c)
+    return np.where((pa <= pb) & (pa <= pc), a, np.where(pb <= pc, b, c))
+
+
+def bytes_to_samples(x, bitdepth):
+    """Turn unfiltered scanline bytes into samples
+
+    :param x: numpy.ndarray (rows x bytes per row) of uint8
+    :param bitdepth: Bit depth (8 or 16)
+    :return: numpy.ndarray (rows x samples per row) of uint8 or (native) uint16
+    """
+    if bitdepth == 16:
+        # PNG samples are big-endian
+        return np.ascontiguousarray(x).view('>u2').astype(np.uint16)
+    return x
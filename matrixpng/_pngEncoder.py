@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""Encode PNG image data with numpy and zlib
+
+The canonical source for this package is https://github.com/finitemobius/matrixpng-py
+pypng packs and filters each row in pure Python, which dominates the encode time for large images.
+Here whole bands of rows are turned into big-endian scanlines with numpy
+and streamed through a zlib compressor.
+See the PNG specification for more info:
+http://www.libpng.org/pub/png/spec/1.2/PNG-Structure.html
+"""
+
+import struct
+import zlib
+import numpy as np
+
+__author__ = "Finite Mobius, LLC"
+__credits__ = ["Jason R. Miller"]
+__license__ = "MIT"
+__version__ = "alpha"
+__maintainer__ = "Finite Mobius, LLC"
+__email__ = "jason@finitemobius.com"
+__status__ = "Development"
+
+# The eight bytes every PNG file starts with
+SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# PNG color types for each mode
+COLOR_TYPES = {
+    "L": 0,
+    "RGB": 2,
+    "P": 3,
+    "LA": 4,
+    "RGBA": 6
+}
+
+
+def write_chunk(fp, tag, data=b''):
+    """Write one PNG chunk (length, tag, data, CRC)
+
+    :param fp: File pointer, opened in binary mode
+    :param tag: Chunk type (bytes)
+    :param data: Chunk data (bytes)
+    """
+    fp.write(struct.pack("!I", len(data)))
+    fp.write(tag)
+    fp.write(data)
+    fp.write(struct.pack("!I", zlib.crc32(data, zlib.crc32(tag)) & 0xffffffff))
+
+
+def write_header(fp, width, height, bitdepth, color_type, chunks=()):
+    """Write the PNG signature, the IHDR chunk, and any extra chunks that go before the image data
+
+    :param fp: File pointer, opened in binary mode
+    :param width: Image width
+    :param height: Image height
+    :param bitdepth: Bit depth (8 or 16)
+    :param color_type: PNG color type (see COLOR_TYPES)
+    :param chunks: iterable of chunk tuples (tag, data)
+    """
+    fp.write(SIGNATURE)
+    # Compression, filter, and interlace methods are always 0
+    write_chunk(fp, b'IHDR', struct.pack("!2I5B", width, height, bitdepth, color_type, 0, 0, 0))
+    for c in chunks:
+        write_chunk(fp, *c)
+
+
+# PNG filter types, by name
+# "adaptive" picks one of these for each row
+FILTERS = {
+    "none": 0,
+    "sub": 1,
+    "up": 2,
+    "average": 3,
+    "paeth": 4
+}
+
+
+def sample_bytes(band):
+    """View a band of samples as big-endian bytes (PNG samples are big-endian)
+
+    :param band: numpy.ndarray (rows x (cols * channels)) of uint8 or uint16 samples
+    :return: numpy.ndarray (rows x bytes per row) of uint8
+    """
+    return np.ascontiguousarray(band, dtype=band.dtype.newbyteorder('>')).view(np.uint8)
+
+
+def filter_rows(x, prev, bpp, method="none"):
+    """Apply a PNG filter to whole rows of bytes at once
+
+    :param x: numpy.ndarray (rows x bytes per row) of uint8
+    :param prev: numpy.ndarray of uint8, the (unfiltered) row above x[0], or None for the first row of the image
+    :param bpp: Bytes per complete pixel (at least 1)
+    :param method: Filter name (see FILTERS), or "adaptive"
+    :return: numpy.ndarray of filter types (one per row) and numpy.ndarray (rows x bytes per row) of filtered uint8
+    """
+    if method == "none":
+        return np.zeros(len(x), dtype=np.uint8), x
+    if prev is None:
+        prev = np.zeros(x.shape[1], dtype=np.uint8)
+    # Left (a), up (b), and upper-left (c) neighbors
+    # Bytes before the start of a row, or above the first row, count as 0
+    a = np.zeros_like(x)
+    a[:, bpp:] = x[:, :-bpp]
+    b = np.empty_like(x)
+    b[0] = prev
+    b[1:] = x[:-1]
+    c = np.zeros_like(x)
+    c[:, bpp:] = b[:, :-bpp]
+    # Candidate filters
+    # (uint8 arithmetic wraps modulo 256, as PNG requires)
+    if method == "adaptive":
+        _names = ["none", "sub", "up", "average", "paeth"]
+    else:
+        _names = [method]
+    _filtered = []
+    for n in _names:
+        if n == "none":
+            _filtered.append(x)
+        elif n == "sub":
+            _filtered.append(x - a)
+        elif n == "up":
+            _filtered.append(x - b)
+        elif n == "average":
+            _filtered.append(x - ((a.astype(np.uint16) + b) >> 1).astype(np.uint8))
+        elif n == "paeth":
+            _filtered.append(x - _paeth_predictor(a, b, c))
+        else:
+            raise ValueError('Filter ' + str(n) + ' is unknown.')
+    if len(_filtered) == 1:
+        return np.full(len(x), FILTERS[method], dtype=np.uint8), _filtered[0]
+    # Pick the filter with the minimum sum of absolute differences for each row
+    # (Bytes are treated as signed; abs(-128) wraps to -128, which reads back as 128 unsigned)
+    _scores = np.stack([np.abs(f.view(np.int8)).view(np.uint8).sum(axis=1, dtype=np.int64) for f in _filtered])
+    _best = np.argmin(_scores, axis=0)
+    _types = np.array([FILTERS[n] for n in _names], dtype=np.uint8)[_best]
+    _rows = np.arange(len(x))
+    return _types, np.stack(_filtered)[_best, _rows]
+
+
+def _paeth_predictor(a, b, c):
+    """The Paeth predictor for whole arrays of bytes
+
+    :param a: left neighbors (uint8)
+    :param b: upper neighbors (uint8)
+    :param c: upper-left neighbors (uint8)
+    :return: numpy.ndarray of uint8 predictions
+    """
+    _a = a.astype(np.int16)
+    _b = b.astype(np.int16)
+    _c = c.astype(np.int16)
+    # p = a + b - c, and the distances from p to a, b, and c
+    pa = np.abs(_b - _c)
+    pb = np.abs(_a - _c)
+    pc = np.abs(_a + _b - 2 * _c)
+    return np.where((pa <= pb) & (pa <= pc), a, np.where(pb <= pc, b, c))
+
+
+def pack_scanlines(band, bpp=1, prev=None, method="none"):
+    """Turn a band of rows into filter-type-prefixed PNG scanlines
+
+    :param band: numpy.ndarray (rows x (cols * channels)) of uint8 or uint16 samples
+    :param bpp: Bytes per complete pixel
+    :param prev: numpy.ndarray of uint8, the unfiltered bytes of the row above the band (None at the top)
+    :param method: Filter name (see FILTERS), or "adaptive"
+    :return: numpy.ndarray (rows x (1 + bytes per row)) of uint8
+    """
+    _types, _bytes = filter_rows(sample_bytes(band), prev, bpp, method)
+    _lines = np.empty((len(_bytes), _bytes.shape[1] + 1), dtype=np.uint8)
+    _lines[:, 0] = _types
+    _lines[:, 1:] = _bytes
+    return _lines
+
+
+class IDATWriter:
+    """Compress scanlines and write them out as IDAT chunks"""
+
+    def __init__(self, fp, level=-1, strategy=zlib.Z_DEFAULT_STRATEGY, chunk_limit=2 ** 20):
+        """Constructor
+
+        :param fp: File pointer, opened in binary mode
+        :param level: zlib compression level (default = zlib's default)
+        :param strategy: zlib compression strategy (default = zlib's default)
+        :param chunk_limit: Compressed bytes to collect before writing an IDAT chunk
+        """
+        self._fp = fp
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS, zlib.DEF_MEM_LEVEL, strategy)
+        self._chunk_limit = chunk_limit
+        self._data = bytearray()
+
+    def write(self, scanlines):
+        """Compress some scanlines
+
+        :param scanlines: bytes-like object of packed, filtered scanlines
+        """
+        self._data += self._compressor.compress(scanlines)
+        if len(self._data) >= self._chunk_limit:
+            write_chunk(self._fp, b'IDAT', bytes(self._data))
+            self._data = bytearray()
+
+    def close(self):
+        """Flush the compressor and write the remaining image data
+
+        :return: None
+        """
+        self._data += self._compressor.flush()
+        write_chunk(self._fp, b'IDAT', bytes(self._data))
+        self._data = bytearray()
+
+
+def write_idat(fp, bands, bpp, level=-1, strategy=zlib.Z_DEFAULT_STRATEGY, method="none"):
+    """Filter, compress, and write bands of rows as IDAT chunks
+
+    :param fp: File pointer, opened in binary mode
+    :param bands: iterable of numpy.ndarray bands (rows x (cols * channels)), top to bottom
+    :param bpp: Bytes per complete pixel
+    :param level: zlib compression level (default = zlib's default)
+    :param strategy: zlib compression strategy (default = zlib's default)
+    :param method: Filter name (see FILTERS), or "adaptive"
+    """
+    _idat = IDATWriter(fp, level=level, strategy=strategy)
+    # The last unfiltered row of the previous band
+    _prev = None
+    for b in bands:
+        _idat.write(pack_scanlines(b, bpp=bpp, prev=_prev, method=method))
+        _prev = sample_bytes(b[-1:])[0]
+    _idat.close()
+
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""Write matrix metadata, and read it from a PNG without decoding the image
+
+The canonical source for this package is https://github.com/finitemobius/matrixpng-py
+matrixpng writes its metadata in one private chunk (mpMd) before the image data,
+so reading stops at the first IDAT chunk.
+Each value is stored with its type: float64, int64, text, or boolean.
+Files from older versions keep each value in its own iTXt chunk, as text; those are still read.
+(Files that keep their metadata after the image data are still read;
+the IDAT chunks are skipped over, not inflated.)
+"""
+
+import struct
+import zlib
+from collections import namedtuple
+import numpy as np
+from ._pngEncoder import SIGNATURE
+from ._pngTextChunks import ChunkITXT
+
+__author__ = "Finite Mobius, LLC"
+__credits__ = ["Jason R. Miller"]
+__license__ = "MIT"
+__version__ = "alpha"
+__maintainer__ = "Finite Mobius, LLC"
+__email__ = "jason@finitemobius.com"
+__status__ = "Development"
+
+# The scale keys, in the order MatrixPNG writes them
+SCALE_KEYS = ["z_min", "z_max", "z_units", "x_min", "x_max", "x_units", "y_min", "y_max", "y_units"]
+
+# Modes for each PNG color type
+_MODES = {
+    0: "L",
+    2: "RGB",
+    3: "P",
+    4: "LA",
+    6: "RGBA"
+}
+
+MatrixMetadata = namedtuple("MatrixMetadata", ["width", "height", "mode", "bitdepth"] + SCALE_KEYS +
+                            ["colormap", "y_ascend_up"])
+MatrixMetadata.__doc__ = """Matrix metadata read from a PNG file
+
+Keys that are missing from the file are None."""
+
+# The chunk type of the metadata
+# (Safe to copy: it describes the matrix, so it stays valid if the image is only recompressed)
+METADATA_TAG = b'mpMd'
+# Bump this when the layout changes
+_VERSION = 1
+# Flags: the fields are zlib-compressed
+_COMPRESSED = 1
+# Field keys, by number
+_KEYS = SCALE_KEYS + ["colormap", "y_ascend_up"]
+# Field types
+_NONE = 0
+_FLOAT = 1
+_INT = 2
+_TEXT = 3
+_BOOL = 4
+_FIXED = {
+    _FLOAT: struct.Struct("!d"),
+    _INT: struct.Struct("!q"),
+    _BOOL: struct.Struct("!?")
+}
+# Text length
+_TEXT_LENGTH = struct.Struct("!H")
+
+
+def pack_metadata(values, level=-1):
+    """Build the metadata chunk
+
+    The fields are compressed only if that makes them smaller.
+    :param values: dict of metadata values by key (see MatrixMetadata), missing keys are not written
+    :param level: zlib compression level (default = zlib's default)
+    :return: chunk tuple (tag, data)
+    """
+    _fields = bytearray()
+    for n, k in enumerate(_KEYS):
+        if k not in values:
+            continue
+        _fields += struct.pack("!B", n) + _pack_value(values[k])
+    _packed = zlib.compress(bytes(_fields), level)
+    if len(_packed) < len(_fields):
+        return METADATA_TAG, struct.pack("!2B", _VERSION, _COMPRESSED) + _packed
+    return METADATA_TAG, struct.pack("!2B", _VERSION, 0) + bytes(_fields)
+
+
+def _pack_value(v):
+    """Type and pack one value
+
+    :return: bytes
+    """
+    if v is None:
+        return struct.pack("!B", _NONE)
+    # (bool is a kind of int, so it goes first)
+    if isinstance(v, (bool, np.bool_)):
+        return struct.pack("!B", _BOOL) + _FIXED[_BOOL].pack(bool(v))
+    if isinstance(v, (int, np.integer)):
+        return struct.pack("!B", _INT) + _FIXED[_INT].pack(int(v))
+    if isinstance(v, (float, np.floating)):
+        return struct.pack("!B", _FLOAT) + _FIXED[_FLOAT].pack(float(v))
+    _text = str(v).encode('utf-8')
+    if len(_text) > 2 ** (8 * _TEXT_LENGTH.size) - 1:
+        raise ValueError('Text of ' + str(len(_text)) + ' bytes is too long to store (the limit is ' +
+                         str(2 ** (8 * _TEXT_LENGTH.size) - 1) + ' bytes).')
+    return struct.pack("!B", _TEXT) + _TEXT_LENGTH.pack(len(_text)) + _text
+
+
+def parse_metadata(data, meta):
+    """Store the values of a metadata chunk in a metadata dict
+
+    :param data: Chunk data (bytes)
+    :param meta: dict to update
+    :return: True if the chunk could be read
+    """
+    _version, _flags = struct.unpack_from("!2B", data)
+    if _version != _VERSION:
+        return False
+    _fields = zlib.decompress(data[2:]) if _flags & _COMPRESSED else data[2:]
+    n = 0
+    while n < len(_fields):
+        _key, _type = struct.unpack_from("!2B", _fields, n)
+        n += 2
+        if _type in _FIXED:
+            _value = _FIXED[_type].unpack_from(_fields, n)[0]
+            n += _FIXED[_type].size
+        elif _type == _TEXT:
+            _length = _TEXT_LENGTH.unpack_from(_fields, n)[0]
+            n += _TEXT_LENGTH.size
+            _value = _fields[n:n + _length].decode('utf-8')
+            n += _length
+        else:
+            _value = None
+        # Keys from newer versions are skipped
+        if _key < len(_KEYS):
+            meta[_KEYS[_key]] = _value
+    return True
+
+
+def read_metadata(file):
+    """Read the matrix metadata from one or more PNG files
+
+    :param file: File name or file pointer (opened in binary mode), or a list of file names
+    :return: MatrixMetadata, or a list of them when given a list
+    """
+    if isinstance(file, (list, tuple)):
+        return [read_metadata(f) for f in file]
+    if isinstance(file, str):
+        with open(file, 'rb') as fp:
+            return _read_metadata(fp)
+    return _read_metadata(file)
+
+
+def _read_metadata(fp, chunks=None):
+    """Read the matrix metadata from a PNG file pointer
+
+    The file pointer is left somewhere after the metadata.
+    :param fp: File pointer, opened in binary mode
+    :param chunks: dict to collect the other chunks read along the way in, as {tag: (position, data)} (optional)
+    :return: MatrixMetadata
+    """
+    if fp.read(len(SIGNATURE)) != SIGNATURE:
+        raise ValueError('Not a PNG file.')
+    _meta = dict.fromkeys(MatrixMetadata._fields)
+    _found = False
+    for tag, data, pos in _iter_chunks(fp):
+        if tag == b'IHDR':
+            _meta["width"], _meta["height"], _meta["bitdepth"], _color_type = struct.unpack("!2I2B", data[:10])
+            _meta["mode"] = _MODES.get(_color_type)
+        elif tag == METADATA_TAG:
+            _found = parse_metadata(data, _meta) or _found
+        elif tag == b'iTXt':
+            # Older files
+            _found = parse_text(ChunkITXT(data).get_chunkdata(), _meta) or _found
+        elif tag == b'IDAT' and _found:
+            # Everything we need comes before the image data
+            break
+        elif tag == b'IEND':
+            break
+        elif chunks is not None and tag != b'IDAT':
+            chunks[tag] = (pos, data)
+    return MatrixMetadata(**_meta)
+
+
+def read_chunks(fp, tag):
+    """Collect the data of every chunk of one type, in order
+
+    :param fp: File pointer, opened in binary mode, at the start of the file
+    :param tag: Chunk type (bytes)
+    :return: list of chunk data (bytes)
+    """
+    if fp.read(len(SIGNATURE)) != SIGNATURE:
+        raise ValueError('Not a PNG file.')
+    return [data for t, data, _ in _iter_chunks(fp) if t == tag]
+
+
+def find_chunk(fp, tag):
+    """Find the first chunk of one type, reading only the chunk headers
+
+    :param fp: File pointer, opened in binary mode (seekable), at the start of the file
+    :param tag: Chunk type (bytes)
+    :return: Position of the chunk, or None if there is none
+    """
+    if fp.read(len(SIGNATURE)) != SIGNATURE:
+        raise ValueError('Not a PNG file.')
+    while True:
+        _head = fp.read(8)
+        if len(_head) < 8:
+            return None
+        _length, _tag = struct.unpack("!I4s", _head)
+        if _tag == tag:
+            return fp.tell() - 8
+        if _tag == b'IEND':
+            return None
+        fp.seek(_length + 4, 1)
+
+
+def _iter_chunks(fp):
+    """Walk the chunks of a PNG file, skipping over image data
+
+    :param fp: File pointer, opened in binary mode, just after the signature
+    :return: generator of (tag, data, position) tuples; data is None for IDAT chunks,
+             and position is None if the file is not seekable
+    """
+    while True:
+        _pos = fp.tell() if fp.seekable() else None
+        _head = fp.read(8)
+        if len(_head) < 8:
+            return
+        _length, _tag = struct.unpack("!I4s", _head)
+        if _tag == b'IDAT':
+            # Skip the data and CRC without reading them, if we can
+            if fp.seekable():
+                fp.seek(_length + 4, 1)
+            else:
+                fp.read(_length + 4)
+            yield _tag, None, _pos
+            continue
+        _data = fp.read(_length)
+        _crc = struct.unpack("!I", fp.read(4))[0]
+        if zlib.crc32(_data, zlib.crc32(_tag)) & 0xffffffff != _crc:
+            raise ValueError('Chunk ' + _tag.decode('latin-1') + ' has a bad CRC.')
+        yield _tag, _data, _pos
+
+
+def parse_text(chunkdata, meta):
+    """Store the value of a matrixpng text chunk in a metadata dict
+
+    :param chunkdata: dict from ChunkITXT.get_chunkdata()
+    :param meta: dict to update
+    :return: True if the keyword was one of ours
+    """
+    _key = chunkdata["keyword"]
+    _text = chunkdata["text"]
+    # Does the keyword match a known scale key?
+    if _key in SCALE_KEYS:
+        meta[_key] = _parse_value(_text)
+    # Other known keywords
+    elif _key == "colormap":
+        meta["colormap"] = _text
+    elif _key == "y_ascend":
+        if _text == "down":
+            meta["y_ascend_up"] = False
+        elif _text == "up":
+            meta["y_ascend_up"] = True
+    else:
+        return False
+    return True
+
+
+def _parse_value(text):
+    """Cast a scale value as int or float, or leave it as text
+
+    :param text: The value as written (string)
+    :return: int, float, string, or None
+    """
+    # Unset values were written as "None"
+    if text == "None":
+        return None
+    try:
+        return int(text)
+    except ValueError:
+        pass
+    try:
+        return float(text)
+    except ValueError:
+        return text
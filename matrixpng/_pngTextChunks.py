@@ -99,7 +99,7 @@ class ChunkITXT:
 
         :return: A chunk tuple, ready to be written with png.write_chunks()
         """
-        return 'iTXt', self.pack()
+        return b'iTXt', self.pack()
 
     def print(self):
         """Print the chunk data for debugging purposes"""
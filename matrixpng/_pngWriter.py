@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""Write PNG files in a single pass
+
+The canonical source for this package is https://github.com/finitemobius/matrixpng-py
+pypng writes the signature and header, then the image data.
+We hook in between the two so our own chunks (iTXt etc.) go straight to the output,
+without re-parsing and re-writing an already encoded image.
+Writer.write_preamble() (the hook) first appears in pypng 0.0.19, hence the minimum version in setup.py.
+See the PNG specification for chunk ordering rules:
+http://www.libpng.org/pub/png/spec/1.2/PNG-Structure.html#Chunk-layout
+"""
+
+import png
+
+__author__ = "Finite Mobius, LLC"
+__credits__ = ["Jason R. Miller"]
+__license__ = "MIT"
+__version__ = "alpha"
+__maintainer__ = "Finite Mobius, LLC"
+__email__ = "jason@finitemobius.com"
+__status__ = "Development"
+
+
+class ChunkWriter(png.Writer):
+    """A pypng Writer that adds extra chunks between the header and the image data"""
+
+    def __init__(self, width, height, chunks=(), **kwargs):
+        """Constructor
+
+        :param width: Image width
+        :param height: Image height
+        :param chunks: iterable of chunk tuples (tag, data) to write before the first IDAT
+        :param kwargs: passed on to png.Writer
+        """
+        super().__init__(width, height, **kwargs)
+        self._chunks = list(chunks)
+
+    def write_preamble(self, outfile):
+        """Write the signature, header, and our extra chunks
+
+        :param outfile: File pointer, opened in binary mode
+        """
+        super().write_preamble(outfile)
+        for c in self._chunks:
+            png.write_chunk(outfile, *c)
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""Compression profiles for matrixpng
+
+The canonical source for this package is https://github.com/finitemobius/matrixpng-py
+Each profile is a zlib level and strategy plus a PNG row filter.
+Which one wins depends heavily on the data, so trial_encode() measures a sample.
+"""
+
+import time
+import zlib
+from ._pngEncoder import pack_scanlines
+
+__author__ = "Finite Mobius, LLC"
+__credits__ = ["Jason R. Miller"]
+__license__ = "MIT"
+__version__ = "alpha"
+__maintainer__ = "Finite Mobius, LLC"
+__email__ = "jason@finitemobius.com"
+__status__ = "Development"
+
+PROFILES = {
+    # Fastest deflate level, no filtering; for ingest
+    # (Colormapped images compress best unfiltered, and run-length matching does poorly on them)
+    "fast": {
+        "level": 1,
+        "strategy": zlib.Z_DEFAULT_STRATEGY,
+        "filter": "none"
+    },
+    # zlib's defaults, no filtering
+    "balanced": {
+        "level": 6,
+        "strategy": zlib.Z_DEFAULT_STRATEGY,
+        "filter": "none"
+    },
+    # Smallest files; for long-term storage
+    # (The best filter depends on the mode and the data, so it is picked by trial for each image)
+    "archive": {
+        "level": 9,
+        "strategy": zlib.Z_DEFAULT_STRATEGY,
+        "filter": "trial"
+    }
+}
+
+# The filters "trial" picks from
+TRIAL_FILTERS = ["none", "sub", "up", "average", "paeth", "adaptive"]
+
+
+def pick_filter(bands, bpp, level=-1, strategy=zlib.Z_DEFAULT_STRATEGY, sample=2 ** 22):
+    """Pick the filter that compresses some bands the smallest
+
+    What counts is what the second half of each band adds to the first:
+    in an image, each row can refer back to the rows before it,
+    and the start of a short sample (with nothing before it) would favor the filters that gain least from that.
+    :param bands: list of numpy.ndarray bands (rows x (cols * channels)) of samples
+    :param bpp: Bytes per complete pixel
+    :param level: zlib compression level (default = zlib's default)
+    :param strategy: zlib compression strategy (default = zlib's default)
+    :param sample: Approximate bytes to try, taken from the top of each band (default = 4 MiB)
+    :return: Filter name (see TRIAL_FILTERS)
+    """
+    _bands = [b[:max(2, sample // len(bands) // max(1, b[:1].nbytes))] for b in bands]
+    _sizes = []
+    for f in TRIAL_FILTERS:
+        _size = 0
+        for b in _bands:
+            _lines = pack_scanlines(b, bpp=bpp, method=f)
+            _half = len(_lines) // 2
+            _compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS, zlib.DEF_MEM_LEVEL, strategy)
+            _head = len(_compressor.compress(_lines[:_half]))
+            # The first half on its own, then both halves
+            _first = _head + len(_compressor.copy().flush())
+            _both = _head + len(_compressor.compress(_lines[_half:])) + len(_compressor.flush())
+            _size += _both - _first
+        _sizes.append(_size)
+    return TRIAL_FILTERS[_sizes.index(min(_sizes))]
+
+
+def trial_encode(bands, bpp, profile):
+    """Encode some bands with a profile and measure the result
+
+    The bands are compressed as one stream, as they would be in an image
+    (but not filtered across, since they are not next to each other).
+    :param bands: list of numpy.ndarray bands (rows x (cols * channels))
+    :param bpp: Bytes per complete pixel
+    :param profile: Profile name (see PROFILES)
+    :return: dict with raw bytes in, compressed bytes out, and seconds taken
+    """
+    _p = PROFILES[profile]
+    _raw = 0
+    _out = 0
+    _start = time.perf_counter()
+    _filter = _p["filter"]
+    if _filter == "trial":
+        _filter = pick_filter(bands, bpp, _p["level"], _p["strategy"])
+    _compressor = zlib.compressobj(_p["level"], zlib.DEFLATED, zlib.MAX_WBITS, zlib.DEF_MEM_LEVEL, _p["strategy"])
+    for b in bands:
+        _lines = pack_scanlines(b, bpp=bpp, method=_filter)
+        _out += len(_compressor.compress(_lines))
+        _raw += _lines.nbytes
+    _out += len(_compressor.flush())
+    return {
+        "bytes_in": _raw,
+        "bytes_out": _out,
+        "seconds": time.perf_counter() - _start
+    }
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""Export a matrix as a multi-resolution pyramid of PNG tiles
+
+The canonical source for this package is https://github.com/finitemobius/matrixpng-py
+Level 0 is the full matrix; each level after it is half the size of the one before,
+down to the first level that fits in a single tile.
+Tiles are written as <directory>/<level>/<column>_<row>.png, counted from the top left of the image,
+and pyramid.json describes the levels for a viewer.
+Every tile carries the global z range, and the x and y extents of the area it covers,
+so each one decodes to true values on its own.
+"""
+
+import os
+import json
+import shutil
+import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from ._matrixBlocks import open_matrix, take, block_length
+
+__author__ = "Finite Mobius, LLC"
+__credits__ = ["Jason R. Miller"]
+__license__ = "MIT"
+__version__ = "alpha"
+__maintainer__ = "Finite Mobius, LLC"
+__email__ = "jason@finitemobius.com"
+__status__ = "Development"
+
+# Ways to combine each 2 x 2 block into one value
+REDUCTIONS = ["mean", "max", "nearest"]
+
+
+def reduce_block(block, method="mean"):
+    """Halve a block of a matrix in both directions
+
+    Odd edges are padded by repeating the last row or column, which doesn't change the mean or the max.
+    NaN is ignored unless a whole 2 x 2 block is NaN.
+    :param block: 2-D numpy.ndarray
+    :param method: 'mean', 'max', or 'nearest'
+    :return: numpy.ndarray
+    """
+    if method == "nearest":
+        return block[::2, ::2]
+    _block = np.pad(block, ((0, len(block) % 2), (0, block.shape[1] % 2)), mode="edge")
+    _r = _block.reshape(len(_block) // 2, 2, _block.shape[1] // 2, 2)
+    if method == "max":
+        return np.fmax.reduce(np.fmax.reduce(_r, axis=3), axis=1)
+    if method == "mean":
+        _nan = np.isnan(_r) if _r.dtype.kind == 'f' else np.zeros(_r.shape, dtype=bool)
+        _count = 4 - _nan.sum(axis=(1, 3))
+        _sum = np.where(_nan, 0, _r).sum(axis=(1, 3), dtype=float)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(_count > 0, _sum / _count, np.nan)
+    raise ValueError('Reduction ' + str(method) + ' is unknown.')
+
+
+def export_pyramid(transformer, matrix, directory, tile_size=256, reduce="mean", x_axis_first=True,
+                   workers=None, memory_budget=None, tmpdir=None):
+    """Write the tiles of every level of a pyramid
+
+    :param transformer: MatrixPNG with the output settings (mode, color map, scale, profile)
+    :param matrix: 2-D numpy.ndarray, numpy.memmap, sliceable array, or .npy file name
+    :param directory: Directory to write the tiles to
+    :param tile_size: Tile width and height, in pixels
+    :param reduce: How to combine pixels between levels: 'mean', 'max', or 'nearest'
+    :param x_axis_first: Whether the x axis is the first axis in the 2-D array
+    :param workers: Number of threads writing tiles (default = os.cpu_count())
+    :param memory_budget: Approximate memory for each block read while reducing, in bytes (default = 64 MiB)
+    :param tmpdir: Directory for the reduced levels, when they don't fit in memory_budget
+                   (default = the system temp dir)
+    :return: dict describing the pyramid (as written to pyramid.json)
+    """
+    if reduce not in REDUCTIONS:
+        raise ValueError('Reduction ' + str(reduce) + ' is unknown.')
+    if memory_budget is None:
+        memory_budget = 64 * 2 ** 20
+    workers = workers or os.cpu_count()
+    matrix = open_matrix(matrix)
+    # Every tile shares the global scale
+    _base = transformer._copy()
+    _base.workers = 1
+    _x_axis = 0 if x_axis_first else 1
+    # The tile extents are fractions of the x and y ranges, so their defaults must follow the axes
+    # (_setminmax takes them from the first and second axes of the matrix)
+    if _base._scale["x_max"] is None:
+        _base._scale["x_max"] = matrix.shape[_x_axis]
+    if _base._scale["y_max"] is None:
+        _base._scale["y_max"] = matrix.shape[1 - _x_axis]
+    _base._setminmax(matrix, memory_budget)
+    _scale = dict(_base._scale)
+    _levels = []
+    _tmp = tempfile.mkdtemp(prefix="matrixpng", dir=tmpdir)
+    try:
+        with ThreadPoolExecutor(workers) as _pool:
+            _level = matrix
+            while True:
+                _n = len(_levels)
+                _info = _write_level(_pool, workers, _base, _scale, _level, _n, directory, tile_size, _x_axis,
+                                     matrix.shape)
+                _levels.append(_info)
+                if _info["columns"] == 1 and _info["rows"] == 1:
+                    break
+                _level = _reduce_level(_level, reduce, memory_budget, os.path.join(_tmp, str(_n + 1) + ".npy"))
+    finally:
+        shutil.rmtree(_tmp, ignore_errors=True)
+    _pyramid = {
+        "tile_size": tile_size,
+        "reduce": reduce,
+        "x_axis_first": x_axis_first,
+        "y_ascend_up": _base._y_invert,
+        "scale": _scale,
+        "levels": _levels
+    }
+    with open(os.path.join(directory, "pyramid.json"), 'w') as fp:
+        json.dump(_pyramid, fp, indent=2, default=float)
+    return _pyramid
+
+
+def _reduce_level(level, method, memory_budget, filename):
+    """Build the next level down, a block at a time
+
+    :return: numpy.ndarray, or a numpy.memmap of filename if it doesn't fit in memory_budget
+    """
+    _shape = (-(-level.shape[0] // 2), -(-level.shape[1] // 2))
+    _dtype = level.dtype if method != "mean" else np.dtype(float)
+    if _shape[0] * _shape[1] * _dtype.itemsize <= memory_budget:
+        _out = np.empty(_shape, dtype=_dtype)
+    else:
+        _out = np.lib.format.open_memmap(filename, mode="w+", dtype=_dtype, shape=_shape)
+    # An even number of rows at a time, so blocks don't straddle reads
+    _rows = max(2, block_length(level, 0, memory_budget) // 2 * 2)
+    for s in range(0, level.shape[0], _rows):
+        _out[s // 2:(s + _rows) // 2] = reduce_block(take(level, 0, s, min(s + _rows, level.shape[0])), method)
+    return _out
+
+
+def _write_level(pool, workers, base, scale, level, n, directory, tile_size, x_axis, full_shape):
+    """Write the tiles of one level, a few at a time on the pool
+
+    :return: dict describing the level
+    """
+    _dir = os.path.join(directory, str(n))
+    os.makedirs(_dir, exist_ok=True)
+    _width = level.shape[x_axis]
+    _height = level.shape[1 - x_axis]
+    _columns = -(-_width // tile_size)
+    _rows = -(-_height // tile_size)
+    _pending = deque()
+    for row in range(_rows):
+        for column in range(_columns):
+            _pending.append(pool.submit(_write_tile, base, scale, level, n, row, column,
+                                        os.path.join(_dir, str(column) + "_" + str(row) + ".png"),
+                                        tile_size, x_axis, full_shape))
+            # Backpressure: wait for the oldest tile before taking more
+            if len(_pending) >= 2 * workers:
+                _pending.popleft().result()
+    while _pending:
+        _pending.popleft().result()
+    return {"level": n, "width": _width, "height": _height, "columns": _columns, "rows": _rows}
+
+
+def _write_tile(base, scale, level, n, row, column, path, tile_size, x_axis, full_shape):
+    """Write one tile, with the extents of the area it covers"""
+    _width = level.shape[x_axis]
+    _height = level.shape[1 - x_axis]
+    # Matrix indices of the tile, at this level
+    x0 = column * tile_size
+    x1 = min(x0 + tile_size, _width)
+    # Image rows count down from the top; y may ascend upward
+    r0 = row * tile_size
+    r1 = min(r0 + tile_size, _height)
+    if base._y_invert:
+        y0, y1 = _height - r1, _height - r0
+    else:
+        y0, y1 = r0, r1
+    _tile = take(take(level, x_axis, x0, x1), 1 - x_axis, y0, y1)
+    # The extents of the tile, scaled from indices at this level to full-size indices
+    _f = 2 ** n
+    _x_full = full_shape[x_axis]
+    _y_full = full_shape[1 - x_axis]
+    _t = base._copy()
+    _t.set_scaling(z_min=scale["z_min"], z_max=scale["z_max"],
+                   x_min=_extent(scale["x_min"], scale["x_max"], _x_full, x0 * _f),
+                   x_max=_extent(scale["x_min"], scale["x_max"], _x_full, min(x1 * _f, _x_full)),
+                   y_min=_extent(scale["y_min"], scale["y_max"], _y_full, y0 * _f),
+                   y_max=_extent(scale["y_min"], scale["y_max"], _y_full, min(y1 * _f, _y_full)))
+    _t.matrix2png(_tile, path, x_axis_first=(x_axis == 0))
+
+
+def _extent(v_min, v_max, n, index):
+    """The axis value at a full-size matrix index, with v_min at index 0 and v_max at index n"""
+    return v_min + (v_max - v_min) * index / float(n)
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""Time the stages of an encode or decode
+
+The canonical source for this package is https://github.com/finitemobius/matrixpng-py
+Pass a StageStats to matrix2png(), png2matrix(), encode(), or decode() to see where the time goes.
+Each stage adds up its calls, wall time, bytes in and out, and pixels.
+A stage's time doesn't include the stages run inside it (so "encode" doesn't include the "color" time
+of the bands it pulls in), but with several workers, stages on different threads overlap.
+Timing costs a few perf_counter() calls per band, so it can be left on.
+Peak memory (from tracemalloc) is much more expensive: it slows down every allocation.
+"""
+
+import time
+import threading
+import tracemalloc
+
+__author__ = "Finite Mobius, LLC"
+__credits__ = ["Jason R. Miller"]
+__license__ = "MIT"
+__version__ = "alpha"
+__maintainer__ = "Finite Mobius, LLC"
+__email__ = "jason@finitemobius.com"
+__status__ = "Development"
+
+# The counters kept for each stage
+FIELDS = ["calls", "seconds", "bytes_in", "bytes_out", "pixels", "peak_memory"]
+
+
+class StageStats:
+    """Counters for each stage, added up over any number of calls"""
+
+    def __init__(self, callback=None, trace_memory=False):
+        """Constructor
+
+        :param callback: Function called with (stage name, dict of counters for that one run) as each stage ends
+                         (optional; it is called from whichever thread ran the stage)
+        :param trace_memory: Record the peak memory allocated during each stage, in bytes
+                             (starts tracemalloc if it isn't running; it is left running)
+        """
+        self._callback = callback
+        self._trace_memory = trace_memory
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self._stages = {}
+        self._lock = threading.Lock()
+        # The stages running on each thread, innermost last
+        self._local = threading.local()
+
+    def stage(self, name, bytes_in=0, pixels=0):
+        """Time a stage
+
+        Use as a context manager; the bytes it produces can be added with add(bytes_out=...) on the value it gives.
+        :param name: Stage name
+        :param bytes_in: Bytes the stage reads
+        :param pixels: Pixels (or matrix elements) the stage handles
+        :return: context manager
+        """
+        return _Stage(self, name, bytes_in, pixels)
+
+    def as_dict(self):
+        """The counters, for export
+
+        :return: dict of {stage name: {counter: value}}
+        """
+        with self._lock:
+            return {k: dict(v) for k, v in self._stages.items()}
+
+    def reset(self):
+        """Set every counter back to zero"""
+        with self._lock:
+            self._stages = {}
+
+    def _stack(self):
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def _record(self, name, counts):
+        """Add the counters of one run of a stage"""
+        with self._lock:
+            _s = self._stages.setdefault(name, dict.fromkeys(FIELDS, 0))
+            for k in FIELDS:
+                if k == "peak_memory":
+                    _s[k] = max(_s[k], counts[k])
+                else:
+                    _s[k] += counts[k]
+        if self._callback is not None:
+            self._callback(name, counts)
+
+    def __repr__(self):
+        return "StageStats(" + repr(self.as_dict()) + ")"
+
+
+class _Stage:
+    """One run of a stage"""
+
+    def __init__(self, stats, name, bytes_in, pixels):
+        self._stats = stats
+        self._name = name
+        self._counts = {
+            "calls": 1,
+            "seconds": 0.0,
+            "bytes_in": bytes_in,
+            "bytes_out": 0,
+            "pixels": pixels,
+            "peak_memory": 0
+        }
+        # Time spent in stages inside this one
+        self._inner = 0.0
+        # Peak memory of this stage so far, and memory in use when it started
+        self._peak = 0
+        self._base = 0
+
+    def add(self, bytes_in=0, bytes_out=0, pixels=0):
+        """Add to the counters of this run"""
+        self._counts["bytes_in"] += bytes_in
+        self._counts["bytes_out"] += bytes_out
+        self._counts["pixels"] += pixels
+
+    def __enter__(self):
+        _stack = self._stats._stack()
+        if self._stats._trace_memory:
+            _current, _peak = tracemalloc.get_traced_memory()
+            # Keep the outer stage's peak so far, then measure this one from here
+            if _stack:
+                _stack[-1]._peak = max(_stack[-1]._peak, _peak)
+            tracemalloc.reset_peak()
+            self._base = _current
+        _stack.append(self)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        _elapsed = time.perf_counter() - self._start
+        _stack = self._stats._stack()
+        _stack.pop()
+        self._counts["seconds"] = _elapsed - self._inner
+        if _stack:
+            _stack[-1]._inner += _elapsed
+        if self._stats._trace_memory:
+            self._peak = max(self._peak, tracemalloc.get_traced_memory()[1])
+            self._counts["peak_memory"] = max(0, self._peak - self._base)
+            if _stack:
+                _stack[-1]._peak = max(_stack[-1]._peak, self._peak)
+        self._stats._record(self._name, self._counts)
+        return False
+
+
+class _NoStage:
+    """Stands in for a stage when nothing is being recorded"""
+
+    def add(self, bytes_in=0, bytes_out=0, pixels=0):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_STAGE = _NoStage()
+
+
+def stage(stats, name, bytes_in=0, pixels=0):
+    """Time a stage, if there are stats to record it in
+
+    :param stats: StageStats, or None
+    :param name: Stage name
+    :param bytes_in: Bytes the stage reads
+    :param pixels: Pixels (or matrix elements) the stage handles
+    :return: context manager
+    """
+    if stats is None:
+        return _NO_STAGE
+    return stats.stage(name, bytes_in, pixels)
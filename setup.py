@@ -9,7 +9,8 @@ setup(name='matrixpng',
       license='GPLv3',
       packages=['matrixpng'],
       zip_safe=False,
+      python_requires='>=3.9',
       install_requires=[
-          "pypng >= 0.0.18",
+          "pypng >= 0.0.19",
           "numpy >= 1.11"
       ])
@@ -0,0 +1,20 @@
+#!/usr/bin/env python3
+"""Fixtures shared by the matrixpng tests
+
+The canonical source for this package is https://github.com/finitemobius/matrixpng-py"""
+
+import pytest
+
+__author__ = "Finite Mobius, LLC"
+__credits__ = ["Jason R. Miller"]
+__license__ = "MIT"
+__version__ = "alpha"
+__maintainer__ = "Finite Mobius, LLC"
+__email__ = "jason@finitemobius.com"
+__status__ = "Development"
+
+
+@pytest.fixture(autouse=True)
+def colormap_cache(tmp_path, monkeypatch):
+    """Keep generated color maps out of the home directory"""
+    monkeypatch.setenv("MATRIXPNG_CACHE", str(tmp_path / "colormaps"))
@@ -33,7 +33,9 @@ def _main():
             p.matrix2png(a, fp, x_axis_first=True)
         print(p.quantization_delta)
     if read:
-        p.pngfile2matrix("test.png")
+        r = p.pngfile2matrix("test.png", x_axis_first=True)
+        print(r["matrix"].shape)
+        print(r["z_min"], r["z_max"])
 
 if __name__ == '__main__':
     _main()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""Tests for the APNG time series: APNGWriter and read_frame()
+
+The canonical source for this package is https://github.com/finitemobius/matrixpng-py"""
+
+import os
+import png
+import pytest
+import numpy as np
+import matrixpng
+
+__author__ = "Finite Mobius, LLC"
+__credits__ = ["Jason R. Miller"]
+__license__ = "MIT"
+__version__ = "alpha"
+__maintainer__ = "Finite Mobius, LLC"
+__email__ = "jason@finitemobius.com"
+__status__ = "Development"
+
+
+def _frames(n, width=48, height=36):
+    """A series of frames, x axis first, where a small patch changes each time (frame 4 repeats frame 3)"""
+    a = np.add.outer(np.arange(width, dtype=float), np.arange(height, dtype=float))
+    _frames = []
+    for k in range(n):
+        a = a.copy()
+        if k != 4:
+            a[2 * k:2 * k + 5, k:k + 3] = (7 * k) % 80
+        _frames.append(a)
+    return _frames
+
+
+def _transformer(**kwargs):
+    """A MatrixPNG whose scale fits every frame"""
+    return matrixpng.MatrixPNG(z_min=0., z_max=82., **kwargs)
+
+
+def _atol(**kwargs):
+    """A few quantization steps of the transformer's scale (colors can repeat in a color map)"""
+    return 4 * 82. / (_transformer(**kwargs).quantization_levels - 1)
+
+
+def _check(filename, frames, **kwargs):
+    """Check every frame of a file against the frames written"""
+    for k, a in enumerate(frames):
+        r = matrixpng.read_frame(filename, k)
+        assert r["frame"] == k and r["frames"] == len(frames)
+        np.testing.assert_allclose(r["matrix"], a, atol=_atol(**kwargs))
+    # pypng shows the first frame
+    with open(filename, 'rb') as fp:
+        _width, _height, _rows, _ = png.Reader(file=fp).read()
+        assert len(list(_rows)) == _height
+
+
+@pytest.mark.parametrize("changed_only", [False, True])
+@pytest.mark.parametrize("mode,bitdepth", [("RGB", 8), ("L", 16), ("P", 8)])
+def test_frames(tmp_path, changed_only, mode, bitdepth):
+    f = str(tmp_path / "a.png")
+    _f = _frames(8)
+    with matrixpng.APNGWriter(f, _transformer(mode=mode, bitdepth=bitdepth), changed_only=changed_only,
+                              keyframe_interval=3) as w:
+        for a in _f:
+            w.append(a)
+        assert w.frame_count == 8
+    _check(f, _f, mode=mode, bitdepth=bitdepth)
+    # Counting from the end
+    np.testing.assert_array_equal(matrixpng.read_frame(f, -1)["matrix"], matrixpng.read_frame(f, 7)["matrix"])
+    # Each frame reads as the same frame written on its own
+    g = str(tmp_path / "b.png")
+    _transformer(mode=mode, bitdepth=bitdepth).matrix2png(_f[5], g)
+    np.testing.assert_array_equal(matrixpng.read_frame(f, 5)["matrix"],
+                                  matrixpng.MatrixPNG().pngfile2matrix(g)["matrix"])
+
+
+def test_changed_only_is_smaller(tmp_path):
+    _f = _frames(8)
+    _sizes = []
+    for changed_only in (False, True):
+        f = str(tmp_path / (str(changed_only) + ".png"))
+        with matrixpng.APNGWriter(f, _transformer(), changed_only=changed_only) as w:
+            for a in _f:
+                w.append(a)
+        with open(f, 'rb') as fp:
+            _sizes.append(len(fp.read()))
+    assert _sizes[1] < _sizes[0] / 2
+
+
+@pytest.mark.parametrize("x_axis_first", [True, False])
+@pytest.mark.parametrize("y_ascend_up", [True, False])
+def test_orientation(tmp_path, x_axis_first, y_ascend_up):
+    f = str(tmp_path / "a.png")
+    _f = _frames(3)
+    with matrixpng.APNGWriter(f, _transformer(y_ascend_up=y_ascend_up), changed_only=True) as w:
+        for a in _f:
+            w.append(a if x_axis_first else a.T, x_axis_first=x_axis_first)
+    r = matrixpng.read_frame(f, 2, x_axis_first=x_axis_first)
+    assert r["y_ascend_up"] == y_ascend_up
+    np.testing.assert_allclose(r["matrix"], _f[2] if x_axis_first else _f[2].T, atol=_atol())
+
+
+@pytest.mark.parametrize("changed_only", [False, True])
+def test_append(tmp_path, changed_only):
+    f = str(tmp_path / "a.png")
+    _f = _frames(9)
+    with matrixpng.APNGWriter(f, _transformer(), changed_only=changed_only, keyframe_interval=4) as w:
+        for a in _f[:5]:
+            w.append(a)
+    # Reopened with other settings, which are ignored
+    with matrixpng.APNGWriter(f, matrixpng.MatrixPNG(mode="L"), changed_only=changed_only, keyframe_interval=4,
+                              append=True) as w:
+        assert w.frame_count == 5
+        for a in _f[5:]:
+            w.append(a)
+    _check(f, _f)
+    assert matrixpng.read_metadata(f).mode == "RGB"
+
+
+def test_scale_from_first_frame(tmp_path):
+    # Later values outside the first frame's range are clipped
+    f = str(tmp_path / "a.png")
+    with matrixpng.APNGWriter(f) as w:
+        w.append(np.full((5, 4), 1.) + np.eye(5, 4))
+        w.append(np.full((5, 4), 10.))
+    r = matrixpng.read_frame(f, 1)
+    assert (r["z_min"], r["z_max"]) == (1., 2.)
+    np.testing.assert_array_equal(r["matrix"], 2.)
+
+
+def test_errors(tmp_path):
+    f = str(tmp_path / "a.png")
+    with matrixpng.APNGWriter(f, _transformer()) as w:
+        w.append(_frames(1)[0])
+        # Every frame is the same size
+        with pytest.raises(ValueError):
+            w.append(np.zeros((10, 10)))
+    for k in (1, -2):
+        with pytest.raises(ValueError):
+            matrixpng.read_frame(f, k)
+    # Only animated PNGs can be appended to
+    g = str(tmp_path / "b.png")
+    _transformer().matrix2png(_frames(1)[0], g)
+    with pytest.raises(ValueError):
+        matrixpng.APNGWriter(g, append=True)
+    # Nothing more can be written once the writer is closed
+    with pytest.raises(ValueError):
+        w.append(_frames(1)[0])
+
+
+def test_no_frames(tmp_path):
+    # A writer with no frames leaves no file behind
+    f = str(tmp_path / "a.png")
+    with matrixpng.APNGWriter(f, _transformer()):
+        pass
+    assert not os.path.exists(f)
+    # Appending to a file that isn't there starts a new one
+    with matrixpng.APNGWriter(f, _transformer(), append=True) as w:
+        w.append(_frames(1)[0])
+    assert matrixpng.read_frame(f, 0)["frames"] == 1
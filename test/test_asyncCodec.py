@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""Tests for the asyncio API: aencode(), aencode_stream(), adecode(), and aread_metadata()
+
+The canonical source for this package is https://github.com/finitemobius/matrixpng-py"""
+
+import io
+import os
+import time
+import asyncio
+import threading
+import pytest
+import numpy as np
+import matrixpng
+from matrixpng import _asyncCodec
+
+__author__ = "Finite Mobius, LLC"
+__credits__ = ["Jason R. Miller"]
+__license__ = "MIT"
+__version__ = "alpha"
+__maintainer__ = "Finite Mobius, LLC"
+__email__ = "jason@finitemobius.com"
+__status__ = "Development"
+
+
+def _matrix():
+    """Noise, so the PNG is several chunks long"""
+    return np.random.default_rng(0).random((300, 200))
+
+
+def _png(config=None):
+    """The PNG that encode() writes for _matrix()"""
+    b = io.BytesIO()
+    matrixpng.encode(_matrix(), b, config)
+    return b.getvalue()
+
+
+def _endless_encode(started, stopped):
+    """A stand-in for encode() that writes until it is stopped (or gives up after a few seconds)"""
+    def _encode(matrix, fp, *args, **kwargs):
+        try:
+            for _ in range(5000):
+                fp.write(b'x' * 1000)
+                started.set()
+                time.sleep(0.001)
+        except BaseException:
+            stopped.set()
+            raise
+    return _encode
+
+
+def test_aencode(tmp_path):
+    f = str(tmp_path / "a.png")
+    _config = matrixpng.MatrixPNGConfig(bitdepth=16)
+    _scale = asyncio.run(matrixpng.aencode(_matrix(), f, _config))
+    assert _scale["z_max"] == _matrix().max()
+    with open(f, 'rb') as fp:
+        assert fp.read() == _png(_config)
+
+
+@pytest.mark.parametrize("chunk_size", [1000, 2 ** 16])
+def test_aencode_stream(chunk_size):
+    async def _run():
+        return [c async for c in matrixpng.aencode_stream(_matrix(), chunk_size=chunk_size)]
+    _chunks = asyncio.run(_run())
+    assert b''.join(_chunks) == _png()
+    assert all(len(c) == chunk_size for c in _chunks[:-1])
+    assert 0 < len(_chunks[-1]) <= chunk_size
+
+
+def test_aencode_stream_error():
+    # The encoder's error comes out of the stream
+    async def _run():
+        async for _ in matrixpng.aencode_stream(_matrix(), matrixpng.MatrixPNGConfig(index_rows=10)):
+            pass
+    with pytest.raises(ValueError):
+        asyncio.run(_run())
+
+
+def test_aencode_cancel(tmp_path, monkeypatch):
+    # Cancelling stops the encoder, and removes what it wrote
+    started = threading.Event()
+    stopped = threading.Event()
+    monkeypatch.setattr(_asyncCodec, "encode", _endless_encode(started, stopped))
+    f = str(tmp_path / "a.png")
+
+    async def _run():
+        _task = asyncio.ensure_future(matrixpng.aencode(_matrix(), f))
+        await asyncio.get_running_loop().run_in_executor(None, started.wait)
+        _task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await _task
+    asyncio.run(_run())
+    assert stopped.is_set()
+    assert not os.path.exists(f)
+
+
+def test_aencode_stream_cancel(monkeypatch):
+    # A reader that stops early stops the encoder
+    started = threading.Event()
+    stopped = threading.Event()
+    monkeypatch.setattr(_asyncCodec, "encode", _endless_encode(started, stopped))
+
+    async def _run():
+        _stream = matrixpng.aencode_stream(_matrix(), chunk_size=1000)
+        async for _ in _stream:
+            break
+        await _stream.aclose()
+    asyncio.run(_run())
+    assert stopped.is_set()
+
+
+@pytest.mark.parametrize("source", ["name", "bytes", "file", "stream"])
+def test_adecode(tmp_path, source):
+    f = str(tmp_path / "a.png")
+    with open(f, 'wb') as fp:
+        fp.write(_png())
+
+    async def _run():
+        if source == "name":
+            return await matrixpng.adecode(f)
+        if source == "bytes":
+            return await matrixpng.adecode(_png())
+        if source == "file":
+            with open(f, 'rb') as fp:
+                return await matrixpng.adecode(fp)
+        _reader = asyncio.StreamReader()
+        _reader.feed_data(_png())
+        _reader.feed_eof()
+        return await matrixpng.adecode(_reader)
+    r = asyncio.run(_run())
+    np.testing.assert_array_equal(r["matrix"], matrixpng.decode(f)["matrix"])
+
+
+def test_adecode_cancel():
+    # A decode is stopped while it waits for data
+    async def _run():
+        _reader = asyncio.StreamReader()
+        _reader.feed_data(_png()[:100])
+        _task = asyncio.ensure_future(matrixpng.adecode(_reader))
+        await asyncio.sleep(0.01)
+        _task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await _task
+    asyncio.run(_run())
+
+
+def test_aread_metadata(tmp_path):
+    f = str(tmp_path / "a.png")
+    with open(f, 'wb') as fp:
+        fp.write(_png())
+    assert asyncio.run(matrixpng.aread_metadata(f)) == matrixpng.read_metadata(f)
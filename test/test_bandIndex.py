@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""Tests for the band index: read_region() and update_region()
+
+The canonical source for this package is https://github.com/finitemobius/matrixpng-py"""
+
+import png
+import pytest
+import numpy as np
+import matrixpng
+
+__author__ = "Finite Mobius, LLC"
+__credits__ = ["Jason R. Miller"]
+__license__ = "MIT"
+__version__ = "alpha"
+__maintainer__ = "Finite Mobius, LLC"
+__email__ = "jason@finitemobius.com"
+__status__ = "Development"
+
+
+def _gradient(width, height):
+    """A diagonal gradient, x axis first"""
+    return np.add.outer(np.arange(width, dtype=float), np.arange(height, dtype=float))
+
+
+def _check_readable(filename, expected):
+    """Check that pypng, png2matrix, and read_region all agree with the expected matrix"""
+    _width, _height, _rows, _ = png.Reader(filename=filename).asDirect()
+    assert len(list(_rows)) == _height
+    _p = matrixpng.MatrixPNG()
+    _full = _p.pngfile2matrix(filename)["matrix"]
+    # Colors can repeat in a color map, so allow a few quantization steps
+    np.testing.assert_allclose(_full, expected, atol=4 * _p.quantization_delta)
+    for y_range in (None, (0, 1), (_height // 3, _height // 2), (_height - 1, _height)):
+        r = _p.read_region(filename, y_range=y_range)
+        y0, y1 = r["y_range"]
+        np.testing.assert_array_equal(r["matrix"], _full[:, y0:y1])
+    return _full
+
+
+@pytest.mark.parametrize("mode,bitdepth", [("L", 8), ("LA", 16), ("RGB", 8), ("RGBA", 16), ("P", 8)])
+@pytest.mark.parametrize("y_ascend_up", [True, False])
+def test_read_region(tmp_path, mode, bitdepth, y_ascend_up):
+    a = _gradient(60, 45)
+    f = str(tmp_path / "a.png")
+    matrixpng.MatrixPNG(mode=mode, bitdepth=bitdepth, index_rows=7, y_ascend_up=y_ascend_up,
+                        filter="paeth").matrix2png(a, f)
+    _full = matrixpng.MatrixPNG().pngfile2matrix(f)["matrix"]
+    r = matrixpng.MatrixPNG().read_region(f, x_range=(5, 17), y_range=(3, 30))
+    assert r["x_range"] == (5, 17) and r["y_range"] == (3, 30)
+    np.testing.assert_array_equal(r["matrix"], _full[5:17, 3:30])
+    # Not x axis first
+    r = matrixpng.MatrixPNG().read_region(f, x_range=(0, 60), y_range=(44, 45), x_axis_first=False)
+    np.testing.assert_array_equal(r["matrix"], _full[:, 44:45].T)
+
+
+def test_read_region_without_index(tmp_path):
+    a = _gradient(30, 20)
+    f = str(tmp_path / "a.png")
+    matrixpng.MatrixPNG().matrix2png(a, f)
+    _full = matrixpng.MatrixPNG().pngfile2matrix(f)["matrix"]
+    r = matrixpng.MatrixPNG().read_region(f, x_range=(2, 4), y_range=(5, 9))
+    np.testing.assert_array_equal(r["matrix"], _full[2:4, 5:9])
+
+
+@pytest.mark.parametrize("mode,bitdepth", [("L", 16), ("RGB", 8), ("RGBA", 16), ("P", 8)])
+def test_update_region(tmp_path, mode, bitdepth):
+    a = _gradient(50, 40)
+    f = str(tmp_path / "a.png")
+    matrixpng.MatrixPNG(mode=mode, bitdepth=bitdepth, index_rows=6, filter="adaptive").matrix2png(a, f)
+    b = a.copy()
+    b[10:20, 5:27] = 30.
+    matrixpng.MatrixPNG().update_region(f, b[10:20, 5:27], 10, 5)
+    _expected = matrixpng.MatrixPNG(mode=mode, bitdepth=bitdepth)
+    _expected.matrix2png(b, str(tmp_path / "b.png"))
+    _full = _check_readable(f, b)
+    np.testing.assert_array_equal(_full, _expected.pngfile2matrix(str(tmp_path / "b.png"))["matrix"])
+
+
+def test_update_region_grows(tmp_path):
+    # Noise doesn't fit in the space a smooth gradient took, so the rest of the file is moved along
+    a = _gradient(80, 60)
+    f = str(tmp_path / "a.png")
+    matrixpng.MatrixPNG(bitdepth=16, index_rows=10).matrix2png(a, f)
+    b = a.copy()
+    b[:, 20:45] = np.random.default_rng(0).uniform(0, 138, (80, 25))
+    matrixpng.MatrixPNG().update_region(f, b[:, 20:45], 0, 20)
+    _check_readable(f, b)
+    # And again, into the slack left by the first update
+    b[:, 20:45] = 5.
+    matrixpng.MatrixPNG().update_region(f, b[:, 20:45], 0, 20)
+    _check_readable(f, b)
+
+
+@pytest.mark.parametrize("y0", [0, 200])
+def test_update_region_large_segments(tmp_path, y0):
+    # Segments of noise take more than one IDAT chunk (1 MiB);
+    # a constant block compresses to almost nothing, so most of the old space is padding
+    a = np.random.default_rng(1).random((2000, 400))
+    f = str(tmp_path / "a.png")
+    matrixpng.MatrixPNG(bitdepth=16, index_rows=200).matrix2png(a, f)
+    b = a.copy()
+    b[:, y0:y0 + 200] = 0.5
+    matrixpng.MatrixPNG().update_region(f, b[:, y0:y0 + 200], 0, y0)
+    _check_readable(f, b)
+    # Then grow it back past the padding
+    b[:, y0:y0 + 200] = a[:, y0:y0 + 200]
+    matrixpng.MatrixPNG().update_region(f, b[:, y0:y0 + 200], 0, y0)
+    _check_readable(f, b)
+
+
+def test_update_region_needs_index(tmp_path):
+    f = str(tmp_path / "a.png")
+    matrixpng.MatrixPNG().matrix2png(_gradient(10, 10), f)
+    with pytest.raises(ValueError):
+        matrixpng.MatrixPNG().update_region(f, np.zeros((2, 2)), 0, 0)
+    # The region must fit in the image
+    matrixpng.MatrixPNG(index_rows=4).matrix2png(_gradient(10, 10), f)
+    with pytest.raises(ValueError):
+        matrixpng.MatrixPNG().update_region(f, np.zeros((2, 2)), 9, 0)
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""Tests for encode_many() and decode_many()
+
+The canonical source for this package is https://github.com/finitemobius/matrixpng-py"""
+
+import os
+import numpy as np
+import matrixpng
+
+__author__ = "Finite Mobius, LLC"
+__credits__ = ["Jason R. Miller"]
+__license__ = "MIT"
+__version__ = "alpha"
+__maintainer__ = "Finite Mobius, LLC"
+__email__ = "jason@finitemobius.com"
+__status__ = "Development"
+
+
+def _matrices(n):
+    """n different matrices, x axis first"""
+    return [np.random.default_rng(k).normal(k, 1, (30 + k, 20)) for k in range(n)]
+
+
+def _read(path):
+    """A PNG file's bytes"""
+    with open(path, 'rb') as fp:
+        return fp.read()
+
+
+def test_encode_many(tmp_path):
+    _config = {"bitdepth": 16, "colormap": "viridis"}
+    _m = _matrices(7)
+    # Arrays, a .npy file, a memmap, a view of a memmap, and nested lists
+    np.save(str(tmp_path / "m1.npy"), _m[1])
+    np.save(str(tmp_path / "m2.npy"), np.asfortranarray(_m[2]))
+    np.save(str(tmp_path / "m3.npy"), _m[3])
+    _sources = [_m[0], str(tmp_path / "m1.npy"), np.load(str(tmp_path / "m2.npy"), mmap_mode="r"),
+                np.load(str(tmp_path / "m3.npy"), mmap_mode="r")[:], _m[4].tolist(), _m[5], _m[6]]
+    _paths = [str(tmp_path / (str(k) + ".png")) for k in range(7)]
+    _tmp = tmp_path / "tmp"
+    _tmp.mkdir()
+    _results = list(matrixpng.encode_many(zip(_sources, _paths), _config, workers=2, tmpdir=str(_tmp)))
+    assert _results == [(p, None) for p in _paths]
+    for a, p in zip(_m, _paths):
+        matrixpng.MatrixPNG(**_config).matrix2png(a, str(tmp_path / "expected.png"))
+        assert _read(p) == _read(str(tmp_path / "expected.png"))
+    # The temporary files are gone
+    assert os.listdir(str(_tmp)) == []
+
+
+def test_encode_many_errors(tmp_path):
+    # Each item's error is reported in its place, and the rest are still written
+    _m = _matrices(3)
+    _items = [(_m[0], str(tmp_path / "0.png")), (np.zeros(5), str(tmp_path / "1.png")),
+              (_m[2], str(tmp_path / "missing" / "2.png")), (_m[1], str(tmp_path / "3.png"))]
+    _results = list(matrixpng.encode_many(_items, workers=2))
+    assert [p for p, _ in _results] == [p for _, p in _items]
+    assert [e is None for _, e in _results] == [True, False, False, True]
+    assert os.path.exists(str(tmp_path / "3.png"))
+
+
+def test_decode_many(tmp_path):
+    _m = _matrices(6)
+    _paths = [str(tmp_path / (str(k) + ".png")) for k in range(6)]
+    for a, p in zip(_m, _paths):
+        matrixpng.MatrixPNG().matrix2png(a, p)
+    _paths.insert(2, str(tmp_path / "missing.png"))
+    _results = list(matrixpng.decode_many(_paths, workers=2, x_axis_first=False))
+    assert [p for p, _, _ in _results] == _paths
+    _, r, e = _results.pop(2)
+    assert r is None and e is not None
+    for (p, r, e), a in zip(_results, _m):
+        assert e is None
+        assert r["matrix"].shape == a.T.shape
+        np.testing.assert_array_equal(r["matrix"], matrixpng.decode(p, x_axis_first=False)["matrix"])
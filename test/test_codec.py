@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""Tests for MatrixPNGConfig and the stateless encode() and decode()
+
+The canonical source for this package is https://github.com/finitemobius/matrixpng-py"""
+
+import io
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+import numpy as np
+import matrixpng
+
+__author__ = "Finite Mobius, LLC"
+__credits__ = ["Jason R. Miller"]
+__license__ = "MIT"
+__version__ = "alpha"
+__maintainer__ = "Finite Mobius, LLC"
+__email__ = "jason@finitemobius.com"
+__status__ = "Development"
+
+
+def _matrix(k, width=64, height=48):
+    """A different matrix for each k, with its own range, x axis first"""
+    return np.random.default_rng(k).normal(k * 10, k + 1, (width, height))
+
+
+def _encode(a, config=None):
+    """encode() to bytes"""
+    b = io.BytesIO()
+    matrixpng.encode(a, b, config)
+    return b.getvalue()
+
+
+def test_config_defaults():
+    # The config defaults are the constructor defaults
+    _t = matrixpng._codec._template(matrixpng.MatrixPNGConfig())
+    _p = matrixpng.MatrixPNG()
+    assert (_t.mode, _t.bitdepth, _t.colormap, _t.engine, _t.profile, _t.filter, _t.workers, _t.index_rows,
+            _t.exact) == (_p.mode, _p.bitdepth, _p.colormap, _p.engine, _p.profile, _p.filter, _p.workers,
+                          _p.index_rows, _p.exact)
+    with pytest.raises(ValueError):
+        matrixpng.encode(_matrix(0), io.BytesIO(), matrixpng.MatrixPNGConfig(mode="CMYK"))
+
+
+def test_encode_is_stateless():
+    # Each call finds its own z range, as a fresh MatrixPNG would
+    _config = matrixpng.MatrixPNGConfig(bitdepth=16)
+    for k in range(3):
+        b = io.BytesIO()
+        _scale = matrixpng.encode(_matrix(k), b, _config)
+        assert (_scale["z_min"], _scale["z_max"]) == (_matrix(k).min(), _matrix(k).max())
+        c = io.BytesIO()
+        matrixpng.MatrixPNG(bitdepth=16).matrix2png(_matrix(k), c)
+        assert b.getvalue() == c.getvalue()
+    # A fixed range stays fixed
+    _scale = matrixpng.encode(_matrix(2), io.BytesIO(), _config._replace(z_min=-1., z_max=1.))
+    assert (_scale["z_min"], _scale["z_max"]) == (-1., 1.)
+
+
+def test_decode():
+    _bytes = _encode(_matrix(1), matrixpng.MatrixPNGConfig(mode="P"))
+    r = matrixpng.decode(io.BytesIO(_bytes), x_axis_first=False)
+    np.testing.assert_array_equal(r["matrix"],
+                                  matrixpng.MatrixPNG().png2matrix(io.BytesIO(_bytes), x_axis_first=False)["matrix"])
+    # The pypng engine reads the same
+    np.testing.assert_array_equal(matrixpng.decode(io.BytesIO(_bytes), x_axis_first=False, engine="pypng")["matrix"],
+                                  r["matrix"])
+
+
+@pytest.mark.parametrize("mode,bitdepth", [("RGB", 8), ("L", 16), ("P", 8)])
+def test_threads(mode, bitdepth):
+    # One config shared by many threads gives what each call would give on its own
+    _config = matrixpng.MatrixPNGConfig(mode=mode, bitdepth=bitdepth)
+    _expected = [_encode(_matrix(k), _config) for k in range(16)]
+    with ThreadPoolExecutor(8) as _pool:
+        _encoded = list(_pool.map(lambda k: _encode(_matrix(k), _config), list(range(16)) * 2))
+        assert _encoded == _expected * 2
+        _decoded = list(_pool.map(lambda b: matrixpng.decode(io.BytesIO(b))["matrix"], _encoded))
+    for k, m in enumerate(_decoded):
+        np.testing.assert_array_equal(m, matrixpng.decode(io.BytesIO(_expected[k % 16]))["matrix"])
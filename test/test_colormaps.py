@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""Tests for the color map tables and the generated color maps
+
+The canonical source for this package is https://github.com/finitemobius/matrixpng-py"""
+
+import io
+import os
+import sys
+import subprocess
+import pytest
+import numpy as np
+import matrixpng
+from matrixpng._colormaps import COLORMAPS, PALETTE_LEVELS, color_tables, inverse_lookup, palette, pack_colors
+from matrixpng._colormapGenerator import generated_colormap, generate_colormap, srgb_to_lab, lab_to_srgb
+
+__author__ = "Finite Mobius, LLC"
+__credits__ = ["Jason R. Miller"]
+__license__ = "MIT"
+__version__ = "alpha"
+__maintainer__ = "Finite Mobius, LLC"
+__email__ = "jason@finitemobius.com"
+__status__ = "Development"
+
+
+@pytest.mark.parametrize("colormap", COLORMAPS)
+@pytest.mark.parametrize("bd", [8, 16])
+def test_tables(colormap, bd):
+    _forward, _keys, _order = color_tables("RGB", bd, colormap)
+    # Built once, shared, and read-only
+    assert color_tables("RGB", bd, colormap)[0] is _forward
+    assert color_tables("RGBA", bd, colormap)[0] is _forward
+    for t in _forward, _keys, _order:
+        assert not t.flags.writeable
+    assert _forward.dtype == (np.uint16 if bd > 8 else np.uint8)
+    # Every color is its own, so every value can be read back
+    assert len(np.unique(pack_colors(_forward, bd))) == len(_forward)
+    assert np.all(np.diff(_keys.astype(np.int64)) > 0)
+    np.testing.assert_array_equal(pack_colors(_forward, bd)[_order], _keys)
+    assert matrixpng.ColorMaps("RGB", bd, colormap) == _forward.tolist()
+
+
+def test_more_colors_at_16_bits():
+    for c in COLORMAPS:
+        assert len(color_tables("RGB", 16, c)[0]) > 50 * len(color_tables("RGB", 8, c)[0])
+    with pytest.raises(ValueError):
+        color_tables("RGB", 8, "jet")
+
+
+@pytest.mark.parametrize("mode,bd,colormap", [("RGB", 8, "ebb"), ("RGB", 8, "viridis"), ("L", 8, None),
+                                              ("L", 16, None), ("P", 8, "coolwarm")])
+def test_inverse_lookup(mode, bd, colormap):
+    _forward = color_tables(mode, bd, colormap)[0]
+    _lookup = inverse_lookup(mode, bd, colormap)
+    assert inverse_lookup(mode, bd, colormap) is _lookup
+    assert not _lookup.flags.writeable
+    np.testing.assert_array_equal(_lookup[pack_colors(_forward, bd)], np.arange(len(_forward)))
+    # Colors that aren't in the map give one past the last index
+    _known = np.zeros(len(_lookup), dtype=bool)
+    _known[pack_colors(_forward, bd)] = True
+    assert np.all(_lookup[~_known] == len(_forward))
+
+
+def test_no_16_bit_rgb_lookup():
+    assert inverse_lookup("RGB", 16, "ebb") is None
+
+
+def test_palette():
+    for c in COLORMAPS:
+        _p = palette(c)
+        assert (_p.shape, _p.dtype) == ((PALETTE_LEVELS, 3), np.uint8)
+        # The ends of the color map are kept
+        _rgb = color_tables("RGB", 8, c)[0]
+        np.testing.assert_array_equal(_p[[0, -1]], _rgb[[0, -1]])
+        assert len(np.unique(pack_colors(_p, 8))) == PALETTE_LEVELS
+
+
+def test_lab():
+    _rgb = np.random.default_rng(0).random((100, 3))
+    np.testing.assert_allclose(lab_to_srgb(srgb_to_lab(_rgb)), _rgb, atol=1e-9)
+    np.testing.assert_allclose(srgb_to_lab(np.ones(3)), [100., 0., 0.], atol=1e-3)
+
+
+def test_generated_cache(tmp_path, monkeypatch):
+    _points = np.array([[0., 0., 0.], [1., 0.5, 0.]])
+    monkeypatch.setenv("MATRIXPNG_CACHE", str(tmp_path / "cache"))
+    _table = generated_colormap("test", _points, 8)
+    np.testing.assert_array_equal(_table, generate_colormap(_points, 8))
+    _file = str(tmp_path / "cache" / os.listdir(str(tmp_path / "cache"))[0])
+    # The cached table is what comes back next time
+    np.save(_file, _table[:10])
+    np.testing.assert_array_equal(generated_colormap("test", _points, 8), _table[:10])
+    # A cache that can't be written to only means the table is generated each time
+    (tmp_path / "file").write_text("")
+    monkeypatch.setenv("MATRIXPNG_CACHE", str(tmp_path / "file" / "cache"))
+    np.testing.assert_array_equal(generated_colormap("test", _points, 8), _table)
+
+
+@pytest.mark.parametrize("colormap", COLORMAPS)
+@pytest.mark.parametrize("mode,bitdepth", [("RGB", 8), ("RGB", 16), ("P", 8)])
+def test_round_trip(colormap, mode, bitdepth):
+    a = np.random.default_rng(0).normal(0, 1, (60, 40))
+    b = io.BytesIO()
+    _p = matrixpng.MatrixPNG(mode=mode, bitdepth=bitdepth, colormap=colormap)
+    _p.matrix2png(a, b)
+    r = matrixpng.MatrixPNG().png2matrix(io.BytesIO(b.getvalue()))
+    assert r["colormap"] == colormap
+    _levels = len(palette(colormap)) if mode == "P" else len(color_tables("RGB", bitdepth, colormap)[0])
+    np.testing.assert_allclose(r["matrix"], a, atol=(a.max() - a.min()) / (_levels - 1))
+
+
+@pytest.mark.parametrize("colormap", COLORMAPS)
+def test_palette_in_fresh_process(tmp_path, colormap):
+    # A palette's tables are built from its RGB tables, which a fresh process doesn't have yet
+    _env = dict(os.environ, MATRIXPNG_CACHE=str(tmp_path))
+    _code = "import matrixpng; matrixpng.MatrixPNG(mode='P', colormap='" + colormap + "')"
+    subprocess.run([sys.executable, "-c", _code], env=_env, check=True, timeout=60,
+                   cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""Tests for DecodeCache
+
+The canonical source for this package is https://github.com/finitemobius/matrixpng-py"""
+
+import os
+import shutil
+import pytest
+import numpy as np
+import matrixpng
+
+__author__ = "Finite Mobius, LLC"
+__credits__ = ["Jason R. Miller"]
+__license__ = "MIT"
+__version__ = "alpha"
+__maintainer__ = "Finite Mobius, LLC"
+__email__ = "jason@finitemobius.com"
+__status__ = "Development"
+
+
+def _write(tmp_path, k, name=None):
+    """Write a different matrix for each k, and return the file name"""
+    f = str(tmp_path / (name or str(k) + ".png"))
+    matrixpng.MatrixPNG().matrix2png(np.random.default_rng(k).normal(0, 1, (40, 30)), f)
+    return f
+
+
+def _counts(cache):
+    """hits, disk hits, and misses"""
+    _info = cache.cache_info()
+    return _info.hits, _info.disk_hits, _info.misses
+
+
+@pytest.mark.parametrize("key", ["stat", "hash"])
+def test_cache(tmp_path, key):
+    f = _write(tmp_path, 0)
+    _cache = matrixpng.DecodeCache(key=key)
+    r = _cache.decode(f)
+    assert _counts(_cache) == (0, 0, 1)
+    np.testing.assert_array_equal(r["matrix"], matrixpng.MatrixPNG().pngfile2matrix(f)["matrix"])
+    # Shared, so read-only, for good
+    assert not r["matrix"].flags.writeable
+    with pytest.raises(ValueError):
+        r["matrix"].flags.writeable = True
+    with pytest.raises(ValueError):
+        r["matrix"][0, 0] = 999.
+    assert _cache.decode(f)["matrix"] is r["matrix"]
+    assert _counts(_cache) == (1, 0, 1)
+    # Each orientation is its own entry
+    np.testing.assert_array_equal(_cache.decode(f, x_axis_first=False)["matrix"], r["matrix"].T)
+    assert _counts(_cache) == (1, 0, 2)
+    # Changing the dict doesn't change the cache
+    r["z_min"] = None
+    assert _cache.decode(f)["z_min"] is not None
+
+
+def test_changed_file(tmp_path):
+    f = _write(tmp_path, 0)
+    _cache = matrixpng.DecodeCache()
+    _cache.decode(f)
+    _write(tmp_path, 1, "0.png")
+    os.utime(f, ns=(1, 1))
+    np.testing.assert_array_equal(_cache.decode(f)["matrix"], matrixpng.MatrixPNG().pngfile2matrix(f)["matrix"])
+    assert _counts(_cache) == (0, 0, 2)
+
+
+def test_hash_finds_copies(tmp_path):
+    f = _write(tmp_path, 0)
+    g = str(tmp_path / "copy.png")
+    shutil.copy(f, g)
+    _cache = matrixpng.DecodeCache(key="hash")
+    _cache.decode(f)
+    _cache.decode(g)
+    assert _counts(_cache) == (1, 0, 1)
+
+
+def test_eviction(tmp_path):
+    _files = [_write(tmp_path, k) for k in range(4)]
+    # Room for two matrices
+    _cache = matrixpng.DecodeCache(max_bytes=2 * 40 * 30 * 8)
+    for f in _files[:3]:
+        _cache.decode(f)
+    _info = _cache.cache_info()
+    assert (_info.entries, _info.bytes, _info.evictions) == (2, 2 * 40 * 30 * 8, 1)
+    # The least recently used one went first
+    _cache.decode(_files[1])
+    _cache.decode(_files[3])
+    _cache.decode(_files[1])
+    assert _counts(_cache) == (2, 0, 4)
+    _cache.decode(_files[2])
+    assert _counts(_cache) == (2, 0, 5)
+    # Too big to keep at all
+    _small = matrixpng.DecodeCache(max_bytes=100)
+    _small.decode(_files[0])
+    assert _small.cache_info().entries == 0
+    _cache.clear()
+    assert (_cache.cache_info().entries, _cache.cache_info().bytes) == (0, 0)
+
+
+def test_directory(tmp_path):
+    f = _write(tmp_path, 0)
+    d = str(tmp_path / "cache")
+    _first = matrixpng.DecodeCache(directory=d)
+    r = _first.decode(f)
+    # Another cache (as in another process) maps what the first one decoded
+    _second = matrixpng.DecodeCache(directory=d)
+    s = _second.decode(f)
+    assert _counts(_second) == (0, 1, 0)
+    assert isinstance(s["matrix"], np.memmap)
+    with pytest.raises(ValueError):
+        s["matrix"].flags.writeable = True
+    np.testing.assert_array_equal(s["matrix"], r["matrix"])
+    assert {k: v for k, v in s.items() if k != "matrix"} == {k: v for k, v in r.items() if k != "matrix"}
+    # A directory that can't be written to only means nothing is shared
+    g = tmp_path / "file"
+    g.write_text("")
+    _third = matrixpng.DecodeCache(directory=str(g / "cache"))
+    np.testing.assert_array_equal(_third.decode(f)["matrix"], r["matrix"])
+
+
+def test_unknown_key():
+    with pytest.raises(ValueError):
+        matrixpng.DecodeCache(key="name")
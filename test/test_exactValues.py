@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""Tests for the exact values chunk (mpEX)
+
+The canonical source for this package is https://github.com/finitemobius/matrixpng-py"""
+
+import io
+import pytest
+import numpy as np
+import matrixpng
+
+__author__ = "Finite Mobius, LLC"
+__credits__ = ["Jason R. Miller"]
+__license__ = "MIT"
+__version__ = "alpha"
+__maintainer__ = "Finite Mobius, LLC"
+__email__ = "jason@finitemobius.com"
+__status__ = "Development"
+
+
+def _matrix(dtype, width=37, height=23):
+    """Values of a dtype, with the extremes (and NaN and inf for floats) mixed in"""
+    _dtype = np.dtype(dtype)
+    if not _dtype.isnative:
+        return _matrix(_dtype.newbyteorder('='), width, height).astype(_dtype)
+    if _dtype.kind == 'b':
+        return np.random.default_rng(0).random((width, height)) > 0.5
+    if _dtype.kind == 'f':
+        a = np.random.default_rng(0).normal(0, 1000, (width, height)).astype(_dtype)
+        a[0, 0] = np.nan
+        a[1, 1] = np.inf
+        a[2, 2] = -np.inf
+        a[3, 3] = np.finfo(_dtype).tiny
+        return a
+    _info = np.iinfo(_dtype)
+    a = np.random.default_rng(0).integers(_info.min, _info.max, (width, height), dtype=_dtype, endpoint=True)
+    a[0, 0] = _info.min
+    a[1, 1] = _info.max
+    return a
+
+
+@pytest.mark.parametrize("dtype", ["float64", "float32", "float16", "int8", "uint8", "int16", "uint16",
+                                   "int32", "uint32", "int64", "uint64", "bool", ">f8", ">i4"])
+@pytest.mark.parametrize("kind", ["residual", "raw"])
+def test_round_trip(dtype, kind):
+    a = _matrix(dtype)
+    b = io.BytesIO()
+    matrixpng.MatrixPNG(bitdepth=16, exact=kind).matrix2png(a, b, memory_budget=2 ** 14)
+    b.seek(0)
+    r = matrixpng.MatrixPNG().png2matrix(b, exact=True)
+    assert r["matrix"].dtype == a.dtype
+    assert r["matrix"].shape == a.shape
+    # Bit for bit, NaN included
+    np.testing.assert_array_equal(r["matrix"].view(np.uint8), a.view(np.uint8))
+
+
+@pytest.mark.parametrize("x_axis_first", [True, False])
+@pytest.mark.parametrize("y_ascend_up", [True, False])
+@pytest.mark.parametrize("workers", [1, 3])
+def test_round_trip_orientation(x_axis_first, y_ascend_up, workers):
+    a = _matrix("float64", 50, 41)
+    b = io.BytesIO()
+    matrixpng.MatrixPNG(exact="residual", y_ascend_up=y_ascend_up, workers=workers).matrix2png(
+        a, b, x_axis_first=x_axis_first, memory_budget=2 ** 14)
+    b.seek(0)
+    r = matrixpng.MatrixPNG().png2matrix(b, x_axis_first=x_axis_first, exact=True)
+    np.testing.assert_array_equal(r["matrix"], a)
+
+
+def test_without_exact_values():
+    b = io.BytesIO()
+    matrixpng.MatrixPNG().matrix2png(_matrix("float64"), b)
+    b.seek(0)
+    with pytest.raises(ValueError):
+        matrixpng.MatrixPNG().png2matrix(b, exact=True)
+
+
+def test_quantized_read_ignores_exact_values():
+    a = _matrix("float64")
+    b = io.BytesIO()
+    matrixpng.MatrixPNG(exact="raw").matrix2png(a, b)
+    c = io.BytesIO()
+    matrixpng.MatrixPNG().matrix2png(a, c)
+    b.seek(0)
+    c.seek(0)
+    np.testing.assert_array_equal(matrixpng.MatrixPNG().png2matrix(b)["matrix"],
+                                  matrixpng.MatrixPNG().png2matrix(c)["matrix"])
+
+
+@pytest.mark.parametrize("kind", ["residual", "raw"])
+def test_update_region_refuses_exact_values(tmp_path, kind):
+    a = _matrix("float64")
+    f = str(tmp_path / "a.png")
+    matrixpng.MatrixPNG(index_rows=5, exact=kind).matrix2png(a, f)
+    with open(f, 'rb') as fp:
+        _before = fp.read()
+    with pytest.raises(ValueError):
+        matrixpng.MatrixPNG().update_region(f, np.full((4, 4), 50.), 2, 2)
+    # The file is left as it was
+    with open(f, 'rb') as fp:
+        assert fp.read() == _before
+    np.testing.assert_array_equal(matrixpng.MatrixPNG().pngfile2matrix(f, exact=True)["matrix"], a)
+
+
+def test_spooled_to_disk(monkeypatch):
+    # Small limits make the values spill to disk and span several chunks
+    monkeypatch.setattr(matrixpng._exactValues, "_SPOOL_SIZE", 1000)
+    monkeypatch.setattr(matrixpng._exactValues, "_CHUNK_LIMIT", 777)
+    a = _matrix("float64", 80, 60)
+    b = io.BytesIO()
+    matrixpng.MatrixPNG(exact="raw").matrix2png(a, b, memory_budget=2 ** 14)
+    b.seek(0)
+    assert len(matrixpng._pngMetadata.read_chunks(b, matrixpng.EXACT_TAG)) > 10
+    b.seek(0)
+    np.testing.assert_array_equal(matrixpng.MatrixPNG().png2matrix(b, exact=True)["matrix"], a)
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""Tests for reading matrices block by block: memmaps, .npy files, and chunked arrays
+
+The canonical source for this package is https://github.com/finitemobius/matrixpng-py"""
+
+import io
+import pytest
+import numpy as np
+import matrixpng
+from matrixpng._matrixBlocks import value_range, block_length, open_matrix
+
+__author__ = "Finite Mobius, LLC"
+__credits__ = ["Jason R. Miller"]
+__license__ = "MIT"
+__version__ = "alpha"
+__maintainer__ = "Finite Mobius, LLC"
+__email__ = "jason@finitemobius.com"
+__status__ = "Development"
+
+
+class _Chunked:
+    """A chunked array (as zarr gives), which counts the chunks read"""
+
+    def __init__(self, a, chunks):
+        self._a = a
+        self.shape = a.shape
+        self.dtype = a.dtype
+        self.chunks = chunks
+        self.reads = []
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key, slice(None))
+        # Which chunks the slice touches
+        _touched = []
+        for axis, s in enumerate(key):
+            _start, _stop, _ = s.indices(self.shape[axis])
+            _touched.append(range(_start // self.chunks[axis], -(-_stop // self.chunks[axis])))
+        self.reads += [(i, j) for i in _touched[0] for j in _touched[1]]
+        return self._a[key]
+
+
+def _matrix(width=90, height=70):
+    """Noise, x axis first"""
+    return np.random.default_rng(0).normal(0, 100, (width, height))
+
+
+def _png(matrix, **kwargs):
+    """The PNG matrix2png writes"""
+    b = io.BytesIO()
+    matrixpng.MatrixPNG(bitdepth=16).matrix2png(matrix, b, **kwargs)
+    return b.getvalue()
+
+
+@pytest.mark.parametrize("budget", [1, 1000, 2 ** 26])
+def test_value_range(budget):
+    a = _matrix()
+    # Integers keep their type
+    b = a.astype(np.int32)
+    _min, _max = value_range(b, budget)
+    assert _min.dtype == np.int32 and (_min, _max) == (b.min(), b.max())
+    a[5, 5] = np.nan
+    assert value_range(a, budget) == (np.nanmin(a), np.nanmax(a))
+
+
+def test_value_range_infinite():
+    a = _matrix()
+    _finite = (a.min(), a.max())
+    a[3, 4] = np.inf
+    a[60, 2] = -np.inf
+    a[7, 7] = np.nan
+    assert value_range(a, 1000) == _finite
+    assert np.isnan(value_range(np.full((3, 3), np.inf))).all()
+    assert np.isnan(value_range(np.full((3, 3), np.nan))).all()
+
+
+def test_value_range_sample():
+    # The sample reads part of the matrix, spread through all of it
+    a = np.arange(1000.).reshape(100, 10)
+    _min, _max = value_range(a, 80, sample=0.1)
+    assert 0 <= _min < 100 and 900 <= _max < 1000
+
+
+def test_infinite_values():
+    # inf and -inf saturate, rather than setting the scale
+    a = _matrix()
+    a[3, 4] = np.inf
+    a[60, 2] = -np.inf
+    r = matrixpng.MatrixPNG(bitdepth=16).png2matrix(io.BytesIO(_png(a)))
+    _finite = np.isfinite(a)
+    assert (r["z_min"], r["z_max"]) == (a[_finite].min(), a[_finite].max())
+    assert (r["matrix"][3, 4], r["matrix"][60, 2]) == (r["z_max"], r["z_min"])
+
+
+@pytest.mark.parametrize("x_axis_first", [True, False])
+def test_npy_and_memmap(tmp_path, x_axis_first):
+    a = _matrix()
+    _expected = _png(a, x_axis_first=x_axis_first)
+    f = str(tmp_path / "a.npy")
+    np.save(f, a)
+    assert _png(f, x_axis_first=x_axis_first, memory_budget=5000) == _expected
+    # Stored column by column
+    g = str(tmp_path / "b.npy")
+    np.save(g, np.asfortranarray(a))
+    assert _png(open_matrix(g), x_axis_first=x_axis_first, memory_budget=5000) == _expected
+    # Nested lists
+    assert _png(a.tolist(), x_axis_first=x_axis_first) == _expected
+
+
+@pytest.mark.parametrize("chunks", [(7, 70), (90, 9), (13, 11)])
+def test_chunked(chunks):
+    a = _matrix()
+    _c = _Chunked(a, chunks)
+    assert _png(_c, memory_budget=3000) == _png(a)
+    # Blocks are whole chunks
+    assert block_length(_c, 0, 1) == chunks[0]
+    assert block_length(_c, 0, 3000) % chunks[0] == 0
+    # A pass for the range and a pass for the image, each reading every chunk once
+    _all = [(i, j) for i in range(-(-a.shape[0] // chunks[0])) for j in range(-(-a.shape[1] // chunks[1]))]
+    assert sorted(_c.reads) == sorted(_all * 2)
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""Tests for compressing one image on several threads
+
+The canonical source for this package is https://github.com/finitemobius/matrixpng-py"""
+
+import io
+import zlib
+import png
+import pytest
+import numpy as np
+import matrixpng
+from matrixpng._parallel import adler32_combine, adler32_replace, zlib_header
+
+__author__ = "Finite Mobius, LLC"
+__credits__ = ["Jason R. Miller"]
+__license__ = "MIT"
+__version__ = "alpha"
+__maintainer__ = "Finite Mobius, LLC"
+__email__ = "jason@finitemobius.com"
+__status__ = "Development"
+
+
+def _bytes(n, seed=0):
+    """n random bytes"""
+    return np.random.default_rng(seed).integers(0, 256, n, dtype=np.uint8)
+
+
+@pytest.mark.parametrize("len1,len2", [(0, 0), (0, 10), (10, 0), (1, 1), (1000, 70000), (65521, 65521 * 3 + 7)])
+def test_adler32_combine(len1, len2):
+    a = _bytes(len1).tobytes()
+    b = _bytes(len2, 1).tobytes()
+    assert adler32_combine(zlib.adler32(a), zlib.adler32(b), len(b)) == zlib.adler32(a + b)
+
+
+@pytest.mark.parametrize("offset,length", [(0, 1), (0, 5000), (123, 77), (4999, 1), (65521, 4000)])
+def test_adler32_replace(offset, length):
+    a = _bytes(70000)
+    b = a.copy()
+    b[offset:offset + length] = _bytes(length, 1)
+    _adler = adler32_replace(zlib.adler32(a), a[offset:offset + length], b[offset:offset + length], offset, len(a))
+    assert _adler == zlib.adler32(b)
+
+
+@pytest.mark.parametrize("level", [-1, 0, 1, 5, 6, 9])
+@pytest.mark.parametrize("strategy", [zlib.Z_DEFAULT_STRATEGY, zlib.Z_FILTERED, zlib.Z_HUFFMAN_ONLY, zlib.Z_RLE])
+def test_zlib_header(level, strategy):
+    _compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS, zlib.DEF_MEM_LEVEL, strategy)
+    assert zlib_header(level, strategy) == (_compressor.compress(b'x') + _compressor.flush())[:2]
+
+
+@pytest.mark.parametrize("workers", [2, 3, 8])
+@pytest.mark.parametrize("mode,bitdepth,method", [("RGB", 8, "paeth"), ("L", 16, "adaptive"), ("RGBA", 16, "up"),
+                                                  ("P", 8, "trial")])
+def test_workers(workers, mode, bitdepth, method):
+    # Bands more than the deflate window apart, so each piece is primed with the one before
+    a = np.random.default_rng(0).normal(0, 1, (300, 200)).cumsum(axis=1)
+    b = io.BytesIO()
+    matrixpng.MatrixPNG(mode=mode, bitdepth=bitdepth, filter=method, workers=workers).matrix2png(
+        a, b, memory_budget=2 ** 16)
+    c = io.BytesIO()
+    matrixpng.MatrixPNG(mode=mode, bitdepth=bitdepth, filter=method).matrix2png(a, c, memory_budget=2 ** 16)
+    # pypng checks the stream, Adler-32 included
+    _width, _height, _rows, _ = png.Reader(bytes=b.getvalue()).read()
+    assert len(list(_rows)) == _height
+    np.testing.assert_array_equal(matrixpng.MatrixPNG().png2matrix(io.BytesIO(b.getvalue()))["matrix"],
+                                  matrixpng.MatrixPNG().png2matrix(io.BytesIO(c.getvalue()))["matrix"])
+    # And so does zlib, on its own
+    zlib.decompress(b''.join(d for t, d in png.Reader(bytes=b.getvalue()).chunks() if t == b'IDAT'))
+
+
+def test_workers_single_band():
+    # Fewer bands than workers
+    a = np.arange(60.).reshape(10, 6)
+    b = io.BytesIO()
+    matrixpng.MatrixPNG(workers=4).matrix2png(a, b)
+    np.testing.assert_allclose(matrixpng.MatrixPNG().png2matrix(io.BytesIO(b.getvalue()))["matrix"], a, atol=0.5)
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""Tests for the numpy PNG decoder
+
+The canonical source for this package is https://github.com/finitemobius/matrixpng-py"""
+
+import io
+import png
+import pytest
+import numpy as np
+import matrixpng
+from matrixpng._pngEncoder import pack_scanlines, FILTERS
+from matrixpng._pngDecoder import read_image, unfilter_scanlines
+
+__author__ = "Finite Mobius, LLC"
+__credits__ = ["Jason R. Miller"]
+__license__ = "MIT"
+__version__ = "alpha"
+__maintainer__ = "Finite Mobius, LLC"
+__email__ = "jason@finitemobius.com"
+__status__ = "Development"
+
+
+def _rows(rows, cols, seed=0):
+    """Random bytes, smoothed a little so the filters have something to predict"""
+    return (np.random.default_rng(seed).integers(0, 8, (rows, cols)).cumsum(axis=1) % 256).astype(np.uint8)
+
+
+@pytest.mark.parametrize("method", list(FILTERS) + ["adaptive"])
+@pytest.mark.parametrize("bpp", [1, 2, 3, 4, 6, 8])
+def test_unfilter(method, bpp):
+    x = _rows(17, 5 * bpp)
+    _prev = _rows(1, 5 * bpp, 1)[0]
+    for p in (None, _prev):
+        _lines = pack_scanlines(x, bpp=bpp, prev=p, method=method)
+        np.testing.assert_array_equal(unfilter_scanlines(_lines, bpp, p), x)
+
+
+def test_unfilter_mixed():
+    # Every filter type, in every order
+    x = _rows(25, 12)
+    _lines = pack_scanlines(x, bpp=3, method="adaptive")
+    for r in range(len(x)):
+        _lines[r:r + 1] = pack_scanlines(x[r:r + 1], bpp=3, prev=x[r - 1] if r else None,
+                                         method=list(FILTERS)[r % 5])
+    np.testing.assert_array_equal(unfilter_scanlines(_lines, 3), x)
+
+
+def test_unfilter_unknown():
+    _lines = pack_scanlines(_rows(2, 6), bpp=1)
+    _lines[1, 0] = 5
+    with pytest.raises(ValueError):
+        unfilter_scanlines(_lines, 1)
+
+
+@pytest.mark.parametrize("greyscale,alpha,bitdepth", [(True, False, 8), (True, True, 16), (False, False, 16),
+                                                      (False, True, 8)])
+def test_read_pypng(greyscale, alpha, bitdepth):
+    # Files written by pypng, with its own choice of filters
+    _planes = (1 if greyscale else 3) + alpha
+    x = np.random.default_rng(0).integers(0, 2 ** bitdepth, (29, 31 * _planes))
+    b = io.BytesIO()
+    png.Writer(31, 29, greyscale=greyscale, alpha=alpha, bitdepth=bitdepth).write(b, x.tolist())
+    b.seek(0)
+    np.testing.assert_array_equal(read_image(b).reshape(29, -1), x)
+
+
+@pytest.mark.parametrize("band_bytes", [1, 100, 5000])
+@pytest.mark.parametrize("workers", [1, 3])
+def test_read_bands(monkeypatch, band_bytes, workers):
+    # Bands of every size, split across many small IDAT chunks
+    monkeypatch.setattr(matrixpng._pngDecoder, "_BAND_BYTES", band_bytes)
+    a = np.random.default_rng(0).normal(0, 1, (90, 70)).cumsum(axis=1)
+    b = io.BytesIO()
+    matrixpng.MatrixPNG(bitdepth=16, filter="adaptive", workers=workers).matrix2png(a, b, memory_budget=2 ** 13)
+    _width, _height, _rows, _ = png.Reader(bytes=b.getvalue()).read()
+    b.seek(0)
+    np.testing.assert_array_equal(read_image(b).reshape(_height, -1), np.array([np.asarray(r) for r in _rows]))
+
+
+def test_read_into():
+    b = io.BytesIO()
+    png.Writer(4, 3, greyscale=True, bitdepth=16).write(b, [[1, 2, 3, 65535]] * 3)
+    b.seek(0)
+    _out = np.zeros((3, 4, 1), dtype=np.int32)
+    assert read_image(b, _out) is _out
+    np.testing.assert_array_equal(_out[..., 0], [[1, 2, 3, 65535]] * 3)
+    # Too small a type, or the wrong shape
+    for _out in (np.zeros((3, 4, 1), dtype=np.uint8), np.zeros((4, 3, 1), dtype=np.uint16)):
+        b.seek(0)
+        with pytest.raises(ValueError):
+            read_image(b, _out)
+
+
+@pytest.mark.parametrize("x_axis_first", [True, False])
+@pytest.mark.parametrize("engine", ["numpy", "pypng"])
+def test_decode_into(tmp_path, x_axis_first, engine):
+    a = np.random.default_rng(0).normal(0, 1, (30, 20))
+    a[2, 3] = np.nan
+    f = str(tmp_path / "a.png")
+    matrixpng.MatrixPNG(bitdepth=16, exact="raw").matrix2png(a, f)
+    _expected = matrixpng.decode(f, x_axis_first=x_axis_first)["matrix"]
+    _shape = _expected.shape
+    # The matrix is written into the caller's array, whatever its memory layout
+    for _out in (np.empty(_shape), np.empty(_shape, order="F"), np.empty(_shape, dtype=np.float32)):
+        r = matrixpng.decode(f, x_axis_first=x_axis_first, engine=engine, out=_out)
+        assert r["matrix"] is _out
+        np.testing.assert_array_equal(_out, _expected.astype(_out.dtype))
+    _out = np.empty(_shape)
+    with open(f, 'rb') as fp:
+        assert matrixpng.MatrixPNG().png2matrix(fp, x_axis_first=x_axis_first, exact=True, out=_out)["matrix"] is _out
+    np.testing.assert_array_equal(_out, a if x_axis_first else a.T)
+    # The wrong shape, or a type that can't hold NaN
+    for _out in (np.empty(_shape[::-1]), np.empty(_shape, dtype=np.int64)):
+        with pytest.raises(ValueError):
+            matrixpng.MatrixPNG().pngfile2matrix(f, x_axis_first=x_axis_first, out=_out)
+
+
+def test_interlaced():
+    # Interlaced files are left to pypng
+    a = np.add.outer(np.arange(20.), np.arange(15.))
+    b = io.BytesIO()
+    matrixpng.MatrixPNG().matrix2png(a, b)
+    _width, _height, _rows, _info = png.Reader(bytes=b.getvalue()).read()
+    c = io.BytesIO()
+    png.Writer(_width, _height, greyscale=False, interlace=True).write(c, _rows)
+    # Keep the metadata of the original, with the interlaced image
+    _chunks = [ch for ch in png.Reader(bytes=b.getvalue()).chunks() if ch[0] not in (b'IHDR', b'IDAT', b'IEND')]
+    _image = [ch for ch in png.Reader(bytes=c.getvalue()).chunks() if ch[0] in (b'IHDR', b'IDAT', b'IEND')]
+    d = io.BytesIO()
+    png.write_chunks(d, _image[:1] + _chunks + _image[1:])
+    d.seek(0)
+    assert read_image(d) is None
+    np.testing.assert_array_equal(matrixpng.MatrixPNG().png2matrix(io.BytesIO(d.getvalue()))["matrix"],
+                                  matrixpng.MatrixPNG().png2matrix(io.BytesIO(b.getvalue()))["matrix"])
+
+
+def test_bad_crc():
+    b = io.BytesIO()
+    png.Writer(4, 3, greyscale=True).write(b, [[1, 2, 3, 4]] * 3)
+    _data = bytearray(b.getvalue())
+    # The last byte of the IDAT chunk's CRC
+    _data[-13] ^= 1
+    with pytest.raises(ValueError):
+        read_image(io.BytesIO(bytes(_data)))
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""Tests for the metadata chunk (mpMd), and for reading the iTXt metadata of older files
+
+The canonical source for this package is https://github.com/finitemobius/matrixpng-py"""
+
+import io
+import png
+import pytest
+import numpy as np
+import matrixpng
+from matrixpng._pngMetadata import pack_metadata, parse_metadata, METADATA_TAG, SCALE_KEYS
+from matrixpng import ChunkITXT
+
+__author__ = "Finite Mobius, LLC"
+__credits__ = ["Jason R. Miller"]
+__license__ = "MIT"
+__version__ = "alpha"
+__maintainer__ = "Finite Mobius, LLC"
+__email__ = "jason@finitemobius.com"
+__status__ = "Development"
+
+
+def _matrix():
+    """A diagonal gradient, x axis first"""
+    return np.add.outer(np.arange(40.), np.arange(30.)) * 1.7 - 5
+
+
+def _old_format(b, scale, colormap="ebb", y_ascend_up=True):
+    """Rewrite a PNG the way older versions laid it out
+
+    The image is kept; the metadata is one (compressed) iTXt chunk per value, written as text just before IEND.
+    :return: bytes
+    """
+    _chunks = [c for c in png.Reader(bytes=b.getvalue()).chunks() if c[0] != METADATA_TAG]
+    _text = [ChunkITXT(keyword=k, text=str(scale.get(k))) for k in SCALE_KEYS]
+    _text.append(ChunkITXT(keyword='colormap', text=colormap))
+    _text.append(ChunkITXT(keyword='y_ascend', text="up" if y_ascend_up else "down"))
+    for t in _text:
+        _chunks.insert(-1, t.get_chunk())
+    c = io.BytesIO()
+    png.write_chunks(c, _chunks)
+    return c.getvalue()
+
+
+@pytest.mark.parametrize("values", [
+    {},
+    {"z_min": -1.5, "z_max": 7, "z_units": "m", "x_min": None, "y_ascend_up": False},
+    {"z_min": np.float32(0.25), "z_max": np.int64(2 ** 40), "x_units": "µm", "colormap": "viridis",
+     "y_ascend_up": np.bool_(True)},
+    # Long enough to be compressed
+    {"z_units": "furlongs per fortnight " * 20, "y_units": "m"}
+])
+def test_pack(values):
+    _tag, _data = pack_metadata(values)
+    assert _tag == METADATA_TAG
+    _meta = {}
+    assert parse_metadata(_data, _meta)
+    assert _meta == values
+    for k, v in _meta.items():
+        assert type(v) is type(values[k].item() if isinstance(values[k], np.generic) else values[k])
+
+
+def test_long_text(tmp_path):
+    # Text lengths are stored in two bytes
+    _meta = {}
+    assert parse_metadata(pack_metadata({"z_units": "é" * 32767 + "m"})[1], _meta)
+    assert _meta == {"z_units": "é" * 32767 + "m"}
+    with pytest.raises(ValueError):
+        pack_metadata({"z_units": "é" * 32768})
+    with pytest.raises(ValueError):
+        matrixpng.MatrixPNG(z_units="m" * 65536).matrix2png(np.zeros((3, 3)), str(tmp_path / "a.png"))
+
+
+def test_unknown_version():
+    _data = bytearray(pack_metadata({"z_min": 1.})[1])
+    _data[0] += 1
+    _meta = {}
+    assert not parse_metadata(bytes(_data), _meta)
+    assert _meta == {}
+
+
+@pytest.mark.parametrize("mode,bitdepth", [("L", 16), ("RGB", 8), ("P", 8)])
+def test_read_metadata(tmp_path, mode, bitdepth):
+    f = str(tmp_path / "a.png")
+    matrixpng.MatrixPNG(mode=mode, bitdepth=bitdepth, colormap="viridis", z_units="K", x_min=-3, x_max=4.5,
+                        y_ascend_up=False).matrix2png(_matrix(), f)
+    _meta = matrixpng.read_metadata(f)
+    assert (_meta.width, _meta.height, _meta.mode, _meta.bitdepth) == (40, 30, mode, bitdepth)
+    assert (_meta.z_min, _meta.z_max, _meta.z_units) == (-5., (39 + 29) * 1.7 - 5, "K")
+    assert (_meta.x_min, _meta.x_max, _meta.x_units) == (-3, 4.5, None)
+    assert type(_meta.x_min) is int
+    assert _meta.colormap == (None if mode == "L" else "viridis")
+    assert _meta.y_ascend_up is False
+    # A list of files, and a file pointer
+    assert matrixpng.read_metadata([f, f]) == [_meta, _meta]
+    with open(f, 'rb') as fp:
+        assert matrixpng.read_metadata(fp) == _meta
+
+
+@pytest.mark.parametrize("y_ascend_up", [True, False])
+def test_read_old_format(y_ascend_up):
+    a = _matrix()
+    b = io.BytesIO()
+    _p = matrixpng.MatrixPNG(y_ascend_up=y_ascend_up, z_units="m", x_max=10.5)
+    _p.matrix2png(a, b)
+    _scale = dict(_p._scale)
+    c = _old_format(b, _scale, y_ascend_up=y_ascend_up)
+    assert METADATA_TAG not in [t for t, _ in png.Reader(bytes=c).chunks()]
+    _meta = matrixpng.read_metadata(io.BytesIO(c))
+    assert (_meta.width, _meta.height, _meta.mode, _meta.bitdepth) == (40, 30, "RGB", 8)
+    for k in SCALE_KEYS:
+        assert getattr(_meta, k) == _scale[k]
+    assert _meta.colormap == "ebb"
+    assert _meta.y_ascend_up is y_ascend_up
+    # The old file reads as the new one does
+    r = matrixpng.MatrixPNG().png2matrix(io.BytesIO(c))
+    _new = matrixpng.MatrixPNG().png2matrix(io.BytesIO(b.getvalue()))
+    np.testing.assert_array_equal(r["matrix"], _new["matrix"])
+    for k in SCALE_KEYS + ["y_ascend_up", "colormap"]:
+        assert r[k] == _new[k]
+
+
+def test_read_old_format_values():
+    # Text that isn't a number is kept as text
+    b = io.BytesIO()
+    matrixpng.MatrixPNG().matrix2png(_matrix(), b)
+    c = _old_format(b, {"z_min": "-5", "z_max": "1e2", "x_units": "None", "y_units": "12 m"})
+    _meta = matrixpng.read_metadata(io.BytesIO(c))
+    assert (_meta.z_min, _meta.z_max, _meta.x_units, _meta.y_units) == (-5, 100., None, "12 m")
+    assert type(_meta.z_min) is int
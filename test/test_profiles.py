@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""Tests for the compression profiles, the filter trial, and autotune()
+
+The canonical source for this package is https://github.com/finitemobius/matrixpng-py"""
+
+import io
+import zlib
+import png
+import pytest
+import numpy as np
+import matrixpng
+from matrixpng._profiles import PROFILES, pick_filter, trial_encode
+
+__author__ = "Finite Mobius, LLC"
+__credits__ = ["Jason R. Miller"]
+__license__ = "MIT"
+__version__ = "alpha"
+__maintainer__ = "Finite Mobius, LLC"
+__email__ = "jason@finitemobius.com"
+__status__ = "Development"
+
+
+def _smooth(width=300, height=200):
+    """A smooth surface with a little noise, x axis first"""
+    x, y = np.meshgrid(np.linspace(0, 3, width), np.linspace(0, 2, height), indexing="ij")
+    return np.sin(x) * np.cos(y) + np.random.default_rng(0).normal(0, 0.002, x.shape)
+
+
+def _size(profile, a, **kwargs):
+    """Bytes written with a profile"""
+    b = io.BytesIO()
+    matrixpng.MatrixPNG(profile=profile, **kwargs).matrix2png(a, b)
+    return len(b.getvalue())
+
+
+def _filter_types(b):
+    """The filter type of each row of a PNG"""
+    _width, _height, _rows, _info = png.Reader(bytes=b).read()
+    _data = zlib.decompress(b''.join(d for t, d in png.Reader(bytes=b).chunks() if t == b'IDAT'))
+    _line = len(_data) // _height
+    return set(_data[::_line])
+
+
+def test_profile_settings():
+    for p in PROFILES.keys():
+        _p = matrixpng.MatrixPNG(profile=p)
+        assert (_p._png["level"], _p._png["strategy"], _p.filter) == \
+            (PROFILES[p]["level"], PROFILES[p]["strategy"], PROFILES[p]["filter"])
+        # The filter can be chosen apart from the profile
+        assert matrixpng.MatrixPNG(profile=p, filter="sub").filter == "sub"
+    with pytest.raises(ValueError):
+        matrixpng.MatrixPNG(profile="tiny")
+    with pytest.raises(ValueError):
+        matrixpng.MatrixPNG(filter="best")
+
+
+@pytest.mark.parametrize("mode,bitdepth", [("RGB", 8), ("RGB", 16), ("L", 16), ("P", 8)])
+def test_profile_order(mode, bitdepth):
+    # The archive profile compresses the most
+    # (Its filter is picked on a sample of the image, so it may miss the best one by a little)
+    a = _smooth()
+    _fast, _balanced, _archive = [_size(p, a, mode=mode, bitdepth=bitdepth)
+                                  for p in ("fast", "balanced", "archive")]
+    assert _archive <= _fast
+    assert _archive <= _balanced * 1.02
+
+
+def test_pick_filter():
+    _rng = np.random.default_rng(0)
+    _jitter = _rng.integers(0, 3, (64, 300), dtype=np.uint8)
+    # Rows that vary a little from one to the next: each byte is best predicted by the one above
+    _rows = _rng.integers(0, 250, (1, 300), dtype=np.uint8) + _jitter
+    assert pick_filter([_rows, _rows[::-1]], 3) in ("up", "paeth", "adaptive")
+    # Rows that vary a little along their length: each byte is best predicted by the one to the left
+    _cols = _rng.integers(0, 250, (64, 1), dtype=np.uint8) + _jitter
+    assert pick_filter([_cols], 3) in ("sub", "paeth", "adaptive")
+    # Noise can't be predicted
+    assert pick_filter([_rng.integers(0, 256, (64, 300), dtype=np.uint8)], 3) in ("none", "adaptive")
+
+
+def test_trial_filter():
+    # The file is written with the filter the trial picks
+    a = _smooth()
+    b = io.BytesIO()
+    _p = matrixpng.MatrixPNG(filter="trial")
+    _p.matrix2png(a, b)
+    _method = _p._filter_for(_p._sample_bands(a))
+    assert _filter_types(b.getvalue()) == {matrixpng.FILTERS[_method]} or _method == "adaptive"
+    assert len(b.getvalue()) <= min(_size("balanced", a, filter=f) for f in matrixpng.FILTERS) * 1.02
+
+
+def test_trial_encode():
+    _p = matrixpng.MatrixPNG()
+    _p._setminmax(_smooth())
+    _bands = _p._sample_bands(_smooth())
+    for p in PROFILES.keys():
+        _t = trial_encode(_bands, 3, p)
+        assert _t["bytes_in"] == sum(b.nbytes + len(b) for b in _bands)
+        assert 0 < _t["bytes_out"] < _t["bytes_in"]
+        assert _t["seconds"] >= 0
+
+
+def test_autotune():
+    a = _smooth(120, 80)
+    _p = matrixpng.MatrixPNG()
+    _best = _p.autotune(a)
+    assert _p.profile == _best
+    # Any speed will do, so the smallest output wins
+    assert matrixpng.MatrixPNG().autotune(a, min_throughput=0) == _best
+    # No speed or ratio can be met, so the closest profile is used
+    for kwargs in ({"min_throughput": 1e30}, {"max_ratio": 0}):
+        _p = matrixpng.MatrixPNG()
+        assert _p.autotune(a, **kwargs) in PROFILES.keys()
+    assert matrixpng.MatrixPNG().autotune(a, max_ratio=0) == _best
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""Tests for export_pyramid()
+
+The canonical source for this package is https://github.com/finitemobius/matrixpng-py"""
+
+import os
+import json
+import pytest
+import numpy as np
+import matrixpng
+from matrixpng._pyramid import reduce_block
+
+__author__ = "Finite Mobius, LLC"
+__credits__ = ["Jason R. Miller"]
+__license__ = "MIT"
+__version__ = "alpha"
+__maintainer__ = "Finite Mobius, LLC"
+__email__ = "jason@finitemobius.com"
+__status__ = "Development"
+
+
+def _matrix(width=150, height=90):
+    """A diagonal gradient, x axis first"""
+    return np.add.outer(np.arange(width, dtype=float), np.arange(height, dtype=float))
+
+
+def _assemble(directory, level, info, x_axis_first=True):
+    """Put the tiles of one level back together, x axis first"""
+    _rows = []
+    for row in range(info["rows"]):
+        _tiles = [matrixpng.MatrixPNG().pngfile2matrix(os.path.join(directory, str(level), str(c) + "_" + str(row) +
+                                                                    ".png"))
+                  for c in range(info["columns"])]
+        _rows.append(_tiles)
+    # Tiles are numbered from the top of the image
+    _columns = [np.concatenate([r[c]["matrix"] for r in _rows][::-1], axis=1) for c in range(info["columns"])]
+    return np.concatenate(_columns, axis=0), _rows
+
+
+def test_reduce_block():
+    a = np.array([[1., 2., 5.], [3., np.nan, 7.], [0., 0., np.nan]])
+    np.testing.assert_array_equal(reduce_block(a, "mean"), [[2., 6.], [0., np.nan]])
+    np.testing.assert_array_equal(reduce_block(a, "max"), [[3., 7.], [0., np.nan]])
+    np.testing.assert_array_equal(reduce_block(a, "nearest"), [[1., 5.], [0., np.nan]])
+    with pytest.raises(ValueError):
+        reduce_block(a, "median")
+
+
+@pytest.mark.parametrize("reduce", ["mean", "max", "nearest"])
+@pytest.mark.parametrize("workers", [1, 4])
+def test_pyramid(tmp_path, reduce, workers):
+    a = _matrix()
+    d = str(tmp_path)
+    _p = matrixpng.MatrixPNG(bitdepth=16, x_min=0, x_max=15, y_min=-9, y_max=0)
+    # A budget small enough that the reduced levels are written to disk
+    _pyramid = _p.export_pyramid(a, d, tile_size=32, reduce=reduce, workers=workers, memory_budget=2000,
+                                 tmpdir=str(tmp_path))
+    with open(os.path.join(d, "pyramid.json")) as fp:
+        assert json.load(fp) == json.loads(json.dumps(_pyramid))
+    assert [(v["width"], v["height"], v["columns"], v["rows"]) for v in _pyramid["levels"]] == \
+        [(150, 90, 5, 3), (75, 45, 3, 2), (38, 23, 2, 1), (19, 12, 1, 1)]
+    _delta = (a.max() - a.min()) / (2 ** 16 - 1)
+    _level = a
+    for info in _pyramid["levels"]:
+        _m, _tiles = _assemble(d, info["level"], info)
+        np.testing.assert_allclose(_m, _level, atol=4 * _delta)
+        # Every tile has the global z range, and its own extents
+        r = _tiles[0][0]
+        assert (r["z_min"], r["z_max"]) == (a.min(), a.max())
+        assert (r["x_min"], r["y_max"]) == (0, 0)
+        assert r["x_max"] == pytest.approx(15. * min(32 * 2 ** info["level"], 150) / 150)
+        _level = reduce_block(_level, reduce)
+    # The temporary levels are gone
+    assert sorted(os.listdir(d)) == ["0", "1", "2", "3", "pyramid.json"]
+
+
+def test_pyramid_orientation(tmp_path):
+    # The same tiles, however the matrix is laid out
+    a = _matrix()
+    _first = matrixpng.MatrixPNG(y_ascend_up=False).export_pyramid(a, str(tmp_path / "a"), tile_size=64)
+    _second = matrixpng.MatrixPNG(y_ascend_up=False).export_pyramid(a.T, str(tmp_path / "b"), tile_size=64,
+                                                                    x_axis_first=False)
+    assert _first["levels"] == _second["levels"]
+    for info in _first["levels"]:
+        for row in range(info["rows"]):
+            for c in range(info["columns"]):
+                _name = os.path.join(str(info["level"]), str(c) + "_" + str(row) + ".png")
+                with open(str(tmp_path / "a" / _name), 'rb') as fp, open(str(tmp_path / "b" / _name), 'rb') as fq:
+                    assert fp.read() == fq.read()
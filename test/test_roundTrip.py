@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""Round-trip tests for matrix2png() and png2matrix()
+
+The canonical source for this package is https://github.com/finitemobius/matrixpng-py"""
+
+import io
+import png
+import pytest
+import numpy as np
+import matrixpng
+from matrixpng._pngDecoder import read_image
+
+__author__ = "Finite Mobius, LLC"
+__credits__ = ["Jason R. Miller"]
+__license__ = "MIT"
+__version__ = "alpha"
+__maintainer__ = "Finite Mobius, LLC"
+__email__ = "jason@finitemobius.com"
+__status__ = "Development"
+
+# Every mode and the bit depths it can have
+MODES = [("L", 8), ("L", 16), ("LA", 8), ("LA", 16), ("RGB", 8), ("RGB", 16), ("RGBA", 8), ("RGBA", 16), ("P", 8)]
+FILTERS = ["none", "sub", "up", "average", "paeth", "adaptive", "trial"]
+
+
+def _matrix(width=53, height=31):
+    """A diagonal gradient with some noise, x axis first"""
+    a = np.add.outer(np.arange(width, dtype=float), np.arange(height, dtype=float))
+    return a + np.random.default_rng(0).uniform(0, 3, a.shape)
+
+
+def _samples(b):
+    """The samples of a PNG, as pypng reads them (rows x samples per row)"""
+    _width, _height, _rows, _ = png.Reader(bytes=b.getvalue()).read()
+    return np.array([np.asarray(r) for r in _rows])
+
+
+def _check(b, a, **kwargs):
+    """Check that both decoders read a PNG back as (nearly) the matrix written, and agree exactly
+
+    (png2matrix closes the file it reads, so each decoder gets its own copy)"""
+    _p = matrixpng.MatrixPNG(engine="numpy")
+    r = _p.png2matrix(io.BytesIO(b.getvalue()), **kwargs)
+    _q = matrixpng.MatrixPNG(engine="pypng").png2matrix(io.BytesIO(b.getvalue()), **kwargs)
+    np.testing.assert_array_equal(r["matrix"], _q["matrix"])
+    # Colors can repeat in a color map, so allow a few quantization steps
+    np.testing.assert_allclose(r["matrix"], a, atol=4 * _p.quantization_delta)
+    assert r["z_min"] == a.min() and r["z_max"] == a.max()
+    return r
+
+
+@pytest.mark.parametrize("mode,bitdepth", MODES)
+@pytest.mark.parametrize("method", FILTERS)
+def test_round_trip(mode, bitdepth, method):
+    a = _matrix()
+    b = io.BytesIO()
+    matrixpng.MatrixPNG(mode=mode, bitdepth=bitdepth, filter=method).matrix2png(a, b, memory_budget=2 ** 12)
+    _check(b, a)
+    # The numpy decoder gives exactly the samples pypng does
+    _image = read_image(io.BytesIO(b.getvalue()))
+    np.testing.assert_array_equal(_image.reshape(len(_image), -1), _samples(b))
+
+
+@pytest.mark.parametrize("mode,bitdepth", MODES)
+def test_round_trip_pypng(mode, bitdepth):
+    a = _matrix()
+    b = io.BytesIO()
+    matrixpng.MatrixPNG(mode=mode, bitdepth=bitdepth, engine="pypng").matrix2png(a, b)
+    _check(b, a)
+    # The same samples as the numpy engine
+    c = io.BytesIO()
+    matrixpng.MatrixPNG(mode=mode, bitdepth=bitdepth).matrix2png(a, c)
+    np.testing.assert_array_equal(_samples(b), _samples(c))
+
+
+@pytest.mark.parametrize("x_axis_first", [True, False])
+@pytest.mark.parametrize("y_ascend_up", [True, False])
+def test_orientation(x_axis_first, y_ascend_up):
+    a = _matrix()
+    if not x_axis_first:
+        a = a.T.copy()
+    b = io.BytesIO()
+    matrixpng.MatrixPNG(y_ascend_up=y_ascend_up).matrix2png(a, b, x_axis_first=x_axis_first)
+    r = _check(b, a, x_axis_first=x_axis_first)
+    assert r["y_ascend_up"] == y_ascend_up
+
+
+@pytest.mark.parametrize("profile", ["fast", "balanced", "archive"])
+def test_profiles(profile):
+    a = _matrix()
+    b = io.BytesIO()
+    matrixpng.MatrixPNG(bitdepth=16, profile=profile).matrix2png(a, b)
+    _check(b, a)
+
+
+def test_nan():
+    # NaN is written as gray (or the entry after the palette), and read back as NaN
+    # (Grayscale modes have no color to spare; NaN is written as black there)
+    a = _matrix()
+    a[3, 4] = np.nan
+    for mode, bitdepth in MODES:
+        if mode[0] == "L":
+            continue
+        b = io.BytesIO()
+        matrixpng.MatrixPNG(mode=mode, bitdepth=bitdepth).matrix2png(a, b)
+        r = matrixpng.MatrixPNG().png2matrix(io.BytesIO(b.getvalue()))
+        assert np.isnan(r["matrix"][3, 4])
+        assert np.isnan(r["matrix"]).sum() == 1
+
+
+@pytest.mark.parametrize("mode,bitdepth", MODES)
+@pytest.mark.parametrize("engine", ["numpy", "pypng"])
+def test_constant(mode, bitdepth, engine):
+    # A constant matrix has no range to scale; it reads back exactly
+    a = np.full((20, 10), 2.5)
+    a[3, 4] = np.nan
+    b = io.BytesIO()
+    matrixpng.MatrixPNG(mode=mode, bitdepth=bitdepth, engine=engine).matrix2png(a, b)
+    r = matrixpng.MatrixPNG().png2matrix(io.BytesIO(b.getvalue()))
+    assert (r["z_min"], r["z_max"]) == (2.5, 2.5)
+    if mode[0] == "L":
+        a[3, 4] = 2.5
+    np.testing.assert_array_equal(r["matrix"], a)
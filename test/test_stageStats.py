@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""Tests for StageStats
+
+The canonical source for this package is https://github.com/finitemobius/matrixpng-py"""
+
+import io
+import time
+import threading
+import tracemalloc
+import pytest
+import numpy as np
+import matrixpng
+from matrixpng._stageStats import FIELDS, stage
+
+__author__ = "Finite Mobius, LLC"
+__credits__ = ["Jason R. Miller"]
+__license__ = "MIT"
+__version__ = "alpha"
+__maintainer__ = "Finite Mobius, LLC"
+__email__ = "jason@finitemobius.com"
+__status__ = "Development"
+
+
+def _matrix(width=200, height=150):
+    """A matrix of noise, x axis first"""
+    return np.random.default_rng(0).normal(0, 1, (width, height))
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_encode_stages(workers):
+    a = _matrix()
+    b = io.BytesIO()
+    _calls = []
+    _stats = matrixpng.StageStats(callback=lambda name, counts: _calls.append((name, dict(counts))))
+    matrixpng.MatrixPNG(workers=workers).matrix2png(a, b, stats=_stats)
+    _d = _stats.as_dict()
+    assert set(_d.keys()) == {"range", "read", "color", "encode"}
+    for k in ("range", "read", "color"):
+        assert _d[k]["pixels"] == a.size
+    assert _d["encode"]["calls"] == 1
+    assert _d["encode"]["bytes_out"] == len(b.getvalue())
+    assert _d["read"]["bytes_out"] == a.nbytes
+    # The callback sees every run, and the runs add up to the totals
+    assert len(_calls) == sum(v["calls"] for v in _d.values())
+    for k, v in _d.items():
+        for f in ("calls", "bytes_in", "bytes_out", "pixels"):
+            assert sum(c[f] for n, c in _calls if n == k) == v[f]
+        assert sum(c["seconds"] for n, c in _calls if n == k) == pytest.approx(v["seconds"])
+    # Nothing is traced unless asked for
+    assert all(v["peak_memory"] == 0 for v in _d.values())
+
+
+def test_decode_stages():
+    b = io.BytesIO()
+    matrixpng.MatrixPNG(exact="residual").matrix2png(_matrix(), b)
+    _stats = matrixpng.StageStats()
+    r = matrixpng.MatrixPNG().png2matrix(io.BytesIO(b.getvalue()), exact=True, stats=_stats)
+    _d = _stats.as_dict()
+    assert set(_d.keys()) == {"read", "metadata", "decode", "color", "exact", "orient"}
+    assert all(v["calls"] == 1 for v in _d.values())
+    assert _d["read"]["bytes_out"] == _d["decode"]["bytes_in"] == len(b.getvalue())
+    assert _d["orient"]["bytes_out"] == r["matrix"].nbytes
+    # The counters add up over calls, until reset
+    matrixpng.decode(io.BytesIO(b.getvalue()), stats=_stats)
+    assert _stats.as_dict()["decode"]["calls"] == 2
+    assert _stats.as_dict()["exact"]["calls"] == 1
+    _stats.reset()
+    assert _stats.as_dict() == {}
+
+
+def test_nested_stages():
+    # A stage's time doesn't include the stages inside it
+    _stats = matrixpng.StageStats()
+    with _stats.stage("outer"):
+        time.sleep(0.02)
+        with _stats.stage("inner") as _s:
+            time.sleep(0.1)
+            _s.add(bytes_in=1, bytes_out=2, pixels=3)
+    _d = _stats.as_dict()
+    assert _d["inner"]["seconds"] >= 0.1
+    assert 0.02 <= _d["outer"]["seconds"] < 0.1
+    assert (_d["inner"]["bytes_in"], _d["inner"]["bytes_out"], _d["inner"]["pixels"]) == (1, 2, 3)
+    assert list(_d["outer"].keys()) == FIELDS
+    # Stages on other threads aren't inside this one
+    def _other():
+        with _stats.stage("other"):
+            time.sleep(0.1)
+    _stats.reset()
+    _t = threading.Thread(target=_other)
+    with _stats.stage("outer"):
+        _t.start()
+        _t.join()
+    _d = _stats.as_dict()
+    assert _d["other"]["seconds"] >= 0.1
+    assert _d["outer"]["seconds"] >= 0.1
+
+
+def test_no_stats():
+    # Without a StageStats, stages do nothing
+    with stage(None, "read", bytes_in=10) as _s:
+        _s.add(bytes_out=10)
+    assert "StageStats({})" == repr(matrixpng.StageStats())
+
+
+def test_trace_memory():
+    _was_tracing = tracemalloc.is_tracing()
+    _stats = matrixpng.StageStats(trace_memory=True)
+    try:
+        assert tracemalloc.is_tracing()
+        with _stats.stage("outer"):
+            with _stats.stage("inner"):
+                _big = bytearray(8 << 20)
+                del _big
+            _small = bytearray(1 << 20)
+            del _small
+        _d = _stats.as_dict()
+        assert _d["inner"]["peak_memory"] >= 8 << 20
+        # The outer stage's peak includes what was allocated inside it
+        assert _d["outer"]["peak_memory"] >= 8 << 20
+        b = io.BytesIO()
+        matrixpng.MatrixPNG().matrix2png(_matrix(), b, stats=_stats)
+        assert _stats.as_dict()["color"]["peak_memory"] > 0
+    finally:
+        if not _was_tracing:
+            tracemalloc.stop()